@@ -5,20 +5,25 @@ import json
 import traceback
 from datetime import datetime, timezone
 import uuid
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
+from collections import OrderedDict
+import copy
+import time
 import jwt
 from pydantic import BaseModel
 import tempfile
 import os
 
 from agentpress.thread_manager import ThreadManager
+from agentpress.message_cache import invalidate_thread_messages
 from services.supabase import DBConnection
 from services import redis
+from services.stream_hub import stream_hub, get_terminal_status
 from utils.auth_utils import get_current_user_id_from_jwt, get_user_id_from_stream_auth, verify_thread_access, verify_admin_api_key
 from utils.logger import logger, structlog
 from services.billing import check_billing_status, can_use_model
 from utils.config import config
-from sandbox.sandbox import create_sandbox, delete_sandbox, get_or_start_sandbox
+from sandbox.sandbox import create_sandbox, delete_sandbox
 from services.llm import make_llm_api_call
 from run_agent_background import run_agent_background, _cleanup_redis_response_list, update_agent_run_status
 from utils.constants import MODEL_NAME_ALIASES
@@ -42,6 +47,11 @@ instance_id = None # Global instance ID for this backend instance
 # TTL for Redis response lists (24 hours)
 REDIS_RESPONSE_LIST_TTL = 3600 * 24
 
+# Agent versions resolved for start_agent, keyed by (version_id, user_id)
+AGENT_VERSION_CACHE_TTL = 300
+AGENT_VERSION_CACHE_SIZE = 1000
+_agent_version_cache: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
 
 
 class AgentStartRequest(BaseModel):
@@ -211,6 +221,9 @@ async def cleanup():
     except Exception as e:
         logger.error(f"Failed to clean up running agent runs: {str(e)}")
 
+    # Stop the stream hub before its Redis connection goes away
+    await stream_hub.close()
+
     # Close Redis connection
     await redis.close()
     logger.info("Completed cleanup of agent API resources")
@@ -287,6 +300,79 @@ async def get_agent_run_with_access_check(client, agent_run_id: str, user_id: st
     return agent_run_data
 
 
+async def _timed(timings: Dict[str, float], step: str, awaitable):
+    """Await one step of an endpoint and record its duration in milliseconds."""
+    start = time.monotonic()
+    try:
+        return await awaitable
+    finally:
+        timings[step] = (time.monotonic() - start) * 1000
+
+async def _get_agent_version_data(agent_data: Dict[str, Any], user_id: str) -> Optional[Dict[str, Any]]:
+    """Get the current version of an agent as a dict, cached per version and user."""
+    version_id = agent_data.get('current_version_id')
+    if not version_id:
+        return None
+
+    cache_key = (version_id, user_id)
+    cached = _agent_version_cache.get(cache_key)
+    if cached and time.monotonic() - cached[0] < AGENT_VERSION_CACHE_TTL:
+        _agent_version_cache.move_to_end(cache_key)
+        return copy.deepcopy(cached[1])
+
+    version_service = await _get_version_service()
+    version_obj = await version_service.get_version(
+        agent_id=agent_data['agent_id'],
+        version_id=version_id,
+        user_id=user_id
+    )
+    version_data = version_obj.to_dict()
+
+    _agent_version_cache[cache_key] = (time.monotonic(), version_data)
+    _agent_version_cache.move_to_end(cache_key)
+    if len(_agent_version_cache) > AGENT_VERSION_CACHE_SIZE:
+        _agent_version_cache.popitem(last=False)
+    return copy.deepcopy(version_data)
+
+async def _load_agent_config(client, agent_id: Optional[str], account_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    """Resolve the config of the requested agent, or of the account's default agent."""
+    logger.info(f"[AGENT LOAD] Agent loading flow:")
+    logger.info(f"  - agent_id: {agent_id}")
+
+    if agent_id:
+        logger.info(f"[AGENT LOAD] Querying for agent: {agent_id}")
+        agent_result = await client.table('agents').select('*').eq('agent_id', agent_id).eq('account_id', account_id).execute()
+        logger.info(f"[AGENT LOAD] Query result: found {len(agent_result.data) if agent_result.data else 0} agents")
+        if not agent_result.data:
+            raise HTTPException(status_code=404, detail="Agent not found or access denied")
+        default_agent = False
+    else:
+        logger.info(f"[AGENT LOAD] No agent_id, querying for default agent")
+        agent_result = await client.table('agents').select('*').eq('account_id', account_id).eq('is_default', True).execute()
+        logger.info(f"[AGENT LOAD] Default agent query result: found {len(agent_result.data) if agent_result.data else 0} default agents")
+        if not agent_result.data:
+            logger.warning(f"[AGENT LOAD] No default agent found for account {account_id}")
+            return None
+        default_agent = True
+
+    agent_data = agent_result.data[0]
+    version_data = None
+    try:
+        version_data = await _get_agent_version_data(agent_data, user_id)
+        if version_data:
+            logger.info(f"[AGENT LOAD] Got version data from version manager: {version_data.get('version_name')}")
+    except Exception as e:
+        logger.warning(f"[AGENT LOAD] Failed to get version data: {e}")
+
+    agent_config = extract_agent_config(agent_data, version_data)
+
+    agent_label = "default agent" if default_agent else "agent"
+    if version_data:
+        logger.info(f"Using {agent_label} {agent_config['name']} ({agent_config['agent_id']}) version {agent_config.get('version_name', 'v1')}")
+    else:
+        logger.info(f"Using {agent_label} {agent_config['name']} ({agent_config['agent_id']}) - no version data")
+    return agent_config
+
 @router.post("/thread/{thread_id}/agent/start")
 async def start_agent(
     thread_id: str,
@@ -318,9 +404,11 @@ async def start_agent(
 
     logger.info(f"Starting new agent for thread: {thread_id} with config: model={model_name}, thinking={body.enable_thinking}, effort={body.reasoning_effort}, stream={body.stream}, context_manager={body.enable_context_manager} (Instance: {instance_id})")
     client = await db.client
+    timings: Dict[str, float] = {}
+    preflight_start = time.monotonic()
 
-    await verify_thread_access(client, thread_id, user_id)
-    thread_result = await client.table('threads').select('project_id', 'account_id', 'metadata').eq('thread_id', thread_id).execute()
+    # Fetch the thread once
+    thread_result = await _timed(timings, 'thread', client.table('threads').select('*').eq('thread_id', thread_id).execute())
     if not thread_result.data:
         raise HTTPException(status_code=404, detail="Thread not found")
     thread_data = thread_result.data[0]
@@ -340,119 +428,43 @@ async def start_agent(
     
     if is_agent_builder:
         logger.info(f"Thread {thread_id} is in agent builder mode, target_agent_id: {target_agent_id}")
-    
-    # Load agent configuration with version support
-    agent_config = None
-    effective_agent_id = body.agent_id  # Optional agent ID from request
-    
-    logger.info(f"[AGENT LOAD] Agent loading flow:")
-    logger.info(f"  - body.agent_id: {body.agent_id}")
-    logger.info(f"  - effective_agent_id: {effective_agent_id}")
-    
-    if effective_agent_id:
-        logger.info(f"[AGENT LOAD] Querying for agent: {effective_agent_id}")
-        # Get agent
-        agent_result = await client.table('agents').select('*').eq('agent_id', effective_agent_id).eq('account_id', account_id).execute()
-        logger.info(f"[AGENT LOAD] Query result: found {len(agent_result.data) if agent_result.data else 0} agents")
-        
-        if not agent_result.data:
-            if body.agent_id:
-                raise HTTPException(status_code=404, detail="Agent not found or access denied")
-            else:
-                logger.warning(f"Stored agent_id {effective_agent_id} not found, falling back to default")
-                effective_agent_id = None
-        else:
-            agent_data = agent_result.data[0]
-            version_data = None
-            if agent_data.get('current_version_id'):
-                try:
-                    version_service = await _get_version_service()
-                    version_obj = await version_service.get_version(
-                        agent_id=effective_agent_id,
-                        version_id=agent_data['current_version_id'],
-                        user_id=user_id
-                    )
-                    version_data = version_obj.to_dict()
-                    logger.info(f"[AGENT LOAD] Got version data from version manager: {version_data.get('version_name')}")
-                except Exception as e:
-                    logger.warning(f"[AGENT LOAD] Failed to get version data: {e}")
-            
-            logger.info(f"[AGENT LOAD] About to call extract_agent_config with agent_data keys: {list(agent_data.keys())}")
-            logger.info(f"[AGENT LOAD] version_data type: {type(version_data)}, has data: {version_data is not None}")
-            
-            agent_config = extract_agent_config(agent_data, version_data)
-            
-            if version_data:
-                logger.info(f"Using agent {agent_config['name']} ({effective_agent_id}) version {agent_config.get('version_name', 'v1')}")
-            else:
-                logger.info(f"Using agent {agent_config['name']} ({effective_agent_id}) - no version data")
-            source = "request" if body.agent_id else "fallback"
-    else:
-        logger.info(f"[AGENT LOAD] No effective_agent_id, will try default agent")
-    
-    if not agent_config:
-        logger.info(f"[AGENT LOAD] No agent config yet, querying for default agent")
-        default_agent_result = await client.table('agents').select('*').eq('account_id', account_id).eq('is_default', True).execute()
-        logger.info(f"[AGENT LOAD] Default agent query result: found {len(default_agent_result.data) if default_agent_result.data else 0} default agents")
-        
-        if default_agent_result.data:
-            agent_data = default_agent_result.data[0]
-            
-            # Use versioning system to get current version
-            version_data = None
-            if agent_data.get('current_version_id'):
-                try:
-                    version_service = await _get_version_service()
-                    version_obj = await version_service.get_version(
-                        agent_id=agent_data['agent_id'],
-                        version_id=agent_data['current_version_id'],
-                        user_id=user_id
-                    )
-                    version_data = version_obj.to_dict()
-                    logger.info(f"[AGENT LOAD] Got default agent version from version manager: {version_data.get('version_name')}")
-                except Exception as e:
-                    logger.warning(f"[AGENT LOAD] Failed to get default agent version data: {e}")
-            
-            logger.info(f"[AGENT LOAD] About to call extract_agent_config for DEFAULT agent with version data: {version_data is not None}")
-            
-            agent_config = extract_agent_config(agent_data, version_data)
-            
-            if version_data:
-                logger.info(f"Using default agent: {agent_config['name']} ({agent_config['agent_id']}) version {agent_config.get('version_name', 'v1')}")
-            else:
-                logger.info(f"Using default agent: {agent_config['name']} ({agent_config['agent_id']}) - no version data")
-        else:
-            logger.warning(f"[AGENT LOAD] No default agent found for account {account_id}")
-    
+
+    # Check access first, the other lookups act on the thread owner's account
+    await _timed(timings, 'access', verify_thread_access(client, thread_id, user_id))
+
+    # Run the independent preflight lookups concurrently, then fail in the order the checks are listed
+    agent_config_result, model_result, billing_result, project_result = await asyncio.gather(
+        _timed(timings, 'agent_config', _load_agent_config(client, body.agent_id, account_id, user_id)),
+        _timed(timings, 'model_access', can_use_model(client, account_id, model_name)),
+        _timed(timings, 'billing', check_billing_status(client, account_id)),
+        _timed(timings, 'project', client.table('projects').select('*').eq('project_id', project_id).execute()),
+        return_exceptions=True
+    )
+    for result in (agent_config_result, model_result, billing_result):
+        if isinstance(result, BaseException):
+            raise result
+
+    agent_config = agent_config_result
     logger.info(f"[AGENT LOAD] Final agent_config: {agent_config is not None}")
     if agent_config:
         logger.info(f"[AGENT LOAD] Agent config keys: {list(agent_config.keys())}")
         logger.info(f"Using agent {agent_config['agent_id']} for this agent run (thread remains agent-agnostic)")
 
-    can_use, model_message, allowed_models = await can_use_model(client, account_id, model_name)
+    can_use, model_message, allowed_models = model_result
     if not can_use:
         raise HTTPException(status_code=403, detail={"message": model_message, "allowed_models": allowed_models})
 
-    can_run, message, subscription = await check_billing_status(client, account_id)
+    can_run, message, subscription = billing_result
     if not can_run:
         raise HTTPException(status_code=402, detail={"message": message, "subscription": subscription})
 
-    try:
-        project_result = await client.table('projects').select('*').eq('project_id', project_id).execute()
-        if not project_result.data:
-            raise HTTPException(status_code=404, detail="Project not found")
-        
-        project_data = project_result.data[0]
-        sandbox_info = project_data.get('sandbox', {})
-        if not sandbox_info.get('id'):
-            raise HTTPException(status_code=404, detail="No sandbox found for this project")
-            
-        sandbox_id = sandbox_info['id']
-        sandbox = await get_or_start_sandbox(sandbox_id)
-        logger.info(f"Successfully started sandbox {sandbox_id} for project {project_id}")
-    except Exception as e:
-        logger.error(f"Failed to start sandbox for project {project_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to initialize sandbox: {str(e)}")
+    # The sandbox is woken up by the worker, which reports progress on the run's stream
+    if isinstance(project_result, BaseException):
+        raise project_result
+    if not project_result.data:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if not (project_result.data[0].get('sandbox') or {}).get('id'):
+        raise HTTPException(status_code=404, detail="No sandbox found for this project")
 
     agent_run = await client.table('agent_runs').insert({
         "thread_id": thread_id, "status": "running",
@@ -471,6 +483,8 @@ async def start_agent(
         agent_run_id=agent_run_id,
     )
     logger.info(f"Created new agent run: {agent_run_id}")
+    timings['total'] = (time.monotonic() - preflight_start) * 1000
+    logger.info(f"start_agent latency breakdown (ms): {', '.join(f'{step}={ms:.0f}' for step, ms in timings.items())}")
 
     # Register this run in Redis with TTL using instance ID
     instance_key = f"active_run:{instance_id}:{agent_run_id}"
@@ -690,7 +704,7 @@ async def stream_agent_run(
     token: Optional[str] = None,
     request: Request = None
 ):
-    """Stream the responses of an agent run using Redis Lists and Pub/Sub."""
+    """Stream the responses of an agent run using Redis Lists and the process-wide stream hub."""
     logger.info(f"Starting stream for agent run: {agent_run_id}")
     client = await db.client
 
@@ -702,32 +716,26 @@ async def stream_agent_run(
         user_id=user_id,
     )
 
-    response_list_key = f"agent_run:{agent_run_id}:responses"
-    response_channel = f"agent_run:{agent_run_id}:new_response"
-    control_channel = f"agent_run:{agent_run_id}:control" # Global control channel
-
     async def stream_generator():
-        logger.debug(f"Streaming responses for {agent_run_id} using Redis list {response_list_key} and channel {response_channel}")
-        last_processed_index = -1
-        pubsub_response = None
-        pubsub_control = None
-        listener_task = None
+        logger.debug(f"Streaming responses for {agent_run_id} via the stream hub")
+        subscription = None
         terminate_stream = False
         initial_yield_complete = False
 
         try:
-            # 1. Fetch and yield initial responses from Redis list
-            initial_responses_json = await redis.lrange(response_list_key, 0, -1)
-            initial_responses = []
+            # 1. Subscribe before reading, so responses stored after the initial read are announced
+            subscription = await stream_hub.subscribe(agent_run_id)
+
+            # 2. Fetch and yield initial responses from Redis list
+            # Stored responses are already JSON, so they are written to the SSE frame as-is
+            initial_responses_json = await subscription.get_new_responses()
             if initial_responses_json:
-                initial_responses = [json.loads(r) for r in initial_responses_json]
-                logger.debug(f"Sending {len(initial_responses)} initial responses for {agent_run_id}")
-                for response in initial_responses:
-                    yield f"data: {json.dumps(response)}\n\n"
-                last_processed_index = len(initial_responses) - 1
+                logger.debug(f"Sending {len(initial_responses_json)} initial responses for {agent_run_id}")
+                for response_json in initial_responses_json:
+                    yield f"data: {response_json}\n\n"
             initial_yield_complete = True
 
-            # 2. Check run status *after* yielding initial data
+            # 3. Check run status *after* yielding initial data
             run_status = await client.table('agent_runs').select('status', 'thread_id').eq("id", agent_run_id).maybe_single().execute()
             current_status = run_status.data.get('status') if run_status.data else None
 
@@ -735,106 +743,32 @@ async def stream_agent_run(
                 logger.info(f"Agent run {agent_run_id} is not running (status: {current_status}). Ending stream.")
                 yield f"data: {json.dumps({'type': 'status', 'status': 'completed'})}\n\n"
                 return
-          
+
             structlog.contextvars.bind_contextvars(
                 thread_id=run_status.data.get('thread_id'),
             )
 
-            # 3. Set up Pub/Sub listeners for new responses and control signals
-            pubsub_response = await redis.create_pubsub()
-            await pubsub_response.subscribe(response_channel)
-            logger.debug(f"Subscribed to response channel: {response_channel}")
-
-            pubsub_control = await redis.create_pubsub()
-            await pubsub_control.subscribe(control_channel)
-            logger.debug(f"Subscribed to control channel: {control_channel}")
-
-            # Queue to communicate between listeners and the main generator loop
-            message_queue = asyncio.Queue()
-
-            async def listen_messages():
-                response_reader = pubsub_response.listen()
-                control_reader = pubsub_control.listen()
-                tasks = [asyncio.create_task(response_reader.__anext__()), asyncio.create_task(control_reader.__anext__())]
-
-                while not terminate_stream:
-                    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
-                    for task in done:
-                        try:
-                            message = task.result()
-                            if message and isinstance(message, dict) and message.get("type") == "message":
-                                channel = message.get("channel")
-                                data = message.get("data")
-                                if isinstance(data, bytes): data = data.decode('utf-8')
-
-                                if channel == response_channel and data == "new":
-                                    await message_queue.put({"type": "new_response"})
-                                elif channel == control_channel and data in ["STOP", "END_STREAM", "ERROR"]:
-                                    logger.info(f"Received control signal '{data}' for {agent_run_id}")
-                                    await message_queue.put({"type": "control", "data": data})
-                                    return # Stop listening on control signal
-
-                        except StopAsyncIteration:
-                            logger.warning(f"Listener {task} stopped.")
-                            # Decide how to handle listener stopping, maybe terminate?
-                            await message_queue.put({"type": "error", "data": "Listener stopped unexpectedly"})
-                            return
-                        except Exception as e:
-                            logger.error(f"Error in listener for {agent_run_id}: {e}")
-                            await message_queue.put({"type": "error", "data": "Listener failed"})
-                            return
-                        finally:
-                            # Reschedule the completed listener task
-                            if task in tasks:
-                                tasks.remove(task)
-                                if message and isinstance(message, dict) and message.get("channel") == response_channel:
-                                     tasks.append(asyncio.create_task(response_reader.__anext__()))
-                                elif message and isinstance(message, dict) and message.get("channel") == control_channel:
-                                     tasks.append(asyncio.create_task(control_reader.__anext__()))
-
-                # Cancel pending listener tasks on exit
-                for p_task in pending: p_task.cancel()
-                for task in tasks: task.cancel()
-
-
-            listener_task = asyncio.create_task(listen_messages())
-
-            # 4. Main loop to process messages from the queue
+            # 4. Main loop: wait for notifications from the hub and send what is new
             while not terminate_stream:
                 try:
-                    queue_item = await message_queue.get()
-
-                    if queue_item["type"] == "new_response":
-                        # Fetch new responses from Redis list starting after the last processed index
-                        new_start_index = last_processed_index + 1
-                        new_responses_json = await redis.lrange(response_list_key, new_start_index, -1)
-
-                        if new_responses_json:
-                            new_responses = [json.loads(r) for r in new_responses_json]
-                            num_new = len(new_responses)
-                            # logger.debug(f"Received {num_new} new responses for {agent_run_id} (index {new_start_index} onwards)")
-                            for response in new_responses:
-                                yield f"data: {json.dumps(response)}\n\n"
-                                # Check if this response signals completion
-                                if response.get('type') == 'status' and response.get('status') in ['completed', 'failed', 'stopped']:
-                                    logger.info(f"Detected run completion via status message in stream: {response.get('status')}")
-                                    terminate_stream = True
-                                    break # Stop processing further new responses
-                            last_processed_index += num_new
-                        if terminate_stream: break
-
-                    elif queue_item["type"] == "control":
-                        control_signal = queue_item["data"]
+                    control_signal = await subscription.wait()
+
+                    new_responses_json = await subscription.get_new_responses()
+                    for response_json in new_responses_json:
+                        yield f"data: {response_json}\n\n"
+                        # Check if this response signals completion
+                        terminal_status = get_terminal_status(response_json)
+                        if terminal_status:
+                            logger.info(f"Detected run completion via status message in stream: {terminal_status}")
+                            terminate_stream = True
+                            break # Stop processing further new responses
+                    if terminate_stream: break
+
+                    if control_signal:
                         terminate_stream = True # Stop the stream on any control signal
                         yield f"data: {json.dumps({'type': 'status', 'status': control_signal})}\n\n"
                         break
 
-                    elif queue_item["type"] == "error":
-                        logger.error(f"Listener error for {agent_run_id}: {queue_item['data']}")
-                        terminate_stream = True
-                        yield f"data: {json.dumps({'type': 'status', 'status': 'error'})}\n\n"
-                        break
-
                 except asyncio.CancelledError:
                      logger.info(f"Stream generator main loop cancelled for {agent_run_id}")
                      terminate_stream = True
@@ -851,23 +785,8 @@ async def stream_agent_run(
             if not initial_yield_complete:
                  yield f"data: {json.dumps({'type': 'status', 'status': 'error', 'message': f'Failed to start stream: {e}'})}\n\n"
         finally:
-            terminate_stream = True
-            # Graceful shutdown order: unsubscribe → close → cancel
-            if pubsub_response: await pubsub_response.unsubscribe(response_channel)
-            if pubsub_control: await pubsub_control.unsubscribe(control_channel)
-            if pubsub_response: await pubsub_response.close()
-            if pubsub_control: await pubsub_control.close()
-
-            if listener_task:
-                listener_task.cancel()
-                try:
-                    await listener_task  # Reap inner tasks & swallow their errors
-                except asyncio.CancelledError:
-                    pass
-                except Exception as e:
-                    logger.debug(f"listener_task ended with: {e}")
-            # Wait briefly for tasks to cancel
-            await asyncio.sleep(0.1)
+            if subscription:
+                subscription.close()
             logger.debug(f"Streaming cleanup complete for agent run: {agent_run_id}")
 
     return StreamingResponse(stream_generator(), media_type="text/event-stream", headers={
@@ -3157,6 +3076,7 @@ async def delete_message(
     try:
         # Don't allow users to delete the "status" messages
         await client.table('messages').delete().eq('message_id', message_id).eq('is_llm_message', True).eq('thread_id', thread_id).execute()
+        await invalidate_thread_messages(thread_id)
         return {"message": "Message deleted successfully"}
     except Exception as e:
         logger.error(f"Error deleting message {message_id} from thread {thread_id}: {str(e)}")
@@ -1,7 +1,8 @@
 import os
 import json
 import asyncio
-from typing import Optional, Dict, List, Any, AsyncGenerator
+from functools import lru_cache
+from typing import Optional, Dict, List, Any, AsyncGenerator, Tuple
 from dataclasses import dataclass
 
 from agent.tools.message_tool import MessageTool
@@ -23,7 +24,7 @@ from agent.prompt import get_system_prompt
 from agent.custom_prompt import render_prompt_template
 from utils.logger import logger
 from utils.auth_utils import get_account_id_from_thread
-from services.billing import check_billing_status
+from services.billing import check_billing_budget, record_monthly_usage
 from agent.tools.sb_vision_tool import SandboxVisionTool
 from agent.tools.sb_image_edit_tool import SandboxImageEditTool
 from services.langfuse import langfuse
@@ -125,9 +126,10 @@ class ToolManager:
 
 
 class MCPManager:
-    def __init__(self, thread_manager: ThreadManager, account_id: str):
+    def __init__(self, thread_manager: ThreadManager, account_id: str, trace: Optional[StatefulTraceClient] = None):
         self.thread_manager = thread_manager
         self.account_id = account_id
+        self.trace = trace
     
     async def register_mcp_tools(self, agent_config: dict) -> Optional[MCPToolWrapper]:
         all_mcps = []
@@ -173,17 +175,14 @@ class MCPManager:
         if not all_mcps:
             return None
         
-        mcp_wrapper_instance = MCPToolWrapper(mcp_configs=all_mcps)
+        mcp_wrapper_instance = MCPToolWrapper(mcp_configs=all_mcps, trace=self.trace)
         try:
             await mcp_wrapper_instance.initialize_and_register_tools()
             
             updated_schemas = mcp_wrapper_instance.get_schemas()
             for method_name, schema_list in updated_schemas.items():
                 for schema in schema_list:
-                    self.thread_manager.tool_registry.tools[method_name] = {
-                        "instance": mcp_wrapper_instance,
-                        "schema": schema
-                    }
+                    self.thread_manager.tool_registry.register_function(method_name, mcp_wrapper_instance, schema)
             
             return mcp_wrapper_instance
         except Exception as e:
@@ -192,6 +191,13 @@ class MCPManager:
 
 
 class PromptManager:
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def _get_sample_response() -> str:
+        sample_response_path = os.path.join(os.path.dirname(__file__), 'sample_responses/1.txt')
+        with open(sample_response_path, 'r') as file:
+            return file.read()
+
     @staticmethod
     async def build_system_prompt(model_name: str, agent_config: Optional[dict], 
                                   is_agent_builder: bool, thread_id: str, 
@@ -203,9 +209,7 @@ class PromptManager:
             default_system_content = get_system_prompt()
         
         if "anthropic" not in model_name.lower():
-            sample_response_path = os.path.join(os.path.dirname(__file__), 'sample_responses/1.txt')
-            with open(sample_response_path, 'r') as file:
-                sample_response = file.read()
+            sample_response = PromptManager._get_sample_response()
             default_system_content = default_system_content + "\n\n <sample_assistant_response>" + sample_response + "</sample_assistant_response>"
         
         if is_agent_builder:
@@ -217,20 +221,13 @@ class PromptManager:
         
         if await is_enabled("knowledge_base"):
             try:
-                from services.supabase import DBConnection
-                kb_db = DBConnection()
-                kb_client = await kb_db.client
+                from knowledge_base.context_cache import get_combined_knowledge_base_context
                 
                 current_agent_id = agent_config.get('agent_id') if agent_config else None
                 
-                kb_result = await kb_client.rpc('get_combined_knowledge_base_context', {
-                    'p_thread_id': thread_id,
-                    'p_agent_id': current_agent_id,
-                    'p_max_tokens': 4000
-                }).execute()
-                
-                if kb_result.data and kb_result.data.strip():
-                    system_content += "\n\n" + kb_result.data
+                kb_context = await get_combined_knowledge_base_context(thread_id, current_agent_id)
+                if kb_context:
+                    system_content += "\n\n" + kb_context
                         
             except Exception as e:
                 logger.error(f"Error retrieving knowledge base context for thread {thread_id}: {e}")
@@ -290,10 +287,19 @@ class MessageManager:
         self.model_name = model_name
         self.trace = trace
     
-    async def build_temporary_message(self) -> Optional[dict]:
+    async def prepare_temporary_message(self) -> Tuple[Optional[dict], Optional[str]]:
+        """Build the temporary message without side effects.
+
+        Returns the message and the ID of the image context message it includes,
+        which must be consumed with consume_image_context once the message is used.
+        """
         temp_message_content_list = []
+        image_context_message_id = None
 
-        latest_browser_state_msg = await self.client.table('messages').select('*').eq('thread_id', self.thread_id).eq('type', 'browser_state').order('created_at', desc=True).limit(1).execute()
+        latest_browser_state_msg, latest_image_context_msg = await asyncio.gather(
+            self.client.table('messages').select('*').eq('thread_id', self.thread_id).eq('type', 'browser_state').order('created_at', desc=True).limit(1).execute(),
+            self.client.table('messages').select('*').eq('thread_id', self.thread_id).eq('type', 'image_context').order('created_at', desc=True).limit(1).execute()
+        )
         if latest_browser_state_msg.data and len(latest_browser_state_msg.data) > 0:
             try:
                 browser_content = latest_browser_state_msg.data[0]["content"]
@@ -332,7 +338,6 @@ class MessageManager:
             except Exception as e:
                 logger.error(f"Error parsing browser state: {e}")
 
-        latest_image_context_msg = await self.client.table('messages').select('*').eq('thread_id', self.thread_id).eq('type', 'image_context').order('created_at', desc=True).limit(1).execute()
         if latest_image_context_msg.data and len(latest_image_context_msg.data) > 0:
             try:
                 image_context_content = latest_image_context_msg.data[0]["content"] if isinstance(latest_image_context_msg.data[0]["content"], dict) else json.loads(latest_image_context_msg.data[0]["content"])
@@ -352,19 +357,67 @@ class MessageManager:
                         }
                     })
 
-                await self.client.table('messages').delete().eq('message_id', latest_image_context_msg.data[0]["message_id"]).execute()
+                image_context_message_id = latest_image_context_msg.data[0]["message_id"]
             except Exception as e:
                 logger.error(f"Error parsing image context: {e}")
 
         if temp_message_content_list:
-            return {"role": "user", "content": temp_message_content_list}
-        return None
+            return {"role": "user", "content": temp_message_content_list}, image_context_message_id
+        return None, image_context_message_id
+
+    async def consume_image_context(self, message_id: str):
+        """Delete an image context message once it has been shown to the LLM."""
+        try:
+            await self.client.table('messages').delete().eq('message_id', message_id).execute()
+        except Exception as e:
+            logger.error(f"Error deleting image context message {message_id}: {e}")
+
+
+class BillingGuard:
+    """Runs the billing check only when the remaining budget may not cover the next turns.
+
+    After a full check, the remaining budget is drawn down by an estimate of the
+    cost of one turn. The estimate starts at DEFAULT_TURN_COST and is raised to
+    the spend observed between full checks.
+    """
+
+    DEFAULT_TURN_COST = 1.0  # dollars
+    HEADROOM_TURNS = 3
+
+    def __init__(self, client, account_id: str):
+        self.client = client
+        self.account_id = account_id
+        self.turn_cost_estimate = self.DEFAULT_TURN_COST
+        self._budget_at_check: Optional[float] = None
+        self._turns_since_check = 0
+
+    async def check(self) -> Tuple[bool, str]:
+        if self._budget_at_check is not None:
+            self._turns_since_check += 1
+            estimated_remaining = self._budget_at_check - self._turns_since_check * self.turn_cost_estimate
+            if estimated_remaining > self.HEADROOM_TURNS * self.turn_cost_estimate:
+                return True, "OK"
+
+        can_run, message, _, remaining_budget = await check_billing_budget(self.client, self.account_id)
+
+        if remaining_budget is not None and self._budget_at_check is not None and self._turns_since_check > 0:
+            observed_turn_cost = (self._budget_at_check - remaining_budget) / self._turns_since_check
+            self.turn_cost_estimate = max(self.DEFAULT_TURN_COST, observed_turn_cost)
+
+        self._budget_at_check = remaining_budget if can_run else None
+        self._turns_since_check = 0
+        return can_run, message
 
 
 class AgentRunner:
     def __init__(self, config: AgentConfig):
         self.config = config
     
+    async def _on_message_added(self, thread_id: str, message: Dict[str, Any]) -> None:
+        if message.get('type') == 'assistant_response_end':
+            # Keep the monthly usage ledger current so billing checks don't rescan usage messages
+            await record_monthly_usage(await self.thread_manager.db.client, thread_id, message.get('content'))
+    
     async def setup(self):
         if not self.config.trace:
             self.config.trace = langfuse.trace(name="run_agent", session_id=self.config.thread_id, metadata={"project_id": self.config.project_id})
@@ -373,7 +426,8 @@ class AgentRunner:
             trace=self.config.trace, 
             is_agent_builder=self.config.is_agent_builder or False, 
             target_agent_id=self.config.target_agent_id, 
-            agent_config=self.config.agent_config
+            agent_config=self.config.agent_config,
+            on_message_added=self._on_message_added
         )
         
         self.client = await self.thread_manager.db.client
@@ -423,7 +477,7 @@ class AgentRunner:
         if not self.config.agent_config:
             return None
         
-        mcp_manager = MCPManager(self.thread_manager, self.account_id)
+        mcp_manager = MCPManager(self.thread_manager, self.account_id, self.config.trace)
         return await mcp_manager.register_mcp_tools(self.config.agent_config)
     
     def get_max_tokens(self) -> Optional[int]:
@@ -460,11 +514,18 @@ class AgentRunner:
                 self.config.trace.update(input=data['content'])
 
         message_manager = MessageManager(self.client, self.config.thread_id, self.config.model_name, self.config.trace)
+        billing_guard = BillingGuard(self.client, self.account_id)
 
         while continue_execution and iteration_count < self.config.max_iterations:
             iteration_count += 1
 
-            can_run, message, subscription = await check_billing_status(self.client, self.account_id)
+            # Pre-iteration checks are independent, so run them concurrently
+            (can_run, message), latest_message, (temporary_message, image_context_message_id) = await asyncio.gather(
+                billing_guard.check(),
+                self.client.table('messages').select('*').eq('thread_id', self.config.thread_id).in_('type', ['assistant', 'tool', 'user']).order('created_at', desc=True).limit(1).execute(),
+                message_manager.prepare_temporary_message()
+            )
+
             if not can_run:
                 error_msg = f"Billing limit reached: {message}"
                 yield {
@@ -474,14 +535,15 @@ class AgentRunner:
                 }
                 break
 
-            latest_message = await self.client.table('messages').select('*').eq('thread_id', self.config.thread_id).in_('type', ['assistant', 'tool', 'user']).order('created_at', desc=True).limit(1).execute()
             if latest_message.data and len(latest_message.data) > 0:
                 message_type = latest_message.data[0].get('type')
                 if message_type == 'assistant':
                     continue_execution = False
                     break
 
-            temporary_message = await message_manager.build_temporary_message()
+            # The image context is only consumed once this iteration actually calls the LLM
+            if image_context_message_id:
+                await message_manager.consume_image_context(image_context_message_id)
             max_tokens = self.get_max_tokens()
             
             generation = self.config.trace.generation(name="thread_manager.run_thread") if self.config.trace else None
@@ -519,7 +581,7 @@ class AgentRunner:
                 last_tool_call = None
                 agent_should_terminate = False
                 error_detected = False
-                full_response = ""
+                full_response_parts = []
 
                 try:
                     if hasattr(response, '__aiter__') and not isinstance(response, dict):
@@ -559,8 +621,8 @@ class AgentRunner:
                                         assistant_content_json = content
 
                                     assistant_text = assistant_content_json.get('content', '')
-                                    full_response += assistant_text
                                     if isinstance(assistant_text, str):
+                                        full_response_parts.append(assistant_text)
                                         if '</ask>' in assistant_text or '</complete>' in assistant_text or '</web-browser-takeover>' in assistant_text:
                                            if '</ask>' in assistant_text:
                                                xml_tool = 'ask'
@@ -580,6 +642,7 @@ class AgentRunner:
                     else:
                         error_detected = True
 
+                    full_response = ''.join(full_response_parts)
                     if error_detected:
                         if generation:
                             generation.end(output=full_response, status_message="error_detected", level="ERROR")
@@ -592,6 +655,7 @@ class AgentRunner:
 
                 except Exception as e:
                     error_msg = f"Error during response streaming: {str(e)}"
+                    full_response = ''.join(full_response_parts)
                     if generation:
                         generation.end(output=full_response, status_message=error_msg, level="ERROR")
                     yield {
@@ -1,4 +1,6 @@
+from functools import partial
 from typing import Any, Dict, List, Optional
+from langfuse.client import StatefulTraceClient
 from agentpress.tool import Tool, ToolResult, ToolSchema, SchemaType
 from mcp_module import mcp_service
 from utils.logger import logger
@@ -7,12 +9,14 @@ from agent.tools.utils.mcp_connection_manager import MCPConnectionManager
 from agent.tools.utils.custom_mcp_handler import CustomMCPHandler
 from agent.tools.utils.dynamic_tool_builder import DynamicToolBuilder
 from agent.tools.utils.mcp_tool_executor import MCPToolExecutor
+from agent.tools.utils.mcp_discovery import discover_servers
 
 
 class MCPToolWrapper(Tool):
-    def __init__(self, mcp_configs: Optional[List[Dict[str, Any]]] = None):
+    def __init__(self, mcp_configs: Optional[List[Dict[str, Any]]] = None, trace: Optional[StatefulTraceClient] = None):
         self.mcp_manager = mcp_service
         self.mcp_configs = mcp_configs or []
+        self.trace = trace
         self._initialized = False
         self._schemas: Dict[str, List[ToolSchema]] = {}
         self._dynamic_tools = {}
@@ -32,23 +36,19 @@ class MCPToolWrapper(Tool):
             self._initialized = True
     
     async def _initialize_servers(self):
-        standard_configs = [cfg for cfg in self.mcp_configs if not cfg.get('isCustom', False)]
-        custom_configs = [cfg for cfg in self.mcp_configs if cfg.get('isCustom', False)]
+        discoveries = []
+        for config in self.mcp_configs:
+            if config.get('isCustom', False):
+                discoveries.append((config.get('name', 'Unknown'), partial(self.custom_handler.initialize_custom_mcp, config)))
+            else:
+                discoveries.append((config['qualifiedName'], partial(self._initialize_standard_server, config)))
         
-        if standard_configs:
-            await self._initialize_standard_servers(standard_configs)
-        
-        if custom_configs:
-            await self.custom_handler.initialize_custom_mcps(custom_configs)
+        await discover_servers(discoveries, trace=self.trace)
             
-    async def _initialize_standard_servers(self, standard_configs: List[Dict[str, Any]]):
-        for config in standard_configs:
-            try:
-                logger.info(f"Attempting to connect to MCP server: {config['qualifiedName']}")
-                await self.mcp_manager.connect_server(config)
-                logger.info(f"Successfully connected to MCP server: {config['qualifiedName']}")
-            except Exception as e:
-                logger.error(f"Failed to connect to MCP server {config['qualifiedName']}: {e}")
+    async def _initialize_standard_server(self, config: Dict[str, Any]):
+        logger.info(f"Attempting to connect to MCP server: {config['qualifiedName']}")
+        await self.mcp_manager.connect_server(config)
+        logger.info(f"Successfully connected to MCP server: {config['qualifiedName']}")
     
     async def _create_dynamic_tools(self):
         try:
@@ -2,13 +2,33 @@ import traceback
 import json
 import base64
 import io
+import asyncio
+from typing import Optional, Tuple
+
+import aiohttp
 from PIL import Image
 
 from agentpress.tool import ToolResult, openapi_schema, usage_example
 from agentpress.thread_manager import ThreadManager
 from sandbox.tool_base import SandboxToolsBase
 from utils.logger import logger
-from utils.s3_upload_utils import upload_base64_image
+from utils.s3_upload_utils import upload_image_bytes
+
+BROWSER_API_PORT = 8003
+BROWSER_API_TIMEOUT = aiohttp.ClientTimeout(total=90, connect=10)
+
+# Keep-alive session shared by the browser tools of the process
+_http_session: Optional[aiohttp.ClientSession] = None
+_http_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_http_session() -> aiohttp.ClientSession:
+    global _http_session, _http_session_loop
+    loop = asyncio.get_running_loop()
+    if _http_session is None or _http_session.closed or _http_session_loop is not loop:
+        _http_session = aiohttp.ClientSession(timeout=BROWSER_API_TIMEOUT)
+        _http_session_loop = loop
+    return _http_session
 
 
 class SandboxBrowserTool(SandboxToolsBase):
@@ -17,6 +37,8 @@ class SandboxBrowserTool(SandboxToolsBase):
     def __init__(self, project_id: str, thread_id: str, thread_manager: ThreadManager):
         super().__init__(project_id, thread_manager)
         self.thread_id = thread_id
+        self._browser_api_url = None
+        self._browser_api_headers = {}
 
     def _validate_base64_image(self, base64_string: str, max_size_mb: int = 10) -> tuple[bool, str]:
         """
@@ -57,6 +79,24 @@ class SandboxBrowserTool(SandboxToolsBase):
             except Exception as e:
                 return False, f"Base64 decoding failed: {str(e)}"
             
+            return self._validate_image_data(image_data, max_size_mb)
+            
+        except Exception as e:
+            logger.error(f"Unexpected error during base64 image validation: {e}")
+            return False, f"Validation error: {str(e)}"
+
+    def _validate_image_data(self, image_data: bytes, max_size_mb: int = 10) -> tuple[bool, str]:
+        """
+        Validate decoded image data.
+        
+        Args:
+            image_data (bytes): The raw image data
+            max_size_mb (int): Maximum allowed image size in megabytes
+            
+        Returns:
+            tuple[bool, str]: (is_valid, error_message)
+        """
+        try:
             # Check decoded data size
             if len(image_data) == 0:
                 return False, "Decoded image data is empty"
@@ -100,118 +140,156 @@ class SandboxBrowserTool(SandboxToolsBase):
             return True, "Valid image"
             
         except Exception as e:
-            logger.error(f"Unexpected error during base64 image validation: {e}")
+            logger.error(f"Unexpected error during image validation: {e}")
             return False, f"Validation error: {str(e)}"
 
-    async def _execute_browser_action(self, endpoint: str, params: dict = None, method: str = "POST") -> ToolResult:
+    async def _ensure_browser_api(self) -> str:
+        """Get the URL of the sandbox's browser automation API, resolving its preview link once."""
+        if self._browser_api_url is None:
+            await self._ensure_sandbox()
+            preview_link = await self.sandbox.get_preview_link(BROWSER_API_PORT)
+            url = preview_link.url if hasattr(preview_link, 'url') else str(preview_link)
+            token = getattr(preview_link, 'token', None)
+            self._browser_api_headers = {"x-daytona-preview-token": token} if token else {}
+            self._browser_api_url = url.rstrip('/')
+        return self._browser_api_url
+
+    async def _request_browser_action(self, endpoint: str, params: dict = None, method: str = "POST", ocr: bool = False) -> Tuple[dict, Optional[bytes], Optional[str]]:
+        """Call the browser automation API and read its result.
+        
+        The screenshot is requested as a binary multipart part; sandboxes running an
+        older browser API answer with plain JSON and a base64 screenshot instead.
+        OCR of the screenshot is only run by the browser API if `ocr` is set.
+        
+        Returns:
+            Tuple[dict, Optional[bytes], Optional[str]]: (result, screenshot, screenshot validation error)
+        """
+        url = f"{await self._ensure_browser_api()}/api/automation/{endpoint}"
+        query = {"ocr": "true" if ocr else "false"}
+        headers = {**self._browser_api_headers, "Accept": "multipart/mixed, application/json"}
+        
+        logger.debug(f"Browser automation request: {method} {url} {params}")
+        
+        session = _get_http_session()
+        async with session.request(
+            method,
+            url,
+            params={**(params or {}), **query} if method == "GET" else query,
+            json=params if method != "GET" else None,
+            headers=headers
+        ) as response:
+            if response.status >= 400:
+                raise RuntimeError(f"Browser API returned {response.status}: {(await response.text())[:1000]}")
+            
+            if response.content_type == "multipart/mixed":
+                result, screenshot = {}, None
+                reader = aiohttp.MultipartReader.from_response(response)
+                while (part := await reader.next()) is not None:
+                    if part.headers.get(aiohttp.hdrs.CONTENT_TYPE, "").startswith("image/"):
+                        screenshot = bytes(await part.read())
+                    else:
+                        result = await part.json()
+                return result, screenshot, None
+            
+            result = await response.json(content_type=None)
+        
+        screenshot_data = result.pop("screenshot_base64", None)
+        if not screenshot_data:
+            return result, None, None
+        is_valid, validation_message = self._validate_base64_image(screenshot_data)
+        if not is_valid:
+            return result, None, validation_message
+        return result, base64.b64decode(screenshot_data), None
+
+    async def _execute_browser_action(self, endpoint: str, params: dict = None, method: str = "POST", ocr: bool = False) -> ToolResult:
         """Execute a browser automation action through the API
         
         Args:
             endpoint (str): The API endpoint to call
             params (dict, optional): Parameters to send. Defaults to None.
             method (str, optional): HTTP method to use. Defaults to "POST".
+            ocr (bool, optional): Whether to OCR the screenshot of the result, set by actions
+                that bring new page content into view. Defaults to False.
             
         Returns:
             ToolResult: Result of the execution
         """
         try:
-            # Ensure sandbox is initialized
-            await self._ensure_sandbox()
-            
-            # Build the curl command
-            url = f"http://localhost:8003/api/automation/{endpoint}"
-            
-            if method == "GET" and params:
-                query_params = "&".join([f"{k}={v}" for k, v in params.items()])
-                url = f"{url}?{query_params}"
-                curl_cmd = f"curl -s -X {method} '{url}' -H 'Content-Type: application/json'"
-            else:
-                curl_cmd = f"curl -s -X {method} '{url}' -H 'Content-Type: application/json'"
-                if params:
-                    json_data = json.dumps(params)
-                    curl_cmd += f" -d '{json_data}'"
-            
-            logger.debug("\033[95mExecuting curl command:\033[0m")
-            logger.debug(f"{curl_cmd}")
-            
-            response = await self.sandbox.process.exec(curl_cmd, timeout=30)
+            try:
+                result, screenshot, validation_error = await self._request_browser_action(endpoint, params, method, ocr)
+            except (aiohttp.ContentTypeError, json.JSONDecodeError) as e:
+                logger.error(f"Failed to parse browser automation response: {e}")
+                return self.fail_response(f"Failed to parse response JSON: {e}")
+            except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError) as e:
+                logger.error(f"Browser automation request failed: {e!r}")
+                return self.fail_response(f"Browser automation request failed: {e!r}")
+
+            if not "content" in result:
+                result["content"] = ""
             
-            if response.exit_code == 0:
-                try:
-                    result = json.loads(response.result)
+            if not "role" in result:
+                result["role"] = "assistant"
 
-                    if not "content" in result:
-                        result["content"] = ""
+            logger.info("Browser automation request completed successfully")
+
+            if validation_error:
+                logger.warning(f"Screenshot validation failed: {validation_error}")
+                result["image_validation_error"] = validation_error
+            elif screenshot is not None:
+                try:
+                    # Comprehensive validation of the image data
+                    is_valid, validation_message = self._validate_image_data(screenshot)
                     
-                    if not "role" in result:
-                        result["role"] = "assistant"
-
-                    logger.info("Browser automation request completed successfully")
-
-                    if "screenshot_base64" in result:
-                        try:
-                            # Comprehensive validation of the base64 image data
-                            screenshot_data = result["screenshot_base64"]
-                            is_valid, validation_message = self._validate_base64_image(screenshot_data)
-                            
-                            if is_valid:
-                                logger.debug(f"Screenshot validation passed: {validation_message}")
-                                image_url = await upload_base64_image(screenshot_data)
-                                result["image_url"] = image_url
-                                logger.debug(f"Uploaded screenshot to {image_url}")
-                            else:
-                                logger.warning(f"Screenshot validation failed: {validation_message}")
-                                result["image_validation_error"] = validation_message
-                                
-                            # Remove base64 data from result to keep it clean
-                            del result["screenshot_base64"]
-                            
-                        except Exception as e:
-                            logger.error(f"Failed to process screenshot: {e}")
-                            result["image_upload_error"] = str(e)
-
-                    added_message = await self.thread_manager.add_message(
-                        thread_id=self.thread_id,
-                        type="browser_state",
-                        content=result,
-                        is_llm_message=False
-                    )
-
-                    success_response = {}
-
-                    if result.get("success"):
-                        success_response["success"] = result["success"]
-                        success_response["message"] = result.get("message", "Browser action completed successfully")
-                    else:
-                        success_response["success"] = False
-                        success_response["message"] = result.get("message", "Browser action failed")
-
-                    if added_message and 'message_id' in added_message:
-                        success_response['message_id'] = added_message['message_id']
-                    if result.get("url"):
-                        success_response["url"] = result["url"]
-                    if result.get("title"):
-                        success_response["title"] = result["title"]
-                    if result.get("element_count"):
-                        success_response["elements_found"] = result["element_count"]
-                    if result.get("pixels_below"):
-                        success_response["scrollable_content"] = result["pixels_below"] > 0
-                    if result.get("ocr_text"):
-                        success_response["ocr_text"] = result["ocr_text"]
-                    if result.get("image_url"):
-                        success_response["image_url"] = result["image_url"]
-
-                    if success_response.get("success"):
-                        return self.success_response(success_response)
+                    if is_valid:
+                        logger.debug(f"Screenshot validation passed: {validation_message}")
+                        image_url = await upload_image_bytes(screenshot)
+                        result["image_url"] = image_url
+                        logger.debug(f"Uploaded screenshot to {image_url}")
                     else:
-                        return self.fail_response(success_response)
+                        logger.warning(f"Screenshot validation failed: {validation_message}")
+                        result["image_validation_error"] = validation_message
+                        
+                except Exception as e:
+                    logger.error(f"Failed to process screenshot: {e}")
+                    result["image_upload_error"] = str(e)
+
+            added_message = await self.thread_manager.add_message(
+                thread_id=self.thread_id,
+                type="browser_state",
+                content=result,
+                is_llm_message=False
+            )
+
+            success_response = {}
+
+            if result.get("success"):
+                success_response["success"] = result["success"]
+                success_response["message"] = result.get("message", "Browser action completed successfully")
+            else:
+                success_response["success"] = False
+                success_response["message"] = result.get("message", "Browser action failed")
+
+            if added_message and 'message_id' in added_message:
+                success_response['message_id'] = added_message['message_id']
+            if result.get("url"):
+                success_response["url"] = result["url"]
+            if result.get("title"):
+                success_response["title"] = result["title"]
+            if result.get("element_count"):
+                success_response["elements_found"] = result["element_count"]
+            if result.get("pixels_below"):
+                success_response["scrollable_content"] = result["pixels_below"] > 0
+            if result.get("ocr_text"):
+                success_response["ocr_text"] = result["ocr_text"]
+            if result.get("ocr_time_ms") is not None:
+                logger.debug(f"Browser OCR took {result['ocr_time_ms']}ms (cached: {result.get('ocr_cached')})")
+            if result.get("image_url"):
+                success_response["image_url"] = result["image_url"]
 
-                except json.JSONDecodeError as e:
-                    logger.error(f"Failed to parse response JSON: {response.result} {e}")
-                    return self.fail_response(f"Failed to parse response JSON: {response.result} {e}")
+            if success_response.get("success"):
+                return self.success_response(success_response)
             else:
-                logger.error(f"Browser automation request failed 2: {response}")
-                return self.fail_response(f"Browser automation request failed 2: {response}")
+                return self.fail_response(success_response)
 
         except Exception as e:
             logger.error(f"Error executing browser action: {e}")
@@ -252,7 +330,7 @@ class SandboxBrowserTool(SandboxToolsBase):
         Returns:
             dict: Result of the execution
         """
-        return await self._execute_browser_action("navigate_to", {"url": url})
+        return await self._execute_browser_action("navigate_to", {"url": url}, ocr=True)
 
     # @openapi_schema({
     #     "type": "function",
@@ -318,7 +396,7 @@ class SandboxBrowserTool(SandboxToolsBase):
             dict: Result of the execution
         """
         logger.debug(f"\033[95mNavigating back in browser history\033[0m")
-        return await self._execute_browser_action("go_back", {})
+        return await self._execute_browser_action("go_back", {}, ocr=True)
 
     @openapi_schema({
         "type": "function",
@@ -503,7 +581,7 @@ class SandboxBrowserTool(SandboxToolsBase):
             dict: Result of the execution
         """
         logger.debug(f"\033[95mSwitching to tab: {page_id}\033[0m")
-        return await self._execute_browser_action("switch_tab", {"page_id": page_id})
+        return await self._execute_browser_action("switch_tab", {"page_id": page_id}, ocr=True)
 
     # @openapi_schema({
     #     "type": "function",
@@ -679,7 +757,7 @@ class SandboxBrowserTool(SandboxToolsBase):
         else:
             logger.debug(f"\033[95mScrolling down one page\033[0m")
         
-        return await self._execute_browser_action("scroll_down", params)
+        return await self._execute_browser_action("scroll_down", params, ocr=True)
 
     @openapi_schema({
         "type": "function",
@@ -720,7 +798,7 @@ class SandboxBrowserTool(SandboxToolsBase):
         else:
             logger.debug(f"\033[95mScrolling up one page\033[0m")
         
-        return await self._execute_browser_action("scroll_up", params)
+        return await self._execute_browser_action("scroll_up", params, ocr=True)
 
     @openapi_schema({
         "type": "function",
@@ -756,7 +834,7 @@ class SandboxBrowserTool(SandboxToolsBase):
             dict: Result of the execution
         """
         logger.debug(f"\033[95mScrolling to text: {text}\033[0m")
-        return await self._execute_browser_action("scroll_to_text", {"text": text})
+        return await self._execute_browser_action("scroll_to_text", {"text": text}, ocr=True)
 
     @openapi_schema({
         "type": "function",
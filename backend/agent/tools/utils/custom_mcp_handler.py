@@ -1,5 +1,6 @@
 import json
 import asyncio
+from functools import partial
 from typing import Dict, Any, List
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.sse import sse_client
@@ -7,6 +8,8 @@ from mcp.client.stdio import stdio_client
 from mcp.client.streamable_http import streamablehttp_client
 from utils.logger import logger
 from .mcp_connection_manager import MCPConnectionManager
+from .mcp_discovery import discover_servers
+from .mcp_tool_catalog import get_tool_catalog, make_catalog_key
 
 
 class CustomMCPHandler:
@@ -15,16 +18,14 @@ class CustomMCPHandler:
         self.custom_tools: Dict[str, Dict[str, Any]] = {}
     
     async def initialize_custom_mcps(self, custom_configs: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
-        for config in custom_configs:
-            try:
-                await self._initialize_single_custom_mcp(config)
-            except Exception as e:
-                logger.error(f"Failed to initialize custom MCP {config.get('name', 'Unknown')}: {e}")
-                continue
+        await discover_servers([
+            (config.get('name', 'Unknown'), partial(self.initialize_custom_mcp, config))
+            for config in custom_configs
+        ])
         
         return self.custom_tools
     
-    async def _initialize_single_custom_mcp(self, config: Dict[str, Any]):
+    async def initialize_custom_mcp(self, config: Dict[str, Any]):
         custom_type = config.get('customType', 'sse')
         server_config = config.get('config', {})
         enabled_tools = config.get('enabledTools', config.get('enabled_tools', []))
@@ -86,13 +87,25 @@ class CustomMCPHandler:
 
             url = "https://remote.mcp.pipedream.net"
             
-            async with streamablehttp_client(url, headers=headers) as (read_stream, write_stream, _):
-                async with ClientSession(read_stream, write_stream) as session:
-                    await session.initialize()
-                    tools_result = await session.list_tools()
-                    tools = tools_result.tools if hasattr(tools_result, 'tools') else tools_result
-                    
-                    self._register_custom_tools(tools, server_name, enabled_tools, 'pipedream', server_config)
+            async def list_tools() -> List[Dict[str, Any]]:
+                async with streamablehttp_client(url, headers=headers) as (read_stream, write_stream, _):
+                    async with ClientSession(read_stream, write_stream) as session:
+                        await session.initialize()
+                        tools_result = await session.list_tools()
+                        tools = tools_result.tools if hasattr(tools_result, 'tools') else tools_result
+                        return [
+                            {"name": tool.name, "description": tool.description, "input_schema": tool.inputSchema}
+                            for tool in tools
+                        ]
+            
+            # The access token rotates, so it is left out of the server identity
+            cache_key = make_catalog_key(
+                'pipedream', f"{url}#{app_slug}",
+                {"project_id": project_id, "environment": environment, "oauth_app_id": oauth_app_id},
+                external_user_id
+            )
+            catalog = await get_tool_catalog(cache_key, list_tools, server_name)
+            self._register_custom_tools_from_info(catalog, server_name, enabled_tools, 'pipedream', server_config)
                     
         except Exception as e:
             logger.error(f"Pipedream MCP {server_name}: Connection failed - {str(e)}")
@@ -103,36 +116,42 @@ class CustomMCPHandler:
             logger.error(f"Custom MCP {server_name}: Missing 'url' in config")
             return
         
-        server_info = await self.connection_manager.connect_sse_server(server_name, server_config)
-        if server_info.get('status') == 'connected':
-            tools_info = server_info.get('tools', [])
-            self._register_custom_tools_from_info(tools_info, server_name, enabled_tools, 'sse', server_config)
-        else:
-            logger.error(f"Failed to connect to custom MCP {server_name}")
+        catalog = await get_tool_catalog(
+            make_catalog_key('sse', server_config['url'], server_config.get('headers')),
+            partial(self._list_server_tools, self.connection_manager.connect_sse_server, server_name, server_config),
+            server_name
+        )
+        self._register_custom_tools_from_info(catalog, server_name, enabled_tools, 'sse', server_config)
     
     async def _initialize_http_mcp(self, server_name: str, server_config: Dict[str, Any], enabled_tools: List[str]):
         if 'url' not in server_config:
             logger.error(f"Custom MCP {server_name}: Missing 'url' in config")
             return
         
-        server_info = await self.connection_manager.connect_http_server(server_name, server_config)
-        if server_info.get('status') == 'connected':
-            tools_info = server_info.get('tools', [])
-            self._register_custom_tools_from_info(tools_info, server_name, enabled_tools, 'http', server_config)
-        else:
-            logger.error(f"Failed to connect to custom MCP {server_name}")
+        catalog = await get_tool_catalog(
+            make_catalog_key('http', server_config['url'], server_config.get('headers')),
+            partial(self._list_server_tools, self.connection_manager.connect_http_server, server_name, server_config),
+            server_name
+        )
+        self._register_custom_tools_from_info(catalog, server_name, enabled_tools, 'http', server_config)
     
     async def _initialize_json_mcp(self, server_name: str, server_config: Dict[str, Any], enabled_tools: List[str]):
         if 'command' not in server_config:
             logger.error(f"Custom MCP {server_name}: Missing 'command' in config")
             return
         
-        server_info = await self.connection_manager.connect_stdio_server(server_name, server_config)
-        if server_info.get('status') == 'connected':
-            tools_info = server_info.get('tools', [])
-            self._register_custom_tools_from_info(tools_info, server_name, enabled_tools, 'json', server_config)
-        else:
-            logger.error(f"Failed to connect to custom MCP {server_name}")
+        catalog = await get_tool_catalog(
+            make_catalog_key('stdio', server_config['command'], {'args': server_config.get('args', []), 'env': server_config.get('env', {})}),
+            partial(self._list_server_tools, self.connection_manager.connect_stdio_server, server_name, server_config),
+            server_name
+        )
+        self._register_custom_tools_from_info(catalog, server_name, enabled_tools, 'json', server_config)
+    
+    async def _list_server_tools(self, connect, server_name: str, server_config: Dict[str, Any]) -> List[Dict[str, Any]]:
+        server_info = await connect(server_name, server_config)
+        if server_info.get('status') != 'connected':
+            raise ConnectionError(f"Failed to connect to custom MCP {server_name}")
+        return server_info.get('tools', [])
     
     async def _resolve_external_user_id(self, server_config: Dict[str, Any]) -> str:
         profile_id = server_config.get('profile_id')
@@ -172,32 +191,10 @@ class CustomMCPHandler:
             logger.error(f"Failed to resolve profile {profile_id}: {str(e)}")
             return None
     
-    def _register_custom_tools(self, tools, server_name: str, enabled_tools: List[str], custom_type: str, server_config: Dict[str, Any]):
-        tools_registered = 0
-        
-        for tool in tools:
-            tool_name_from_server = tool.name
-            if not enabled_tools or tool_name_from_server in enabled_tools:
-                tool_name = f"custom_{server_name.replace(' ', '_').lower()}_{tool_name_from_server}"
-                self.custom_tools[tool_name] = {
-                    'name': tool_name,
-                    'description': tool.description,
-                    'parameters': tool.inputSchema,
-                    'server': server_name,
-                    'original_name': tool_name_from_server,
-                    'is_custom': True,
-                    'custom_type': custom_type,
-                    'custom_config': server_config
-                }
-                tools_registered += 1
-                logger.debug(f"Registered custom tool: {tool_name}")
-        
-        logger.info(f"Successfully initialized custom MCP {server_name} with {tools_registered} tools")
-    
-    def _register_custom_tools_from_info(self, tools_info: List[Dict[str, Any]], server_name: str, enabled_tools: List[str], custom_type: str, server_config: Dict[str, Any]):
+    def _register_custom_tools_from_info(self, catalog: Dict[str, Any], server_name: str, enabled_tools: List[str], custom_type: str, server_config: Dict[str, Any]):
         tools_registered = 0
         
-        for tool_info in tools_info:
+        for tool_info in catalog['tools']:
             tool_name_from_server = tool_info['name']
             if not enabled_tools or tool_name_from_server in enabled_tools:
                 tool_name = f"custom_{server_name.replace(' ', '_').lower()}_{tool_name_from_server}"
@@ -209,7 +206,8 @@ class CustomMCPHandler:
                     'original_name': tool_name_from_server,
                     'is_custom': True,
                     'custom_type': custom_type,
-                    'custom_config': server_config
+                    'custom_config': server_config,
+                    'catalog_fingerprint': catalog['fingerprint']
                 }
                 tools_registered += 1
                 logger.debug(f"Registered custom tool: {tool_name}")
@@ -1,7 +1,13 @@
-from typing import Dict, Any, List, Callable, Awaitable
+from collections import OrderedDict
+from typing import Dict, Any, List, Callable, Awaitable, Optional, Tuple
 from agentpress.tool import ToolResult, ToolSchema, SchemaType
 from utils.logger import logger
 
+SCHEMA_CACHE_SIZE = 5000
+
+# (tool_name, catalog fingerprint) -> schema; a tool's schema only changes with its server's catalog
+_schema_cache: "OrderedDict[Tuple[str, str], ToolSchema]" = OrderedDict()
+
 
 class DynamicToolBuilder:
     def __init__(self):
@@ -24,14 +30,14 @@ class DynamicToolBuilder:
                 "description": tool_info['description'],
                 "parameters": tool_info['parameters']
             }
-            method = self._create_dynamic_method(tool_name, openapi_tool_info, execute_callback)
+            method = self._create_dynamic_method(tool_name, openapi_tool_info, execute_callback, tool_info.get('catalog_fingerprint'))
             if method:
                 methods[method['method_name']] = method['method']
         
         logger.info(f"Created {len(methods)} dynamic MCP tool methods")
         return methods
     
-    def _create_dynamic_method(self, tool_name: str, tool_info: Dict[str, Any], execute_callback: Callable[[str, Dict[str, Any]], Awaitable[ToolResult]]) -> Dict[str, Any]:
+    def _create_dynamic_method(self, tool_name: str, tool_info: Dict[str, Any], execute_callback: Callable[[str, Dict[str, Any]], Awaitable[ToolResult]], catalog_fingerprint: Optional[str] = None) -> Dict[str, Any]:
         method_name, clean_tool_name, server_name = self._parse_tool_name(tool_name)
         
         logger.info(f"Creating dynamic method for tool '{tool_name}': clean_tool_name='{clean_tool_name}', method_name='{method_name}', server='{server_name}'")
@@ -42,8 +48,7 @@ class DynamicToolBuilder:
         dynamic_tool_method.__name__ = method_name
         dynamic_tool_method.__qualname__ = f"MCPToolWrapper.{method_name}"
         
-        description = self._build_description(tool_info, server_name)
-        schema = self._create_tool_schema(method_name, description, tool_info)
+        schema = self._get_tool_schema(tool_name, method_name, server_name, tool_info, catalog_fingerprint)
         
         dynamic_tool_method.tool_schemas = [schema]
         
@@ -85,6 +90,21 @@ class DynamicToolBuilder:
         base_description = tool_info.get("description", f"MCP tool from {server_name}")
         return f"{base_description} (MCP Server: {server_name})"
     
+    def _get_tool_schema(self, tool_name: str, method_name: str, server_name: str, tool_info: Dict[str, Any], catalog_fingerprint: Optional[str]) -> ToolSchema:
+        if catalog_fingerprint is None:
+            return self._create_tool_schema(method_name, self._build_description(tool_info, server_name), tool_info)
+        
+        cache_key = (tool_name, catalog_fingerprint)
+        schema = _schema_cache.get(cache_key)
+        if schema is None:
+            schema = self._create_tool_schema(method_name, self._build_description(tool_info, server_name), tool_info)
+            _schema_cache[cache_key] = schema
+            while len(_schema_cache) > SCHEMA_CACHE_SIZE:
+                _schema_cache.popitem(last=False)
+        else:
+            _schema_cache.move_to_end(cache_key)
+        return schema
+    
     def _create_tool_schema(self, method_name: str, description: str, tool_info: Dict[str, Any]) -> ToolSchema:
         openapi_function_schema = {
             "type": "function",
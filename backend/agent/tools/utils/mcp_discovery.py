@@ -0,0 +1,65 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langfuse.client import StatefulTraceClient
+from utils.logger import logger
+
+# At most this many servers are contacted at once
+MCP_DISCOVERY_CONCURRENCY = 8
+# Servers that have not answered by then are skipped, for all servers together
+MCP_DISCOVERY_DEADLINE = 20
+
+
+async def discover_servers(
+    discoveries: List[Tuple[str, Callable[[], Awaitable]]],
+    trace: Optional[StatefulTraceClient] = None,
+    concurrency: int = MCP_DISCOVERY_CONCURRENCY,
+    deadline: float = MCP_DISCOVERY_DEADLINE
+) -> Dict[str, str]:
+    """Run MCP server discoveries concurrently within a global deadline.
+
+    A server that fails or misses the deadline only loses its own tools; the
+    outcome and latency of each server is logged and recorded in the trace.
+
+    Returns:
+        The outcome of each server by name: connected, failed or deadline_exceeded
+    """
+    if not discoveries:
+        return {}
+
+    semaphore = asyncio.Semaphore(concurrency)
+    outcomes: Dict[str, str] = {}
+
+    async def discover(server_name: str, connect: Callable[[], Awaitable]) -> None:
+        async with semaphore:
+            span = trace.span(name="mcp_server_discovery", input={"server": server_name}) if trace else None
+            start_time = time.monotonic()
+            outcome, level, status_message = "connected", "DEFAULT", "connected"
+            try:
+                await connect()
+            except asyncio.CancelledError:
+                outcome, level, status_message = "deadline_exceeded", "WARNING", f"Discovery exceeded the {deadline}s deadline"
+                raise
+            except Exception as e:
+                outcome, level, status_message = "failed", "ERROR", str(e)
+                logger.error(f"Failed to connect to MCP server {server_name}: {e}")
+            finally:
+                latency_ms = round((time.monotonic() - start_time) * 1000)
+                outcomes[server_name] = outcome
+                logger.info(f"MCP server {server_name} discovery {outcome} in {latency_ms}ms")
+                if span:
+                    span.end(status_message=status_message, level=level, metadata={"server": server_name, "outcome": outcome, "latency_ms": latency_ms})
+
+    tasks = {asyncio.create_task(discover(name, connect)): name for name, connect in discoveries}
+    _, pending = await asyncio.wait(tasks, timeout=deadline)
+
+    for task in pending:
+        logger.warning(f"MCP server {tasks[task]} did not finish discovery within {deadline}s, skipping its tools")
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task in pending:
+            outcomes.setdefault(tasks[task], "deadline_exceeded")
+
+    return outcomes
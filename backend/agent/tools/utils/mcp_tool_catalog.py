@@ -0,0 +1,135 @@
+"""
+Redis-backed cache of MCP server tool catalogs.
+
+Listing the tools of an MCP server means opening a transport, running the
+`initialize` handshake and calling `list_tools()`, on every agent run, although
+catalogs rarely change. Catalogs are cached per server identity (transport,
+endpoint, hashed credentials and external user) and served stale-while-
+revalidate: a cached catalog is always returned immediately, and once it is
+older than `CATALOG_FRESH_TTL` one worker re-lists the server in the background.
+
+Each catalog carries a fingerprint of its normalized tool list, which changes
+only when a tool is added, removed or modified, so generated tool schemas can
+be reused for as long as the fingerprint stays the same.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from services import redis
+from utils.logger import logger
+
+CATALOG_KEY_PREFIX = "mcp_tool_catalog:"
+CATALOG_FRESH_TTL = 600  # 10 minutes
+CATALOG_MAX_AGE = 7 * 24 * 3600  # Unused catalogs expire from Redis after 7 days
+CATALOG_REFRESH_LOCK_TTL = 60
+
+# Returns the tools of the server as [{name, description, input_schema}]
+CatalogFetcher = Callable[[], Awaitable[List[Dict[str, Any]]]]
+
+_refresh_tasks: Set[asyncio.Task] = set()
+
+
+def make_catalog_key(transport: str, endpoint: str, headers: Optional[Dict[str, Any]] = None, external_user_id: Optional[str] = None) -> str:
+    """Redis key of a server's catalog; the identity is hashed so credentials are not kept in the key."""
+    identity = json.dumps([transport, endpoint, headers or {}, external_user_id], sort_keys=True, default=str)
+    return f"{CATALOG_KEY_PREFIX}{hashlib.sha256(identity.encode()).hexdigest()}"
+
+
+def normalize_tools(tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Tools in a stable order and shape, so equal catalogs get equal fingerprints."""
+    return sorted(
+        (
+            {
+                "name": tool["name"],
+                "description": tool.get("description") or "",
+                "input_schema": tool.get("input_schema") or {"type": "object", "properties": {}},
+            }
+            for tool in tools
+        ),
+        key=lambda tool: tool["name"],
+    )
+
+
+def fingerprint_tools(tools: List[Dict[str, Any]]) -> str:
+    return hashlib.sha256(json.dumps(tools, sort_keys=True, default=str).encode()).hexdigest()
+
+
+async def get_tool_catalog(cache_key: str, fetch: CatalogFetcher, server_name: str) -> Dict[str, Any]:
+    """Get the catalog of a server, listing its tools only if none is cached.
+
+    Returns:
+        {"tools": [{name, description, input_schema}], "fingerprint": str, "fetched_at": float}
+    """
+    catalog = await _read_catalog(cache_key)
+    if catalog is not None:
+        age = time.time() - catalog.get("fetched_at", 0)
+        if age > CATALOG_FRESH_TTL:
+            _schedule_refresh(cache_key, fetch, server_name, catalog["fingerprint"])
+        logger.debug(f"Using cached tool catalog of MCP server {server_name} ({len(catalog['tools'])} tools, {age:.0f}s old)")
+        return catalog
+
+    return await _fetch_and_store(cache_key, fetch)
+
+
+async def invalidate_tool_catalog(cache_key: str) -> None:
+    try:
+        await redis.delete(cache_key)
+    except Exception as e:
+        logger.warning(f"Failed to invalidate MCP tool catalog {cache_key}: {e}")
+
+
+async def _read_catalog(cache_key: str) -> Optional[Dict[str, Any]]:
+    try:
+        cached = await redis.get(cache_key)
+        if cached:
+            catalog = json.loads(cached)
+            if isinstance(catalog.get("tools"), list) and catalog.get("fingerprint"):
+                return catalog
+    except Exception as e:
+        logger.warning(f"Failed to read MCP tool catalog {cache_key}: {e}")
+    return None
+
+
+async def _fetch_and_store(cache_key: str, fetch: CatalogFetcher) -> Dict[str, Any]:
+    tools = normalize_tools(await fetch())
+    catalog = {"tools": tools, "fingerprint": fingerprint_tools(tools), "fetched_at": time.time()}
+    try:
+        await redis.set(cache_key, json.dumps(catalog), ex=CATALOG_MAX_AGE)
+    except Exception as e:
+        logger.warning(f"Failed to cache MCP tool catalog {cache_key}: {e}")
+    return catalog
+
+
+def _schedule_refresh(cache_key: str, fetch: CatalogFetcher, server_name: str, fingerprint: str) -> None:
+    task = asyncio.create_task(_refresh(cache_key, fetch, server_name, fingerprint))
+    # Keep a reference so the refresh is not garbage collected before it finishes
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+
+async def _refresh(cache_key: str, fetch: CatalogFetcher, server_name: str, fingerprint: str) -> None:
+    lock_key = f"{cache_key}:refreshing"
+    try:
+        # Only one worker re-lists a stale catalog
+        if not await redis.set(lock_key, "1", nx=True, ex=CATALOG_REFRESH_LOCK_TTL):
+            return
+    except Exception as e:
+        logger.warning(f"Failed to lock refresh of MCP tool catalog of {server_name}: {e}")
+        return
+
+    try:
+        catalog = await _fetch_and_store(cache_key, fetch)
+        if catalog["fingerprint"] != fingerprint:
+            logger.info(f"Tool catalog of MCP server {server_name} changed ({len(catalog['tools'])} tools)")
+    except Exception as e:
+        # Keep serving the stale catalog; the next run past the fresh TTL retries
+        logger.warning(f"Failed to refresh tool catalog of MCP server {server_name}: {e}")
+    finally:
+        try:
+            await redis.delete(lock_key)
+        except Exception as e:
+            logger.debug(f"Failed to release refresh lock of MCP tool catalog of {server_name}: {e}")
@@ -1,12 +1,12 @@
 import json
-import asyncio
 from typing import Dict, Any
 from agentpress.tool import ToolResult
-from mcp import ClientSession, StdioServerParameters
+from mcp import StdioServerParameters
 from mcp.client.sse import sse_client
 from mcp.client.stdio import stdio_client
 from mcp.client.streamable_http import streamablehttp_client
 from mcp_module import mcp_service
+from mcp_module.session_pool import mcp_session_pool, make_session_key
 from utils.logger import logger
 
 
@@ -90,12 +90,13 @@ class MCPToolExecutor:
             
             url = "https://remote.mcp.pipedream.net"
             
-            async with asyncio.timeout(30):
-                async with streamablehttp_client(url, headers=headers) as (read_stream, write_stream, _):
-                    async with ClientSession(read_stream, write_stream) as session:
-                        await session.initialize()
-                        result = await session.call_tool(original_tool_name, arguments)
-                        return self._create_success_result(self._extract_content(result))
+            result = await mcp_session_pool.call_tool(
+                make_session_key(url, headers, external_user_id),
+                lambda: streamablehttp_client(url, headers=headers),
+                original_tool_name,
+                arguments
+            )
+            return self._create_success_result(self._extract_content(result))
                         
         except Exception as e:
             logger.error(f"Error executing Pipedream MCP tool: {str(e)}")
@@ -108,23 +109,18 @@ class MCPToolExecutor:
         url = custom_config['url']
         headers = custom_config.get('headers', {})
         
-        async with asyncio.timeout(30):
+        def open_transport():
             try:
-                async with sse_client(url, headers=headers) as (read, write):
-                    async with ClientSession(read, write) as session:
-                        await session.initialize()
-                        result = await session.call_tool(original_tool_name, arguments)
-                        return self._create_success_result(self._extract_content(result))
-                        
+                return sse_client(url, headers=headers)
             except TypeError as e:
                 if "unexpected keyword argument" in str(e):
-                    async with sse_client(url) as (read, write):
-                        async with ClientSession(read, write) as session:
-                            await session.initialize()
-                            result = await session.call_tool(original_tool_name, arguments)
-                            return self._create_success_result(self._extract_content(result))
-                else:
-                    raise
+                    return sse_client(url)
+                raise
+        
+        result = await mcp_session_pool.call_tool(
+            make_session_key(url, headers), open_transport, original_tool_name, arguments
+        )
+        return self._create_success_result(self._extract_content(result))
     
     async def _execute_http_tool(self, tool_name: str, arguments: Dict[str, Any], tool_info: Dict[str, Any]) -> ToolResult:
         custom_config = tool_info['custom_config']
@@ -133,12 +129,10 @@ class MCPToolExecutor:
         url = custom_config['url']
         
         try:
-            async with asyncio.timeout(30):
-                async with streamablehttp_client(url) as (read, write, _):
-                    async with ClientSession(read, write) as session:
-                        await session.initialize()
-                        result = await session.call_tool(original_tool_name, arguments)
-                        return self._create_success_result(self._extract_content(result))
+            result = await mcp_session_pool.call_tool(
+                make_session_key(url), lambda: streamablehttp_client(url), original_tool_name, arguments
+            )
+            return self._create_success_result(self._extract_content(result))
                         
         except Exception as e:
             logger.error(f"Error executing HTTP MCP tool: {str(e)}")
@@ -154,12 +148,15 @@ class MCPToolExecutor:
             env=custom_config.get("env", {})
         )
         
-        async with asyncio.timeout(30):
-            async with stdio_client(server_params) as (read, write):
-                async with ClientSession(read, write) as session:
-                    await session.initialize()
-                    result = await session.call_tool(original_tool_name, arguments)
-                    return self._create_success_result(self._extract_content(result))
+        # Stdio servers are pooled per command line and environment, keeping the process running
+        command_line = " ".join([custom_config["command"], *custom_config.get("args", [])])
+        result = await mcp_session_pool.call_tool(
+            make_session_key(f"stdio:{command_line}", custom_config.get("env", {})),
+            lambda: stdio_client(server_params),
+            original_tool_name,
+            arguments
+        )
+        return self._create_success_result(self._extract_content(result))
     
     async def _resolve_external_user_id(self, custom_config: Dict[str, Any]) -> str:
         profile_id = custom_config.get('profile_id')
@@ -6,14 +6,61 @@ reaching the context window limitations of LLM models.
 """
 
 import json
-from typing import List, Dict, Any, Optional, Union
+import hashlib
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, Union
 
+import litellm
 from litellm.utils import token_counter
 from services.supabase import DBConnection
 from utils.logger import logger
 
 DEFAULT_TOKEN_THRESHOLD = 120000
 
+# Maximum number of per-message token counts kept by a ContextManager
+TOKEN_COUNT_CACHE_SIZE = 20000
+
+
+def get_token_model_family(llm_model: str) -> str:
+    """Map a model name to the tokenizer litellm's token_counter selects for it.
+
+    Models in the same family produce identical token counts, so counts can be
+    stored once per family and shared across models. Mirrors the selection in
+    litellm.utils._select_tokenizer.
+    """
+    model = llm_model or ""
+    if model in litellm.cohere_models and "command-r" in model:
+        return "cohere"
+    if model in litellm.anthropic_models and "claude-3" not in model:
+        return "claude"
+    if "llama-2" in model.lower() or "replicate" in model.lower():
+        return "llama2"
+    if "llama-3" in model.lower():
+        return "llama3"
+    return "tiktoken"
+
+
+# Per tokenizer family, tokens token_counter adds once per call rather than per message
+_call_overheads: Dict[str, int] = {}
+
+
+def get_token_call_overhead(llm_model: str) -> int:
+    """Tokens token_counter adds once per call, e.g. the reply priming of OpenAI models.
+
+    Measured by counting a probe message alone and twice in one call, so it
+    follows whatever the installed litellm version does for the tokenizer.
+    """
+    family = get_token_model_family(llm_model)
+    overhead = _call_overheads.get(family)
+    if overhead is None:
+        probe = {"role": "user", "content": "ping"}
+        single = token_counter(model=llm_model, messages=[probe])
+        double = token_counter(model=llm_model, messages=[probe, probe])
+        overhead = max(2 * single - double, 0)
+        _call_overheads[family] = overhead
+    return overhead
+
+
 class ContextManager:
     """Manages thread context including token counting and summarization."""
     
@@ -25,6 +72,53 @@ class ContextManager:
         """
         self.db = DBConnection()
         self.token_threshold = token_threshold
+        self._token_count_cache: "OrderedDict[Tuple[str, Optional[str], str], int]" = OrderedDict()
+
+    def _content_hash(self, msg: Any) -> str:
+        """Hash a message so edited or compressed variants get their own cache entry."""
+        serialized = json.dumps(msg, sort_keys=True, default=str)
+        return hashlib.sha256(serialized.encode()).hexdigest()
+
+    def count_message_tokens(self, msg: Any, llm_model: str) -> int:
+        """Count tokens of a single message, memoized by message_id and content hash."""
+        message_id = msg.get('message_id') if isinstance(msg, dict) else None
+        key = (get_token_model_family(llm_model), message_id, self._content_hash(msg))
+
+        cached = self._token_count_cache.get(key)
+        if cached is not None:
+            self._token_count_cache.move_to_end(key)
+            return cached
+
+        count = token_counter(model=llm_model, messages=[msg])
+        self._token_count_cache[key] = count
+        if len(self._token_count_cache) > TOKEN_COUNT_CACHE_SIZE:
+            self._token_count_cache.popitem(last=False)
+        return count
+
+    def count_tokens(self, messages: List[Dict[str, Any]], llm_model: str, stored_counts: Optional[Dict[str, int]] = None) -> int:
+        """Count tokens of a message list from cached per-message counts.
+
+        Each per-message count includes the once-per-call overhead of
+        token_counter; it is removed from all but one message, so the total
+        matches counting the list at once.
+
+        Args:
+            messages: Messages to count
+            llm_model: Model name for token counting
+            stored_counts: Optional token counts persisted with the messages, by
+                message_id. Only valid for messages that have not been modified
+                since they were loaded.
+        """
+        total = 0
+        for msg in messages:
+            message_id = msg.get('message_id') if isinstance(msg, dict) else None
+            if stored_counts and message_id in stored_counts:
+                total += stored_counts[message_id]
+            else:
+                total += self.count_message_tokens(msg, llm_model)
+        if len(messages) > 1:
+            total -= get_token_call_overhead(llm_model) * (len(messages) - 1)
+        return total
 
     def is_tool_result_message(self, msg: Dict[str, Any]) -> bool:
         """Check if a message is a tool result message."""
@@ -109,7 +203,7 @@ class ContextManager:
   
     def compress_tool_result_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
         """Compress the tool result messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+        uncompressed_total_token_count = self.count_tokens(messages, llm_model)
         max_tokens_value = max_tokens or (100 * 1000)
 
         if uncompressed_total_token_count > max_tokens_value:
@@ -119,7 +213,7 @@ class ContextManager:
                     continue  # Skip non-dict messages
                 if self.is_tool_result_message(msg):  # Only compress ToolResult messages
                     _i += 1  # Count the number of ToolResult messages
-                    msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
+                    msg_token_count = self.count_message_tokens(msg, llm_model)  # Count the number of tokens in the message
                     if msg_token_count > token_threshold:  # If the message is too long
                         if _i > 1:  # If this is not the most recent ToolResult message
                             message_id = msg.get('message_id')  # Get the message_id
@@ -133,7 +227,7 @@ class ContextManager:
 
     def compress_user_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
         """Compress the user messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+        uncompressed_total_token_count = self.count_tokens(messages, llm_model)
         max_tokens_value = max_tokens or (100 * 1000)
 
         if uncompressed_total_token_count > max_tokens_value:
@@ -143,7 +237,7 @@ class ContextManager:
                     continue  # Skip non-dict messages
                 if msg.get('role') == 'user':  # Only compress User messages
                     _i += 1  # Count the number of User messages
-                    msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
+                    msg_token_count = self.count_message_tokens(msg, llm_model)  # Count the number of tokens in the message
                     if msg_token_count > token_threshold:  # If the message is too long
                         if _i > 1:  # If this is not the most recent User message
                             message_id = msg.get('message_id')  # Get the message_id
@@ -157,7 +251,7 @@ class ContextManager:
 
     def compress_assistant_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
         """Compress the assistant messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+        uncompressed_total_token_count = self.count_tokens(messages, llm_model)
         max_tokens_value = max_tokens or (100 * 1000)
         
         if uncompressed_total_token_count > max_tokens_value:
@@ -167,7 +261,7 @@ class ContextManager:
                     continue  # Skip non-dict messages
                 if msg.get('role') == 'assistant':  # Only compress Assistant messages
                     _i += 1  # Count the number of Assistant messages
-                    msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
+                    msg_token_count = self.count_message_tokens(msg, llm_model)  # Count the number of tokens in the message
                     if msg_token_count > token_threshold:  # If the message is too long
                         if _i > 1:  # If this is not the most recent Assistant message
                             message_id = msg.get('message_id')  # Get the message_id
@@ -232,13 +326,13 @@ class ContextManager:
         result = messages
         result = self.remove_meta_messages(result)
 
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=result)
+        uncompressed_total_token_count = self.count_tokens(result, llm_model)
 
         result = self.compress_tool_result_messages(result, llm_model, max_tokens, token_threshold)
         result = self.compress_user_messages(result, llm_model, max_tokens, token_threshold)
         result = self.compress_assistant_messages(result, llm_model, max_tokens, token_threshold)
 
-        compressed_token_count = token_counter(model=llm_model, messages=result)
+        compressed_token_count = self.count_tokens(result, llm_model)
 
         logger.info(f"compress_messages: {uncompressed_total_token_count} -> {compressed_token_count}")  # Log the token compression for debugging later
 
@@ -277,7 +371,7 @@ class ContextManager:
         result = self.remove_meta_messages(result)
 
         # Early exit if no compression needed
-        initial_token_count = token_counter(model=llm_model, messages=result)
+        initial_token_count = self.count_tokens(result, llm_model)
         max_allowed_tokens = max_tokens or (100 * 1000)
         
         if initial_token_count <= max_allowed_tokens:
@@ -314,11 +408,11 @@ class ContextManager:
 
             # Recalculate token count
             messages_to_count = ([system_message] + conversation_messages) if system_message else conversation_messages
-            current_token_count = token_counter(model=llm_model, messages=messages_to_count)
+            current_token_count = self.count_tokens(messages_to_count, llm_model)
 
         # Prepare final result
         final_messages = ([system_message] + conversation_messages) if system_message else conversation_messages
-        final_token_count = token_counter(model=llm_model, messages=final_messages)
+        final_token_count = self.count_tokens(final_messages, llm_model)
         
         logger.info(f"compress_messages_by_omitting_messages: {initial_token_count} -> {final_token_count} tokens ({len(messages)} -> {len(final_messages)} messages)")
             
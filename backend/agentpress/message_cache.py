@@ -0,0 +1,202 @@
+"""
+Thread-scoped message cache for AgentPress.
+
+The LLM-visible history of a thread is loaded from the database once per run
+and then kept current incrementally:
+- Messages written through ThreadManager.add_message are appended directly
+- Refreshes only fetch rows newer than a created_at high-water mark
+- Token counts persisted with each row are kept alongside the message
+- Deletes and edits made elsewhere (e.g. the API process) bump a per-thread
+  version key in Redis, which forces the next read to reload the thread
+"""
+
+import json
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Set
+
+from services import redis
+from services.supabase import DBConnection
+from utils.logger import logger
+
+# Redis key holding the per-thread message version counter
+MESSAGES_VERSION_KEY = "thread_messages_version:{thread_id}"
+MESSAGES_VERSION_TTL = 3600 * 24
+
+# Rows inserted by other processes may commit with a created_at slightly older
+# than rows we have already seen, so each refresh re-reads this window and
+# de-duplicates by message_id.
+REFRESH_OVERLAP = timedelta(seconds=5)
+
+FETCH_BATCH_SIZE = 1000
+
+
+def _parse_timestamp(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+@dataclass
+class _CachedMessage:
+    message_id: str
+    created_at: datetime
+    message: Dict[str, Any]
+    token_counts: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class _ThreadState:
+    version: Optional[str]
+    entries: List[_CachedMessage] = field(default_factory=list)
+    message_ids: Set[str] = field(default_factory=set)
+    high_water_mark: Optional[datetime] = None
+
+
+async def invalidate_thread_messages(thread_id: str) -> None:
+    """Signal every running cache that messages of a thread were deleted or edited.
+
+    Must be called after any delete or update of LLM messages that does not go
+    through ThreadManager.add_message.
+    """
+    key = MESSAGES_VERSION_KEY.format(thread_id=thread_id)
+    try:
+        redis_client = await redis.get_client()
+        await redis_client.incr(key)
+        await redis_client.expire(key, MESSAGES_VERSION_TTL)
+    except Exception as e:
+        logger.warning(f"Failed to bump message version for thread {thread_id}: {e}")
+
+
+class ThreadMessageCache:
+    """Keeps parsed LLM messages per thread and refreshes them incrementally."""
+
+    def __init__(self, db: Optional[DBConnection] = None):
+        """Initialize the cache.
+
+        Args:
+            db: Database connection used to load messages
+        """
+        self.db = db or DBConnection()
+        self._threads: Dict[str, _ThreadState] = {}
+
+    async def get_messages(self, thread_id: str) -> List[Dict[str, Any]]:
+        """Return the LLM messages of a thread in created_at order.
+
+        Each returned message is a shallow copy, so callers may replace keys
+        (e.g. during context compression) without corrupting the cache.
+        """
+        state = self._threads.get(thread_id)
+        try:
+            version = await self._get_version(thread_id)
+        except Exception as e:
+            logger.warning(f"Could not read message version for thread {thread_id}, reloading: {e}")
+            state = None
+            version = None
+
+        if state is None or state.version != version:
+            if state is not None:
+                logger.debug(f"Messages of thread {thread_id} changed externally, reloading cache")
+            state = _ThreadState(version=version)
+            self._merge_rows(state, await self._fetch_rows(thread_id))
+            self._threads[thread_id] = state
+        else:
+            since = state.high_water_mark - REFRESH_OVERLAP if state.high_water_mark else None
+            self._merge_rows(state, await self._fetch_rows(thread_id, since))
+
+        return [dict(entry.message) for entry in state.entries]
+
+    def get_token_counts(self, thread_id: str, model_family: str) -> Dict[str, int]:
+        """Return stored token counts of a loaded thread for one tokenizer family, by message_id."""
+        state = self._threads.get(thread_id)
+        if state is None:
+            return {}
+        return {
+            entry.message_id: entry.token_counts[model_family]
+            for entry in state.entries
+            if model_family in entry.token_counts
+        }
+
+    def add(self, thread_id: str, row: Dict[str, Any]) -> None:
+        """Append a freshly inserted message row to an already loaded thread."""
+        state = self._threads.get(thread_id)
+        if state is None or not row.get('is_llm_message'):
+            return
+        self._merge_rows(state, [row])
+
+    def invalidate(self, thread_id: Optional[str] = None) -> None:
+        """Drop cached messages for one thread, or for all threads."""
+        if thread_id is None:
+            self._threads.clear()
+        else:
+            self._threads.pop(thread_id, None)
+
+    async def _get_version(self, thread_id: str) -> Optional[str]:
+        redis_client = await redis.get_client()
+        return await redis_client.get(MESSAGES_VERSION_KEY.format(thread_id=thread_id))
+
+    async def _fetch_rows(self, thread_id: str, since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Fetch LLM message rows in batches, optionally only those created at or after `since`."""
+        client = await self.db.client
+        rows = []
+        offset = 0
+
+        while True:
+            query = client.table('messages').select('message_id, content, created_at, token_counts').eq('thread_id', thread_id).eq('is_llm_message', True)
+            if since is not None:
+                query = query.gte('created_at', since.isoformat())
+            result = await query.order('created_at').range(offset, offset + FETCH_BATCH_SIZE - 1).execute()
+
+            if not result.data:
+                break
+
+            rows.extend(result.data)
+
+            # If we got fewer than batch_size records, we've reached the end
+            if len(result.data) < FETCH_BATCH_SIZE:
+                break
+
+            offset += FETCH_BATCH_SIZE
+
+        return rows
+
+    def _merge_rows(self, state: _ThreadState, rows: List[Dict[str, Any]]) -> None:
+        """Parse and append rows not yet cached, keeping entries ordered by created_at."""
+        needs_sort = False
+        for row in rows:
+            message_id = row.get('message_id')
+            created_at_raw = row.get('created_at')
+            if not message_id or not created_at_raw:
+                continue
+
+            created_at = _parse_timestamp(created_at_raw)
+            if state.high_water_mark is None or created_at > state.high_water_mark:
+                state.high_water_mark = created_at
+
+            if message_id in state.message_ids:
+                continue
+
+            content = row['content']
+            if isinstance(content, str):
+                try:
+                    content = json.loads(content)
+                except json.JSONDecodeError:
+                    logger.error(f"Failed to parse message: {row['content']}")
+                    continue
+            if not isinstance(content, dict):
+                logger.error(f"Unexpected message content type for message {message_id}: {type(content)}")
+                continue
+
+            message = dict(content)
+            message['message_id'] = message_id
+
+            if state.entries and created_at < state.entries[-1].created_at:
+                needs_sort = True
+            state.entries.append(_CachedMessage(
+                message_id=message_id,
+                created_at=created_at,
+                message=message,
+                token_counts=row.get('token_counts') or {},
+            ))
+            state.message_ids.add(message_id)
+
+        if needs_sort:
+            state.entries.sort(key=lambda entry: entry.created_at)
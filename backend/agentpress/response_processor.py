@@ -18,7 +18,7 @@ from dataclasses import dataclass
 from utils.logger import logger
 from agentpress.tool import ToolResult
 from agentpress.tool_registry import ToolRegistry
-from agentpress.xml_tool_parser import XMLToolParser
+from agentpress.xml_tool_parser import XMLToolParser, FunctionCallsStreamScanner
 from langfuse.client import StatefulTraceClient
 from services.langfuse import langfuse
 from utils.json_helpers import (
@@ -168,8 +168,9 @@ class ResponseProcessor:
         # Initialize from continuous state if provided (for auto-continue)
         continuous_state = continuous_state or {}
         accumulated_content = continuous_state.get('accumulated_content', "")
+        accumulated_chunks = [accumulated_content]  # joined once after the stream instead of concatenating per delta
         tool_calls_buffer = {}
-        current_xml_content = accumulated_content   # equal to accumulated_content if auto-continuing, else blank
+        xml_scanner = FunctionCallsStreamScanner(accumulated_content)   # seeded with accumulated_content if auto-continuing
         xml_chunks_buffer = []
         pending_tool_executions = []
         yielded_tool_indices = set() # Stores indices of tools whose *status* has been yielded
@@ -259,14 +260,13 @@ class ResponseProcessor:
                             has_printed_thinking_prefix = True
                         # print(delta.reasoning_content, end='', flush=True)
                         # Append reasoning to main content to be saved in the final message
-                        accumulated_content += delta.reasoning_content
+                        accumulated_chunks.append(delta.reasoning_content)
 
                     # Process content chunk
                     if delta and hasattr(delta, 'content') and delta.content:
                         chunk_content = delta.content
                         # print(chunk_content, end='', flush=True)
-                        accumulated_content += chunk_content
-                        current_xml_content += chunk_content
+                        accumulated_chunks.append(chunk_content)
 
                         if not (config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls):
                             # Yield ONLY content chunk (don't save)
@@ -286,9 +286,8 @@ class ResponseProcessor:
 
                         # --- Process XML Tool Calls (if enabled and limit not reached) ---
                         if config.xml_tool_calling and not (config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls):
-                            xml_chunks = self._extract_xml_chunks(current_xml_content)
+                            xml_chunks = xml_scanner.feed(chunk_content)
                             for xml_chunk in xml_chunks:
-                                current_xml_content = current_xml_content.replace(xml_chunk, "", 1)
                                 xml_chunks_buffer.append(xml_chunk)
                                 result = self._parse_xml_tool_call(xml_chunk)
                                 if result:
@@ -390,6 +389,7 @@ class ResponseProcessor:
             # print() # Add a final newline after the streaming loop finishes
 
             # --- After Streaming Loop ---
+            accumulated_content = ''.join(accumulated_chunks)
             
             if (
                 streaming_metadata["usage"]["total_tokens"] == 0
@@ -575,7 +575,7 @@ class ResponseProcessor:
                 parsed_xml_data = []
                 if config.xml_tool_calling:
                     # Reparse remaining content just in case (should be empty if processed correctly)
-                    xml_chunks = self._extract_xml_chunks(current_xml_content)
+                    xml_chunks = self._extract_xml_chunks(xml_scanner.remaining_content())
                     xml_chunks_buffer.extend(xml_chunks)
                     # Process only chunks not already handled in the stream loop
                     remaining_limit = config.max_xml_tool_calls - xml_tool_call_count if config.max_xml_tool_calls > 0 else len(xml_chunks_buffer)
@@ -644,6 +644,25 @@ class ResponseProcessor:
                            self.trace.event(name="could_not_map_result_for_tool_index", level="WARNING", status_message=(f"Could not map result for tool index {current_tool_idx}"))
                        current_tool_idx += 1
 
+                # Tool calls only found by the reparse above (e.g. legacy tag format) were not executed on stream
+                if config.execute_on_stream and parsed_xml_data:
+                    logger.info(f"Executing {len(parsed_xml_data)} tools found after stream ({config.tool_execution_strategy})")
+                    self.trace.event(name="executing_tools_found_after_stream", level="DEFAULT", status_message=(f"Executing {len(parsed_xml_data)} tools found after stream ({config.tool_execution_strategy})"))
+                    results_list = await self._execute_tools([item['tool_call'] for item in parsed_xml_data], config.tool_execution_strategy)
+                    for item, (tc, res) in zip(parsed_xml_data, results_list):
+                        context = self._create_tool_context(
+                            tc, tool_index,
+                            last_assistant_message_object['message_id'] if last_assistant_message_object else None,
+                            item.get('parsing_details')
+                        )
+                        context.result = res
+                        tool_results_map[tool_index] = (tc, res, context)
+                        tool_index += 1
+
+                        if tc.get('function_name') in ['ask', 'complete']:
+                            logger.info(f"Terminating tool '{tc['function_name']}' executed after stream. Setting termination flag.")
+                            agent_should_terminate = True
+
                 # Save and Yield each result message
                 if tool_results_map:
                     logger.info(f"Saving and yielding {len(tool_results_map)} final tool result messages")
@@ -654,8 +673,8 @@ class ResponseProcessor:
                         if not context.assistant_message_id and last_assistant_message_object:
                             context.assistant_message_id = last_assistant_message_object['message_id']
 
-                        # Yield start status ONLY IF executing non-streamed (already yielded if streamed)
-                        if not config.execute_on_stream and tool_idx not in yielded_tool_indices:
+                        # Yield start status ONLY IF not already yielded during the stream
+                        if tool_idx not in yielded_tool_indices:
                             started_msg_obj = await self._yield_and_save_tool_started(context, thread_id, thread_run_id)
                             if started_msg_obj: yield format_for_yield(started_msg_obj)
                             yielded_tool_indices.add(tool_idx) # Mark status yielded
@@ -1080,26 +1099,15 @@ class ResponseProcessor:
             # If no new format found, fall back to old format for backwards compatibility
             if not chunks:
                 pos = 0
-                while pos < len(content):
-                    # Find the next tool tag
-                    next_tag_start = -1
-                    current_tag = None
-                    
-                    # Find the earliest occurrence of any registered tool function name
-                    # Check for available function names
-                    available_functions = self.tool_registry.get_available_functions()
-                    for func_name in available_functions.keys():
-                        # Convert function name to potential tag name (underscore to dash)
-                        tag_name = func_name.replace('_', '-')
-                        start_pattern = f'<{tag_name}'
-                        tag_pos = content.find(start_pattern, pos)
-                        
-                        if tag_pos != -1 and (next_tag_start == -1 or tag_pos < next_tag_start):
-                            next_tag_start = tag_pos
-                            current_tag = tag_name
-                    
-                    if next_tag_start == -1 or not current_tag:
+                # Single pass over all registered tool tag names (underscore to dash)
+                tag_pattern = self.tool_registry.get_xml_tag_pattern()
+                while tag_pattern and pos < len(content):
+                    # Find the earliest occurrence of any registered tool tag
+                    tag_match = tag_pattern.search(content, pos)
+                    if not tag_match:
                         break
+                    next_tag_start = tag_match.start()
+                    current_tag = tag_match.group(1)
                     
                     # Find the matching end tag
                     end_pattern = f'</{current_tag}>'
@@ -1232,11 +1240,8 @@ class ResponseProcessor:
                 except json.JSONDecodeError:
                     arguments = {"text": arguments}
             
-            # Get available functions from tool registry
-            available_functions = self.tool_registry.get_available_functions()
-            
-            # Look up the function by name
-            tool_fn = available_functions.get(function_name)
+            # Look up the function by name in the tool registry
+            tool_fn = self.tool_registry.get_function(function_name)
             if not tool_fn:
                 logger.error(f"Tool function '{function_name}' not found in registry")
                 span.end(status_message="tool_not_found", level="ERROR")
@@ -11,11 +11,14 @@ This module provides comprehensive conversation management, including:
 """
 
 import json
-from typing import List, Dict, Any, Optional, Type, Union, AsyncGenerator, Literal, cast
+import uuid
+import hashlib
+from typing import List, Dict, Any, Optional, Type, Union, AsyncGenerator, Literal, Callable, Awaitable, cast
 from services.llm import make_llm_api_call
 from agentpress.tool import Tool
 from agentpress.tool_registry import ToolRegistry
-from agentpress.context_manager import ContextManager
+from agentpress.context_manager import ContextManager, get_token_model_family
+from agentpress.message_cache import ThreadMessageCache
 from agentpress.response_processor import (
     ResponseProcessor,
     ProcessorConfig
@@ -25,10 +28,11 @@ from utils.logger import logger
 from langfuse.client import StatefulGenerationClient, StatefulTraceClient
 from services.langfuse import langfuse
 import datetime
-from litellm.utils import token_counter
 
 # Type alias for tool choice
 ToolChoice = Literal["auto", "required", "none"]
+# Called with the thread ID and the saved message row after every message is added
+MessageAddedCallback = Callable[[str, Dict[str, Any]], Awaitable[None]]
 
 class ThreadManager:
     """Manages conversation threads with LLM models and tool execution.
@@ -38,7 +42,7 @@ class ThreadManager:
     XML-based tool execution patterns.
     """
 
-    def __init__(self, trace: Optional[StatefulTraceClient] = None, is_agent_builder: bool = False, target_agent_id: Optional[str] = None, agent_config: Optional[dict] = None):
+    def __init__(self, trace: Optional[StatefulTraceClient] = None, is_agent_builder: bool = False, target_agent_id: Optional[str] = None, agent_config: Optional[dict] = None, on_message_added: Optional[MessageAddedCallback] = None):
         """Initialize ThreadManager.
 
         Args:
@@ -46,6 +50,7 @@ class ThreadManager:
             is_agent_builder: Whether this is an agent builder session
             target_agent_id: ID of the agent being built (if in agent builder mode)
             agent_config: Optional agent configuration with version information
+            on_message_added: Optional callback run after each message is saved
         """
         self.db = DBConnection()
         self.tool_registry = ToolRegistry()
@@ -53,6 +58,7 @@ class ThreadManager:
         self.is_agent_builder = is_agent_builder
         self.target_agent_id = target_agent_id
         self.agent_config = agent_config
+        self.on_message_added = on_message_added
         if not self.trace:
             self.trace = langfuse.trace(name="anonymous:thread_manager")
         self.response_processor = ResponseProcessor(
@@ -64,6 +70,11 @@ class ThreadManager:
             agent_config=self.agent_config
         )
         self.context_manager = ContextManager()
+        self.message_cache = ThreadMessageCache(self.db)
+        # Model of the current run, used to count tokens of messages at write time
+        self.llm_model: Optional[str] = None
+        self._working_system_prompt_key: Optional[tuple] = None
+        self._working_system_prompt: Optional[Dict[str, Any]] = None
 
     def add_tool(self, tool_class: Type[Tool], function_names: Optional[List[str]] = None, **kwargs):
         """Add a tool to the ThreadManager."""
@@ -163,12 +174,28 @@ class ThreadManager:
         if agent_version_id:
             data_to_insert['agent_version_id'] = agent_version_id
 
+        # Count tokens once at write time so context budgeting can use stored counts
+        if is_llm_message and isinstance(content, dict) and self.llm_model:
+            message_id = str(uuid.uuid4())
+            try:
+                token_count = self.context_manager.count_message_tokens({**content, 'message_id': message_id}, self.llm_model)
+                data_to_insert['message_id'] = message_id
+                data_to_insert['token_counts'] = {get_token_model_family(self.llm_model): token_count}
+            except Exception as e:
+                logger.warning(f"Failed to count tokens for new message in thread {thread_id}: {str(e)}")
+
         try:
             # Insert the message and get the inserted row data including the id
             result = await client.table('messages').insert(data_to_insert).execute()
             logger.info(f"Successfully added message to thread {thread_id}")
 
             if result.data and len(result.data) > 0 and isinstance(result.data[0], dict) and 'message_id' in result.data[0]:
+                self.message_cache.add(thread_id, result.data[0])
+                if self.on_message_added:
+                    try:
+                        await self.on_message_added(thread_id, result.data[0])
+                    except Exception as e:
+                        logger.warning(f"on_message_added callback failed for thread {thread_id}: {str(e)}")
                 return result.data[0]
             else:
                 logger.error(f"Insert operation failed or did not return expected data structure for thread {thread_id}. Result data: {result.data}")
@@ -180,8 +207,9 @@ class ThreadManager:
     async def get_llm_messages(self, thread_id: str) -> List[Dict[str, Any]]:
         """Get all messages for a thread.
 
-        This method uses the SQL function which handles context truncation
-        by considering summary messages.
+        Messages are served from the thread-scoped message cache, which loads
+        the history once and afterwards only fetches rows newer than its
+        created_at high-water mark.
 
         Args:
             thread_id: The ID of the thread to get messages for.
@@ -190,122 +218,37 @@ class ThreadManager:
             List of message objects.
         """
         logger.debug(f"Getting messages for thread {thread_id}")
-        client = await self.db.client
 
         try:
-            # result = await client.rpc('get_llm_formatted_messages', {'p_thread_id': thread_id}).execute()
-            
-            # Fetch messages in batches of 1000 to avoid overloading the database
-            all_messages = []
-            batch_size = 1000
-            offset = 0
-            
-            while True:
-                result = await client.table('messages').select('message_id, content').eq('thread_id', thread_id).eq('is_llm_message', True).order('created_at').range(offset, offset + batch_size - 1).execute()
-                
-                if not result.data or len(result.data) == 0:
-                    break
-                    
-                all_messages.extend(result.data)
-                
-                # If we got fewer than batch_size records, we've reached the end
-                if len(result.data) < batch_size:
-                    break
-                    
-                offset += batch_size
-            
-            # Use all_messages instead of result.data in the rest of the method
-            result_data = all_messages
-
-            # Parse the returned data which might be stringified JSON
-            if not result_data:
-                return []
-
-            # Return properly parsed JSON objects
-            messages = []
-            for item in result_data:
-                if isinstance(item['content'], str):
-                    try:
-                        parsed_item = json.loads(item['content'])
-                        parsed_item['message_id'] = item['message_id']
-                        messages.append(parsed_item)
-                    except json.JSONDecodeError:
-                        logger.error(f"Failed to parse message: {item['content']}")
-                else:
-                    content = item['content']
-                    content['message_id'] = item['message_id']
-                    messages.append(content)
-
-            return messages
+            return await self.message_cache.get_messages(thread_id)
 
         except Exception as e:
             logger.error(f"Failed to get messages for thread {thread_id}: {str(e)}", exc_info=True)
+            self.message_cache.invalidate(thread_id)
             return []
 
 
-    async def run_thread(
-        self,
-        thread_id: str,
-        system_prompt: Dict[str, Any],
-        stream: bool = True,
-        temporary_message: Optional[Dict[str, Any]] = None,
-        llm_model: str = "gpt-4o",
-        llm_temperature: float = 0,
-        llm_max_tokens: Optional[int] = None,
-        processor_config: Optional[ProcessorConfig] = None,
-        tool_choice: ToolChoice = "auto",
-        native_max_auto_continues: int = 25,
-        max_xml_tool_calls: int = 0,
-        include_xml_examples: bool = False,
-        enable_thinking: Optional[bool] = False,
-        reasoning_effort: Optional[str] = 'low',
-        enable_context_manager: bool = True,
-        generation: Optional[StatefulGenerationClient] = None,
-    ) -> Union[Dict[str, Any], AsyncGenerator]:
-        """Run a conversation thread with LLM integration and tool execution.
-
-        Args:
-            thread_id: The ID of the thread to run
-            system_prompt: System message to set the assistant's behavior
-            stream: Use streaming API for the LLM response
-            temporary_message: Optional temporary user message for this run only
-            llm_model: The name of the LLM model to use
-            llm_temperature: Temperature parameter for response randomness (0-1)
-            llm_max_tokens: Maximum tokens in the LLM response
-            processor_config: Configuration for the response processor
-            tool_choice: Tool choice preference ("auto", "required", "none")
-            native_max_auto_continues: Maximum number of automatic continuations when
-                                      finish_reason="tool_calls" (0 disables auto-continue)
-            max_xml_tool_calls: Maximum number of XML tool calls to allow (0 = no limit)
-            include_xml_examples: Whether to include XML tool examples in the system prompt
-            enable_thinking: Whether to enable thinking before making a decision
-            reasoning_effort: The effort level for reasoning
-            enable_context_manager: Whether to enable automatic context summarization.
+    def _build_working_system_prompt(self, system_prompt: Dict[str, Any], config: ProcessorConfig, include_xml_examples: bool) -> Dict[str, Any]:
+        """Build the system prompt sent to the LLM, including XML tool examples if requested.
 
-        Returns:
-            An async generator yielding response chunks or error dict
+        The result only depends on the system prompt and the registered tools, so it
+        is cached per tool registry version and system prompt content and reused
+        across iterations and auto-continues of a run.
         """
-
-        logger.info(f"Starting thread execution for thread {thread_id}")
-        logger.info(f"Using model: {llm_model}")
-        logger.info(f"Parameters: model={llm_model}, temperature={llm_temperature}, max_tokens={llm_max_tokens}")
-        logger.info(f"Auto-continue: max={native_max_auto_continues}, XML tool limit={max_xml_tool_calls}")
-
-        # Log model info
-        logger.info(f"🤖 Thread {thread_id}: Using model {llm_model}")
-
-        # Ensure processor_config is not None
-        config = processor_config or ProcessorConfig()
-
-        # Apply max_xml_tool_calls if specified and not already set in config
-        if max_xml_tool_calls > 0 and not config.max_xml_tool_calls:
-            config.max_xml_tool_calls = max_xml_tool_calls
+        add_xml_examples = include_xml_examples and config.xml_tool_calling
+        cache_key = (
+            self.tool_registry.version,
+            add_xml_examples,
+            hashlib.sha256(json.dumps(system_prompt, sort_keys=True, default=str).encode()).hexdigest()
+        )
+        if self._working_system_prompt_key == cache_key:
+            return self._copy_system_prompt(self._working_system_prompt)
 
         # Create a working copy of the system prompt to potentially modify
-        working_system_prompt = system_prompt.copy()
+        working_system_prompt = self._copy_system_prompt(system_prompt)
 
         # Add XML tool calling instructions to system prompt if requested
-        if include_xml_examples and config.xml_tool_calling:
+        if add_xml_examples:
             openapi_schemas = self.tool_registry.get_openapi_schemas()
             usage_examples = self.tool_registry.get_usage_examples()
             
@@ -362,7 +305,7 @@ When using the tools:
                     logger.debug("Appended XML examples to string system prompt content.")
                 elif isinstance(system_content, list):
                     appended = False
-                    for item in working_system_prompt['content']: # Modify the copy
+                    for item in working_system_prompt['content']: # Modify the copied items
                         if isinstance(item, dict) and item.get('type') == 'text' and 'text' in item:
                             item['text'] += examples_content
                             logger.debug("Appended XML examples to the first text block in list system prompt content.")
@@ -372,7 +315,81 @@ When using the tools:
                         logger.warning("System prompt content is a list but no text block found to append XML examples.")
                 else:
                     logger.warning(f"System prompt content is of unexpected type ({type(system_content)}), cannot add XML examples.")
-        
+
+        self._working_system_prompt_key = cache_key
+        self._working_system_prompt = working_system_prompt
+        return self._copy_system_prompt(working_system_prompt)
+
+    @staticmethod
+    def _copy_system_prompt(system_prompt: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy a system prompt deep enough that content blocks can be modified in place."""
+        prompt_copy = system_prompt.copy()
+        if isinstance(prompt_copy.get('content'), list):
+            prompt_copy['content'] = [item.copy() if isinstance(item, dict) else item for item in prompt_copy['content']]
+        return prompt_copy
+
+    async def run_thread(
+        self,
+        thread_id: str,
+        system_prompt: Dict[str, Any],
+        stream: bool = True,
+        temporary_message: Optional[Dict[str, Any]] = None,
+        llm_model: str = "gpt-4o",
+        llm_temperature: float = 0,
+        llm_max_tokens: Optional[int] = None,
+        processor_config: Optional[ProcessorConfig] = None,
+        tool_choice: ToolChoice = "auto",
+        native_max_auto_continues: int = 25,
+        max_xml_tool_calls: int = 0,
+        include_xml_examples: bool = False,
+        enable_thinking: Optional[bool] = False,
+        reasoning_effort: Optional[str] = 'low',
+        enable_context_manager: bool = True,
+        generation: Optional[StatefulGenerationClient] = None,
+    ) -> Union[Dict[str, Any], AsyncGenerator]:
+        """Run a conversation thread with LLM integration and tool execution.
+
+        Args:
+            thread_id: The ID of the thread to run
+            system_prompt: System message to set the assistant's behavior
+            stream: Use streaming API for the LLM response
+            temporary_message: Optional temporary user message for this run only
+            llm_model: The name of the LLM model to use
+            llm_temperature: Temperature parameter for response randomness (0-1)
+            llm_max_tokens: Maximum tokens in the LLM response
+            processor_config: Configuration for the response processor
+            tool_choice: Tool choice preference ("auto", "required", "none")
+            native_max_auto_continues: Maximum number of automatic continuations when
+                                      finish_reason="tool_calls" (0 disables auto-continue)
+            max_xml_tool_calls: Maximum number of XML tool calls to allow (0 = no limit)
+            include_xml_examples: Whether to include XML tool examples in the system prompt
+            enable_thinking: Whether to enable thinking before making a decision
+            reasoning_effort: The effort level for reasoning
+            enable_context_manager: Whether to enable automatic context summarization.
+
+        Returns:
+            An async generator yielding response chunks or error dict
+        """
+
+        logger.info(f"Starting thread execution for thread {thread_id}")
+        logger.info(f"Using model: {llm_model}")
+        logger.info(f"Parameters: model={llm_model}, temperature={llm_temperature}, max_tokens={llm_max_tokens}")
+        logger.info(f"Auto-continue: max={native_max_auto_continues}, XML tool limit={max_xml_tool_calls}")
+
+        # Log model info
+        logger.info(f"🤖 Thread {thread_id}: Using model {llm_model}")
+        self.llm_model = llm_model
+
+        # Ensure processor_config is not None
+        config = processor_config or ProcessorConfig()
+
+        # Apply max_xml_tool_calls if specified and not already set in config
+        if max_xml_tool_calls > 0 and not config.max_xml_tool_calls:
+            config.max_xml_tool_calls = max_xml_tool_calls
+
+        # Build (or reuse) the system prompt including XML tool examples
+        working_system_prompt = self._build_working_system_prompt(system_prompt, config, include_xml_examples)
+
         # Control whether we need to auto-continue due to tool_calls finish reason
         auto_continue = True
         auto_continue_count = 0
@@ -397,7 +414,8 @@ When using the tools:
                 token_count = 0
                 try:
                     # Use the potentially modified working_system_prompt for token counting
-                    token_count = token_counter(model=llm_model, messages=[working_system_prompt] + messages)
+                    stored_counts = self.message_cache.get_token_counts(thread_id, get_token_model_family(llm_model))
+                    token_count = self.context_manager.count_tokens([working_system_prompt] + messages, llm_model, stored_counts)
                     token_threshold = self.context_manager.token_threshold
                     logger.info(f"Thread {thread_id} token count: {token_count}/{token_threshold} ({(token_count/token_threshold)*100:.1f}%)")
 
@@ -1,7 +1,17 @@
-from typing import Dict, Type, Any, List, Optional, Callable
-from agentpress.tool import Tool, SchemaType
+from typing import Dict, Type, Any, List, Optional, Callable, Pattern
+from dataclasses import dataclass
+from agentpress.tool import Tool, SchemaType, ToolSchema
 from utils.logger import logger
 import json
+import re
+
+
+@dataclass
+class ToolDispatchEntry:
+    """Precomputed dispatch information for a registered tool function."""
+    function_name: str
+    xml_tag_name: str
+    function: Callable
 
 
 class ToolRegistry:
@@ -12,16 +22,23 @@ class ToolRegistry:
     
     Attributes:
         tools (Dict[str, Dict[str, Any]]): OpenAPI-style tools and schemas
+        version (int): Incremented whenever the set of registered functions changes
         
     Methods:
         register_tool: Register a tool with optional function filtering
+        register_function: Register a single function of an existing tool instance
         get_tool: Get a specific tool by name
+        get_function: Get the bound implementation of a tool function
         get_openapi_schemas: Get OpenAPI schemas for function calling
     """
     
     def __init__(self):
         """Initialize a new ToolRegistry instance."""
         self.tools = {}
+        self.version = 0
+        self._dispatch_version = -1
+        self._dispatch_table: Dict[str, ToolDispatchEntry] = {}
+        self._xml_tag_pattern: Optional[Pattern] = None
         logger.debug("Initialized new ToolRegistry instance")
     
     def register_tool(self, tool_class: Type[Tool], function_names: Optional[List[str]] = None, **kwargs):
@@ -55,26 +72,82 @@ class ToolRegistry:
                         registered_openapi += 1
                         logger.debug(f"Registered OpenAPI function {func_name} from {tool_class.__name__}")
         
+        self.version += 1
         logger.debug(f"Tool registration complete for {tool_class.__name__}: {registered_openapi} OpenAPI functions")
 
+    def register_function(self, func_name: str, tool_instance: Any, schema: ToolSchema):
+        """Register a single function of an already initialized tool instance.
+        
+        Used for tools whose functions are only known after async setup, such as
+        MCP tools created by MCPToolWrapper.
+        
+        Args:
+            func_name: Name of the function on the tool instance
+            tool_instance: The tool instance providing the function
+            schema: The schema describing the function
+        """
+        self.tools[func_name] = {
+            "instance": tool_instance,
+            "schema": schema
+        }
+        self.version += 1
+
+    def _get_dispatch_table(self) -> Dict[str, ToolDispatchEntry]:
+        """Return the dispatch table, rebuilding it only if registrations changed."""
+        if self._dispatch_version != self.version:
+            dispatch_table = {}
+            for tool_name, tool_info in self.tools.items():
+                try:
+                    function = getattr(tool_info['instance'], tool_name)
+                except AttributeError:
+                    logger.warning(f"Registered tool function '{tool_name}' not found on {type(tool_info['instance']).__name__}")
+                    continue
+                dispatch_table[tool_name] = ToolDispatchEntry(
+                    function_name=tool_name,
+                    xml_tag_name=tool_name.replace('_', '-'),
+                    function=function
+                )
+
+            # Single alternation over all tag names, in registration order, for legacy XML tag scanning
+            tag_names = [entry.xml_tag_name for entry in dispatch_table.values()]
+            self._xml_tag_pattern = re.compile('<(' + '|'.join(re.escape(tag) for tag in tag_names) + ')') if tag_names else None
+
+            self._dispatch_table = dispatch_table
+            self._dispatch_version = self.version
+            logger.debug(f"Rebuilt tool dispatch table with {len(dispatch_table)} functions (version {self.version})")
+        return self._dispatch_table
+
     def get_available_functions(self) -> Dict[str, Callable]:
         """Get all available tool functions.
         
         Returns:
             Dict mapping function names to their implementations
         """
-        available_functions = {}
-        
-        # Get OpenAPI tool functions
-        for tool_name, tool_info in self.tools.items():
-            tool_instance = tool_info['instance']
-            function_name = tool_name
-            function = getattr(tool_instance, function_name)
-            available_functions[function_name] = function
-            
+        available_functions = {name: entry.function for name, entry in self._get_dispatch_table().items()}
         logger.debug(f"Retrieved {len(available_functions)} available functions")
         return available_functions
 
+    def get_function(self, function_name: str) -> Optional[Callable]:
+        """Get the bound implementation of a tool function.
+        
+        Args:
+            function_name: Name of the tool function
+            
+        Returns:
+            The callable, or None if no such function is registered
+        """
+        entry = self._get_dispatch_table().get(function_name)
+        return entry.function if entry else None
+
+    def get_xml_tag_pattern(self) -> Optional[Pattern]:
+        """Get a compiled pattern matching the opening of any registered tool's XML tag.
+        
+        Returns:
+            Pattern whose first group is the matched tag name, or None if no tools are registered
+        """
+        self._get_dispatch_table()
+        return self._xml_tag_pattern
+
     def get_tool(self, tool_name: str) -> Dict[str, Any]:
         """Get a specific tool by name.
         
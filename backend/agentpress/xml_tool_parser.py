@@ -221,6 +221,100 @@ class XMLToolParser:
         return True, None
 
 
+class FunctionCallsStreamScanner:
+    """
+    Resumable scanner for complete <function_calls> blocks in streamed text.
+
+    Text is fed delta by delta. The scanner remembers whether it is inside a
+    block and only inspects the new delta plus a few carried-over characters
+    (so tags split across deltas are still found), which keeps a whole stream
+    linear in its length. Each block is returned exactly once, from the feed()
+    call that delivers its closing tag, so it can be parsed right away.
+    """
+
+    START_TAG = '<function_calls>'
+    END_TAG = '</function_calls>'
+
+    def __init__(self, initial_content: str = ""):
+        """
+        Initialize the scanner.
+
+        Args:
+            initial_content: Text that precedes the stream (e.g. content carried
+                over from a previous auto-continue cycle); scanned on the first feed
+        """
+        self._unscanned = initial_content
+        self._inside_block = False
+        self._block_parts: List[str] = []
+        self._outside_parts: List[str] = []
+        self._tail = ""
+
+    def feed(self, delta: str) -> List[str]:
+        """
+        Scan a new delta.
+
+        Args:
+            delta: The newly streamed text
+
+        Returns:
+            Complete <function_calls> blocks closed by this delta, in order
+        """
+        if self._unscanned:
+            delta = self._unscanned + delta
+            self._unscanned = ""
+
+        blocks = []
+        while delta:
+            tag = self.END_TAG if self._inside_block else self.START_TAG
+            window = self._tail + delta
+            tag_pos = window.find(tag)
+
+            if tag_pos == -1:
+                (self._block_parts if self._inside_block else self._outside_parts).append(delta)
+                self._tail = window[-(len(tag) - 1):]
+                break
+
+            # Position of the tag within delta; negative if it started in the carried-over tail
+            split = tag_pos - len(self._tail)
+            self._tail = ""
+
+            if self._inside_block:
+                block_end = split + len(tag)
+                self._block_parts.append(delta[:block_end])
+                blocks.append(''.join(self._block_parts))
+                self._block_parts = []
+                self._inside_block = False
+                delta = delta[block_end:]
+            else:
+                if split < 0:
+                    self._block_parts = [self._pop_outside_suffix(-split)]
+                    split = 0
+                else:
+                    self._outside_parts.append(delta[:split])
+                self._inside_block = True
+                delta = delta[split:]
+
+        return blocks
+
+    def remaining_content(self) -> str:
+        """Return all fed text except the blocks already returned by feed()."""
+        return ''.join(self._outside_parts) + ''.join(self._block_parts) + self._unscanned
+
+    def _pop_outside_suffix(self, length: int) -> str:
+        """Remove and return the last `length` characters of the text outside blocks."""
+        popped = []
+        while length > 0 and self._outside_parts:
+            part = self._outside_parts.pop()
+            if len(part) > length:
+                self._outside_parts.append(part[:-length])
+                popped.append(part[-length:])
+                length = 0
+            else:
+                popped.append(part)
+                length -= len(part)
+        return ''.join(reversed(popped))
+
+
 # Convenience function for quick parsing
 def parse_xml_tool_calls(content: str) -> List[XMLToolCall]:
     """
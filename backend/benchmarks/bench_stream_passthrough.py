@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Benchmark of writing stored agent run responses to SSE clients
+
+Runs a few hundred concurrent simulated streams through the previous path of
+stream_agent_run, which parsed every stored response with json.loads and wrote
+it back with json.dumps, and through the pass-through path, which writes the
+stored string as-is and detects the end of the run with get_terminal_status.
+Reports the CPU time of both and asserts they write the same frames and stop
+at the same status.
+
+get_terminal_status only recognizes status updates stored as json.dumps of a
+dict whose first keys are "type" and "status". Before benchmarking, every
+status dict literal in the backend is checked for that key order and its
+json.dumps output for the STATUS_PREFIX, so a writer that breaks the prefix
+fails here.
+
+Usage:
+    python benchmarks/bench_stream_passthrough.py                    # 300 streams of 500 responses
+    python benchmarks/bench_stream_passthrough.py --streams 500 --responses 1000
+"""
+
+import argparse
+import ast
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncGenerator, List, Tuple
+
+# Add the backend directory to the path so we can import modules
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from services.stream_hub import STATUS_PREFIX, TERMINAL_STATUSES, get_terminal_status
+
+
+def check_status_writers() -> int:
+    """Assert every status dict literal in the backend serializes to the STATUS_PREFIX; returns how many were checked."""
+    checked = 0
+    for path in sorted(backend_dir.rglob("*.py")):
+        tree = ast.parse(path.read_text(), filename=str(path))
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Dict):
+                continue
+            keys = [key.value if isinstance(key, ast.Constant) else None for key in node.keys]
+            if "status" not in keys or "type" not in keys:
+                continue
+            type_value = node.values[keys.index("type")]
+            if not (isinstance(type_value, ast.Constant) and type_value.value == "status"):
+                continue
+
+            location = f"{path.relative_to(backend_dir)}:{node.lineno}"
+            assert keys[:2] == ["type", "status"], f"Status update at {location} does not start with the type and status keys"
+            status_value = node.values[1]
+            status = status_value.value if isinstance(status_value, ast.Constant) else "completed"
+            payload = json.dumps({"type": "status", "status": status, **{key: "" for key in keys[2:] if key}})
+            assert payload.startswith(STATUS_PREFIX), f"Status update at {location} is stored as {payload[:40]!r}"
+            if status in TERMINAL_STATUSES:
+                assert get_terminal_status(payload) == status, f"Terminal status at {location} is not detected"
+            checked += 1
+    return checked
+
+
+def synthetic_responses(count: int, rng: random.Random) -> List[str]:
+    """Stored responses of one run, in the format process_streaming_response yields, ending with a terminal status."""
+    thread_id = str(uuid.uuid4())
+    responses = []
+    for _ in range(count - 1):
+        text = " ".join(rng.choice(["Let", "me", "check", "the", "file", "\"quoted\"", "naïve", "\n"]) for _ in range(rng.randint(1, 12)))
+        responses.append(json.dumps({
+            "message_id": None, "thread_id": thread_id, "type": "assistant", "is_llm_message": True,
+            "content": json.dumps({"role": "assistant", "content": text}),
+            "metadata": json.dumps({"stream_status": "chunk", "thread_run_id": str(uuid.uuid4())}),
+            "created_at": "2025-01-01T00:00:00+00:00", "updated_at": "2025-01-01T00:00:00+00:00",
+        }))
+    responses.append(json.dumps({"type": "status", "status": "completed", "message": "Agent run completed successfully"}))
+    return responses
+
+
+async def stream_parse_and_redump(responses: List[str], batch_size: int) -> AsyncGenerator[str, None]:
+    for start in range(0, len(responses), batch_size):
+        await asyncio.sleep(0)
+        for response in (json.loads(r) for r in responses[start:start + batch_size]):
+            yield f"data: {json.dumps(response)}\n\n"
+            if response.get('type') == 'status' and response.get('status') in ['completed', 'failed', 'stopped']:
+                yield f"status: {response.get('status')}"
+                return
+
+
+async def stream_pass_through(responses: List[str], batch_size: int) -> AsyncGenerator[str, None]:
+    for start in range(0, len(responses), batch_size):
+        await asyncio.sleep(0)
+        for response_json in responses[start:start + batch_size]:
+            yield f"data: {response_json}\n\n"
+            terminal_status = get_terminal_status(response_json)
+            if terminal_status:
+                yield f"status: {terminal_status}"
+                return
+
+
+async def consume(stream: AsyncGenerator[str, None]) -> List[str]:
+    return [frame async for frame in stream]
+
+
+async def run_streams(stream_func, runs: List[List[str]], batch_size: int) -> Tuple[List[List[str]], float]:
+    start = time.process_time()
+    frames = await asyncio.gather(*(consume(stream_func(responses, batch_size)) for responses in runs))
+    return frames, time.process_time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SSE writing of stored agent run responses")
+    parser.add_argument("--streams", type=int, default=300, help="Concurrent simulated streams")
+    parser.add_argument("--responses", type=int, default=500, help="Stored responses per stream")
+    parser.add_argument("--batch-size", type=int, default=20, help="Responses read per notification")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"Checked {check_status_writers()} status updates written by the backend for the prefix {STATUS_PREFIX!r}")
+
+    rng = random.Random(args.seed)
+    runs = [synthetic_responses(args.responses, rng) for _ in range(args.streams)]
+
+    redump_frames, redump_time = asyncio.run(run_streams(stream_parse_and_redump, runs, args.batch_size))
+    pass_through_frames, pass_through_time = asyncio.run(run_streams(stream_pass_through, runs, args.batch_size))
+    assert redump_frames == pass_through_frames, "Streams differ between the two paths"
+
+    speedup = redump_time / pass_through_time if pass_through_time else float("inf")
+    print(f"{args.streams} streams of {args.responses} responses")
+    print(f"{'parse and redump':<18} {redump_time:>8.3f}s CPU")
+    print(f"{'pass-through':<18} {pass_through_time:>8.3f}s CPU ({speedup:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
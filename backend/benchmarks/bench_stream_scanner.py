@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark of <function_calls> extraction from streamed content
+
+Replays create_file streams through the previous extraction, which re-ran
+ResponseProcessor._extract_xml_chunks over the whole buffer on every delta and
+removed found blocks with str.replace, and through FunctionCallsStreamScanner.
+Reports the CPU time of both and asserts they extract the same blocks and leave
+the same remaining content.
+
+Usage:
+    python benchmarks/bench_stream_scanner.py                     # Synthetic 50KB, 75KB and 100KB streams
+    python benchmarks/bench_stream_scanner.py --sizes 100000
+    python benchmarks/bench_stream_scanner.py --recorded deltas.json   # JSON list of recorded content deltas
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+# Add the backend directory to the path so we can import modules
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from agentpress.response_processor import ResponseProcessor
+from agentpress.tool_registry import ToolRegistry
+from agentpress.xml_tool_parser import FunctionCallsStreamScanner
+
+
+def synthetic_stream(file_size: int, seed: int) -> List[str]:
+    """A create_file call with about `file_size` characters of file content, split into token-sized deltas."""
+    rng = random.Random(seed)
+    lines = []
+    size = 0
+    while size < file_size:
+        line = f"    const value{len(lines)} = compute({rng.randint(0, 10_000)}, '<div class=\"row\">');"
+        lines.append(line)
+        size += len(line) + 1
+    content = (
+        "I'll create the file now.\n\n"
+        "<function_calls>\n"
+        "<invoke name=\"create_file\">\n"
+        "<parameter name=\"file_path\">src/app.js</parameter>\n"
+        f"<parameter name=\"file_contents\">{chr(10).join(lines)}</parameter>\n"
+        "</invoke>\n"
+        "</function_calls>\n\n"
+        "The file is ready."
+    )
+
+    deltas = []
+    pos = 0
+    while pos < len(content):
+        length = rng.randint(1, 24)
+        deltas.append(content[pos:pos + length])
+        pos += length
+    return deltas
+
+
+def run_rescan(processor: ResponseProcessor, deltas: List[str]) -> Tuple[List[str], str]:
+    """The previous extraction: rescan the whole buffer on every delta."""
+    blocks = []
+    current_xml_content = ""
+    for delta in deltas:
+        current_xml_content += delta
+        for xml_chunk in processor._extract_xml_chunks(current_xml_content):
+            current_xml_content = current_xml_content.replace(xml_chunk, "", 1)
+            blocks.append(xml_chunk)
+    return blocks, current_xml_content
+
+
+def run_scanner(deltas: List[str]) -> Tuple[List[str], str]:
+    """The incremental scanner used by process_streaming_response."""
+    blocks = []
+    scanner = FunctionCallsStreamScanner()
+    for delta in deltas:
+        blocks.extend(scanner.feed(delta))
+    return blocks, scanner.remaining_content()
+
+
+def measure(func, *args):
+    start = time.process_time()
+    result = func(*args)
+    return result, time.process_time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streamed <function_calls> extraction")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50_000, 75_000, 100_000], help="File content sizes of the synthetic streams")
+    parser.add_argument("--recorded", type=Path, help="JSON file with a list of recorded content deltas, replayed instead of synthetic streams")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.recorded:
+        streams = [(str(args.recorded), json.loads(args.recorded.read_text()))]
+    else:
+        streams = [(f"synthetic {size // 1000}KB", synthetic_stream(size, args.seed)) for size in args.sizes]
+
+    processor = ResponseProcessor(tool_registry=ToolRegistry(), add_message_callback=None)
+
+    print(f"{'stream':<20} {'deltas':>8} {'rescan CPU':>12} {'scanner CPU':>12} {'speedup':>9}")
+    for name, deltas in streams:
+        rescan_result, rescan_time = measure(run_rescan, processor, deltas)
+        scanner_result, scanner_time = measure(run_scanner, deltas)
+        assert rescan_result == scanner_result, f"Extractions differ for {name}"
+        speedup = rescan_time / scanner_time if scanner_time else float("inf")
+        print(f"{name:<20} {len(deltas):>8} {rescan_time:>11.3f}s {scanner_time:>11.3f}s {speedup:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
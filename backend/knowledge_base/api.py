@@ -5,6 +5,7 @@ from pydantic import BaseModel, Field, HttpUrl
 from utils.auth_utils import get_current_user_id_from_jwt, verify_agent_access
 from services.supabase import DBConnection
 from knowledge_base.file_processor import FileProcessor
+from knowledge_base.context_cache import bump_knowledge_base_revision
 from utils.logger import logger
 from flags.flags import is_enabled
 
@@ -159,6 +160,7 @@ async def create_agent_knowledge_base_entry(
             raise HTTPException(status_code=500, detail="Failed to create agent knowledge base entry")
         
         created_entry = result.data[0]
+        await bump_knowledge_base_revision(agent_id)
         
         return KnowledgeBaseEntryResponse(
             entry_id=created_entry['entry_id'],
@@ -287,6 +289,7 @@ async def update_knowledge_base_entry(
             raise HTTPException(status_code=500, detail="Failed to update knowledge base entry")
         
         updated_entry = result.data[0]
+        await bump_knowledge_base_revision(agent_id)
         
         logger.info(f"Updated agent knowledge base entry {entry_id} for agent {agent_id}")
         
@@ -340,6 +343,7 @@ async def delete_knowledge_base_entry(
         await verify_agent_access(client, agent_id, user_id)
         
         result = await client.table('agent_knowledge_base_entries').delete().eq('entry_id', entry_id).execute()
+        await bump_knowledge_base_revision(agent_id)
         
         logger.info(f"Deleted agent knowledge base entry {entry_id} for agent {agent_id}")
         
@@ -472,6 +476,7 @@ async def process_file_background(
         result = await processor.process_file_upload(
             agent_id, account_id, file_content, filename, mime_type
         )
+        await bump_knowledge_base_revision(agent_id)
         
         if result['success']:
             await client.rpc('update_agent_kb_job_status', {
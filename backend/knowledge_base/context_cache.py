@@ -0,0 +1,69 @@
+"""
+Cached knowledge base context for system prompts.
+
+The combined (agent + thread) knowledge base context is cached in Redis,
+addressed by thread, agent and the agent's knowledge base revision. Writes to
+agent knowledge base entries bump the revision, so cached contexts are never
+served after the agent's entries change. Thread entries are not written
+through the backend, so the TTL bounds how stale they can get.
+"""
+
+from typing import Optional
+
+from services import redis
+from services.supabase import DBConnection
+from utils.logger import logger
+
+KB_REVISION_KEY = "kb_revision:{agent_id}"
+KB_CONTEXT_KEY = "kb_context:{thread_id}:{agent_id}:{revision}"
+KB_CONTEXT_TTL = 300  # 5 minutes
+KB_CONTEXT_MAX_TOKENS = 4000
+
+
+async def bump_knowledge_base_revision(agent_id: str) -> None:
+    """Invalidate cached knowledge base contexts of an agent after its entries changed."""
+    try:
+        redis_client = await redis.get_client()
+        await redis_client.incr(KB_REVISION_KEY.format(agent_id=agent_id))
+    except Exception as e:
+        logger.warning(f"Failed to bump knowledge base revision for agent {agent_id}: {e}")
+
+
+async def get_combined_knowledge_base_context(thread_id: str, agent_id: Optional[str]) -> Optional[str]:
+    """Get the combined knowledge base context for a thread and agent, using the cache when possible.
+
+    Args:
+        thread_id: The thread the prompt is built for
+        agent_id: The agent whose knowledge base is included, if any
+
+    Returns:
+        The context text, or None if there is no knowledge base content
+    """
+    cache_key = None
+    try:
+        redis_client = await redis.get_client()
+        revision = await redis_client.get(KB_REVISION_KEY.format(agent_id=agent_id)) if agent_id else None
+        cache_key = KB_CONTEXT_KEY.format(thread_id=thread_id, agent_id=agent_id or "none", revision=revision or 0)
+        cached = await redis_client.get(cache_key)
+        if cached is not None:
+            return cached or None
+    except Exception as e:
+        logger.warning(f"Knowledge base context cache lookup failed for thread {thread_id}: {e}")
+
+    db = DBConnection()
+    client = await db.client
+    kb_result = await client.rpc('get_combined_knowledge_base_context', {
+        'p_thread_id': thread_id,
+        'p_agent_id': agent_id,
+        'p_max_tokens': KB_CONTEXT_MAX_TOKENS
+    }).execute()
+
+    context = kb_result.data if kb_result.data and kb_result.data.strip() else ""
+
+    if cache_key:
+        try:
+            await redis_client.set(cache_key, context, ex=KB_CONTEXT_TTL)
+        except Exception as e:
+            logger.warning(f"Failed to cache knowledge base context for thread {thread_id}: {e}")
+
+    return context or None
@@ -0,0 +1,263 @@
+"""
+Per-worker pool of initialized MCP client sessions.
+
+Opening a transport and running the MCP `initialize` handshake often costs
+more than the tool call itself. Sessions are kept open and reused for calls
+with the same (server URL, headers, external_user_id), so back-to-back calls
+to a server in a run share one initialized session.
+
+- Each session is owned by a dedicated task, because the MCP transports are
+  anyio context managers that must be entered and exited by the same task
+- Idle sessions are closed after `idle_timeout`; the others are pinged every
+  `health_check_interval` and dropped if the ping fails
+- A call on a reused session whose transport has already closed is retried
+  once on a new session; only when the request provably was not sent, since
+  tools are not idempotent
+- At most `max_concurrent_per_server` calls run concurrently per session key,
+  so tenants sharing a server URL (e.g. Pipedream) do not queue behind each other
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from contextlib import AbstractAsyncContextManager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import anyio
+from mcp import ClientSession
+
+from utils.logger import logger
+
+DEFAULT_IDLE_TIMEOUT = 300  # 5 minutes
+DEFAULT_HEALTH_CHECK_INTERVAL = 60
+DEFAULT_CONNECT_TIMEOUT = 30
+DEFAULT_CLOSE_TIMEOUT = 5
+DEFAULT_MAX_CONCURRENT_PER_SERVER = 8
+DEFAULT_MAX_SESSIONS = 100
+
+# Returns a transport context manager yielding (read_stream, write_stream, ...)
+TransportFactory = Callable[[], AbstractAsyncContextManager]
+SessionKey = Tuple[str, str, Optional[str]]
+
+
+def make_session_key(server_url: str, headers: Optional[Dict[str, Any]] = None, external_user_id: Optional[str] = None) -> SessionKey:
+    """Key of a pooled session; headers are hashed so credentials are not kept in the key."""
+    headers_hash = hashlib.sha256(json.dumps(headers or {}, sort_keys=True, default=str).encode()).hexdigest()
+    return (server_url, headers_hash, external_user_id)
+
+
+class _PooledSession:
+    """One initialized MCP session, kept open by its own task until closed."""
+
+    def __init__(self, key: SessionKey, transport_factory: TransportFactory):
+        self.key = key
+        self.session: Optional[ClientSession] = None
+        self.last_used = time.monotonic()
+        self.in_use = 0
+        self._transport_factory = transport_factory
+        self._ready: Optional[asyncio.Future] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def open(self, timeout: float) -> None:
+        self._ready = asyncio.get_running_loop().create_future()
+        # Nobody awaits the handshake after a connect timeout; mark its outcome as retrieved
+        self._ready.add_done_callback(lambda ready: ready.cancelled() or ready.exception())
+        self._closing = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(asyncio.shield(self._ready), timeout=timeout)
+        except BaseException:
+            await self.close()
+            raise
+
+    async def _run(self) -> None:
+        try:
+            async with self._transport_factory() as streams:
+                read_stream, write_stream = streams[0], streams[1]
+                async with ClientSession(read_stream, write_stream) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set_result(None)
+                    await self._closing.wait()
+        except BaseException as e:
+            if not self._ready.done():
+                self._ready.set_exception(e if isinstance(e, Exception) else ConnectionError(f"MCP session closed: {e!r}"))
+            elif not self._closing.is_set():
+                logger.warning(f"MCP session to {self.key[0]} ended unexpectedly: {e!r}")
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            self.session = None
+
+    async def close(self, timeout: float = DEFAULT_CLOSE_TIMEOUT) -> None:
+        if self._task is None:
+            return
+        self._closing.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        except BaseException as e:
+            logger.debug(f"Error closing MCP session to {self.key[0]}: {e!r}")
+
+
+class MCPSessionPool:
+    """Reuses initialized MCP sessions across tool calls of a worker."""
+
+    def __init__(
+        self,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        health_check_interval: float = DEFAULT_HEALTH_CHECK_INTERVAL,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        max_concurrent_per_server: int = DEFAULT_MAX_CONCURRENT_PER_SERVER,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+    ):
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.connect_timeout = connect_timeout
+        self.max_concurrent_per_server = max_concurrent_per_server
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[SessionKey, _PooledSession]" = OrderedDict()
+        self._open_locks: Dict[SessionKey, asyncio.Lock] = {}
+        self._server_limits: Dict[SessionKey, asyncio.Semaphore] = {}
+        # Calls holding or waiting for each limit, so idle limits can be dropped
+        self._limit_users: Dict[SessionKey, int] = {}
+        self._maintenance_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def call_tool(
+        self,
+        key: SessionKey,
+        transport_factory: TransportFactory,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        timeout: float = 30,
+    ):
+        """Call a tool on a pooled session of the server, opening one if needed."""
+        self._bind_to_running_loop()
+        server_limit = self._server_limits.setdefault(key, asyncio.Semaphore(self.max_concurrent_per_server))
+        self._limit_users[key] = self._limit_users.get(key, 0) + 1
+
+        try:
+            async with server_limit:
+                return await self._call_with_retry(key, transport_factory, tool_name, arguments, timeout)
+        finally:
+            self._limit_users[key] -= 1
+            self._drop_idle_limit(key)
+
+    async def _call_with_retry(
+        self,
+        key: SessionKey,
+        transport_factory: TransportFactory,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        timeout: float,
+    ):
+        for attempt in range(2):
+            pooled, reused = await self._acquire(key, transport_factory)
+            pooled.in_use += 1
+            try:
+                async with asyncio.timeout(timeout):
+                    return await pooled.session.call_tool(tool_name, arguments)
+            except (anyio.ClosedResourceError, anyio.BrokenResourceError) as e:
+                # Raised by the write to a transport that has closed, so the request was never sent
+                await self._discard(pooled)
+                if attempt == 0 and reused:
+                    logger.info(f"Pooled MCP session to {key[0]} was closed, reconnecting: {e!r}")
+                    continue
+                raise
+            except Exception as e:
+                # The request may have reached the server, so it is not retried. A JSON-RPC
+                # error leaves the session usable; a timeout or dead transport does not
+                if isinstance(e, TimeoutError) or not pooled.alive:
+                    await self._discard(pooled)
+                raise
+            finally:
+                pooled.in_use -= 1
+                pooled.last_used = time.monotonic()
+
+    async def _acquire(self, key: SessionKey, transport_factory: TransportFactory) -> Tuple[_PooledSession, bool]:
+        pooled = self._sessions.get(key)
+        if pooled is not None and pooled.alive:
+            self._sessions.move_to_end(key)
+            return pooled, True
+
+        lock = self._open_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            pooled = self._sessions.get(key)
+            if pooled is not None and pooled.alive:
+                return pooled, True
+            if pooled is not None:
+                await self._discard(pooled)
+
+            pooled = _PooledSession(key, transport_factory)
+            await pooled.open(self.connect_timeout)
+            self._sessions[key] = pooled
+            logger.debug(f"Opened pooled MCP session to {key[0]} ({len(self._sessions)} open)")
+            await self._evict_over_capacity(keep=pooled)
+            self._ensure_maintenance()
+            return pooled, False
+
+    async def _discard(self, pooled: _PooledSession) -> None:
+        if self._sessions.get(pooled.key) is pooled:
+            del self._sessions[pooled.key]
+            lock = self._open_locks.get(pooled.key)
+            if lock is not None and not lock.locked():
+                del self._open_locks[pooled.key]
+        self._drop_idle_limit(pooled.key)
+        await pooled.close()
+
+    def _drop_idle_limit(self, key: SessionKey) -> None:
+        # Limits live as long as their session or the calls using them
+        if key not in self._sessions and not self._limit_users.get(key):
+            self._server_limits.pop(key, None)
+            self._limit_users.pop(key, None)
+
+    async def _evict_over_capacity(self, keep: _PooledSession) -> None:
+        for pooled in list(self._sessions.values()):
+            if len(self._sessions) <= self.max_sessions:
+                break
+            if pooled.in_use == 0 and pooled is not keep:
+                await self._discard(pooled)
+
+    def _bind_to_running_loop(self) -> None:
+        # Sessions and semaphores belong to the loop that created them
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._sessions.clear()
+            self._open_locks.clear()
+            self._server_limits.clear()
+            self._limit_users.clear()
+            self._maintenance_task = None
+
+    def _ensure_maintenance(self) -> None:
+        if self._maintenance_task is None or self._maintenance_task.done():
+            self._maintenance_task = asyncio.create_task(self._maintain())
+
+    async def _maintain(self) -> None:
+        while self._sessions:
+            await asyncio.sleep(self.health_check_interval)
+            now = time.monotonic()
+            for pooled in list(self._sessions.values()):
+                if pooled.in_use:
+                    continue
+                if not pooled.alive or now - pooled.last_used > self.idle_timeout:
+                    await self._discard(pooled)
+                    continue
+                try:
+                    async with asyncio.timeout(self.connect_timeout):
+                        await pooled.session.send_ping()
+                except Exception as e:
+                    logger.info(f"Health check of pooled MCP session to {pooled.key[0]} failed: {e!r}")
+                    await self._discard(pooled)
+
+
+mcp_session_pool = MCPSessionPool()
@@ -8,7 +8,10 @@ import traceback
 from datetime import datetime, timezone
 from typing import Optional
 from services import redis
+from services.redis_batch_writer import RedisResponseWriter
 from agent.run import run_agent
+from sandbox.handle_cache import sandbox_handle_cache
+from services.billing import reconcile_monthly_usage
 from utils.logger import logger, structlog
 import dramatiq
 import uuid
@@ -51,6 +54,16 @@ async def check_health(key: str):
     structlog.contextvars.clear_contextvars()
     await redis.set(key, "healthy", ex=redis.REDIS_KEY_TTL)
 
+@dramatiq.actor
+async def reconcile_usage_ledger(account_id: str):
+    """Recompute an account's monthly usage ledger from its usage messages."""
+    structlog.contextvars.clear_contextvars()
+    structlog.contextvars.bind_contextvars(account_id=account_id)
+    await initialize()
+    client = await db.client
+    total_cost = await reconcile_monthly_usage(client, account_id)
+    logger.info(f"Reconciled usage ledger for account {account_id}: {total_cost}")
+
 @dramatiq.actor
 async def run_agent_background(
     agent_run_id: str,
@@ -122,6 +135,7 @@ async def run_agent_background(
     total_responses = 0
     pubsub = None
     stop_checker = None
+    response_writer = None
     stop_signal_received = False
 
     # Define Redis keys and channels
@@ -171,6 +185,12 @@ async def run_agent_background(
         # Ensure active run key exists and has TTL
         await redis.set(instance_active_key, "running", ex=redis.REDIS_KEY_TTL)
 
+        # Streamed responses are appended and announced in batches
+        response_writer = RedisResponseWriter(response_list_key, response_channel)
+        response_writer.start()
+
+        # Wake the project's sandbox here rather than in start_agent, reporting progress on the stream
+        await _ensure_sandbox_ready(client, project_id, response_writer)
 
         # Initialize agent generator
         agent_gen = run_agent(
@@ -187,8 +207,6 @@ async def run_agent_background(
         final_status = "running"
         error_message = None
 
-        pending_redis_operations = []
-
         async for response in agent_gen:
             if stop_signal_received:
                 logger.info(f"Agent run {agent_run_id} stopped by signal.")
@@ -197,9 +215,7 @@ async def run_agent_background(
                 break
 
             # Store response in Redis list and publish notification
-            response_json = json.dumps(response)
-            pending_redis_operations.append(asyncio.create_task(redis.rpush(response_list_key, response_json)))
-            pending_redis_operations.append(asyncio.create_task(redis.publish(response_channel, "new")))
+            await response_writer.write(json.dumps(response))
             total_responses += 1
 
             # Check for agent-signaled completion or error
@@ -219,8 +235,10 @@ async def run_agent_background(
              logger.info(f"Agent run {agent_run_id} completed normally (duration: {duration:.2f}s, responses: {total_responses})")
              completion_message = {"type": "status", "status": "completed", "message": "Agent run completed successfully"}
              trace.span(name="agent_run_completed").end(status_message="agent_run_completed")
-             await redis.rpush(response_list_key, json.dumps(completion_message))
-             await redis.publish(response_channel, "new") # Notify about the completion message
+             await response_writer.write(json.dumps(completion_message))
+
+        # Make sure every streamed response is in Redis before reading the list back
+        await response_writer.close()
 
         # Fetch final responses from Redis for DB update
         all_responses_json = await redis.lrange(response_list_key, 0, -1)
@@ -246,6 +264,10 @@ async def run_agent_background(
         final_status = "failed"
         trace.span(name="agent_run_failed").end(status_message=error_message, level="ERROR")
 
+        # Write out responses streamed before the error so the error message comes last
+        if response_writer:
+            await response_writer.close()
+
         # Push error message to Redis list
         error_response = {"type": "status", "status": "error", "message": error_message}
         try:
@@ -290,6 +312,10 @@ async def run_agent_background(
             except Exception as e:
                 logger.warning(f"Error closing pubsub for {agent_run_id}: {str(e)}")
 
+        # Flush any responses still pending (no-op if already closed)
+        if response_writer:
+            await response_writer.close(timeout=30.0)
+
         # Set TTL on the response list in Redis
         await _cleanup_redis_response_list(agent_run_id)
 
@@ -299,14 +325,37 @@ async def run_agent_background(
         # Clean up the run lock
         await _cleanup_redis_run_lock(agent_run_id)
 
-        # Wait for all pending redis operations to complete, with timeout
-        try:
-            await asyncio.wait_for(asyncio.gather(*pending_redis_operations), timeout=30.0)
-        except asyncio.TimeoutError:
-            logger.warning(f"Timeout waiting for pending Redis operations for {agent_run_id}")
-
         logger.info(f"Agent run background task fully completed for: {agent_run_id} (Instance: {instance_id}) with final status: {final_status}")
 
+def _sandbox_status_message(status_type: str, message: str, **details) -> Dict[str, Any]:
+    """Build a status message for the run's stream, in the format of AgentPress status messages."""
+    return {
+        "type": "status",
+        "content": json.dumps({"status_type": status_type, "message": message, **details}),
+        "metadata": json.dumps({}),
+    }
+
+async def _ensure_sandbox_ready(client, project_id: str, response_writer: RedisResponseWriter):
+    """Start the project's sandbox if it is stopped or archived, before the agent needs it."""
+    project_result = await client.table('projects').select('sandbox').eq('project_id', project_id).execute()
+    sandbox_info = (project_result.data[0].get('sandbox') or {}) if project_result.data else {}
+    sandbox_id = sandbox_info.get('id')
+    if not sandbox_id:
+        logger.warning(f"No sandbox found for project {project_id}, skipping sandbox wake-up")
+        return
+
+    await response_writer.write(json.dumps(_sandbox_status_message("sandbox_starting", "Preparing sandbox", sandbox_id=sandbox_id)))
+    start_time = datetime.now(timezone.utc)
+    try:
+        # Warms the handle cache, so the sandbox tools of this run skip their own lookup
+        await sandbox_handle_cache.get(project_id, sandbox_id, sandbox_info.get('pass'))
+    except Exception as e:
+        raise Exception(f"Failed to initialize sandbox: {str(e)}") from e
+
+    duration = (datetime.now(timezone.utc) - start_time).total_seconds()
+    logger.info(f"Sandbox {sandbox_id} for project {project_id} ready after {duration:.2f}s")
+    await response_writer.write(json.dumps(_sandbox_status_message("sandbox_ready", "Sandbox ready", sandbox_id=sandbox_id)))
+
 async def _cleanup_redis_instance_key(agent_run_id: str):
     """Clean up the instance-specific Redis key for an agent run."""
     if not instance_id:
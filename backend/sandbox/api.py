@@ -7,7 +7,8 @@ from fastapi.responses import Response
 from pydantic import BaseModel
 from daytona_sdk import AsyncSandbox
 
-from sandbox.sandbox import get_or_start_sandbox, delete_sandbox
+from sandbox.sandbox import delete_sandbox
+from sandbox.handle_cache import sandbox_handle_cache
 from utils.logger import logger
 from utils.auth_utils import get_optional_user_id
 from services.supabase import DBConnection
@@ -127,16 +128,12 @@ async def get_sandbox_by_id_safely(client, sandbox_id: str) -> AsyncSandbox:
         logger.error(f"No project found for sandbox ID: {sandbox_id}")
         raise HTTPException(status_code=404, detail="Sandbox not found - no project owns this sandbox ID")
     
-    # project_id = project_result.data[0]['project_id']
-    # logger.debug(f"Found project {project_id} for sandbox {sandbox_id}")
+    project_id = project_result.data[0]['project_id']
     
     try:
-        # Get the sandbox
-        sandbox = await get_or_start_sandbox(sandbox_id)
-        # Extract just the sandbox object from the tuple (sandbox, sandbox_id, sandbox_pass)
-        # sandbox = sandbox_tuple[0]
-            
-        return sandbox
+        # Get the sandbox, reusing a recently started handle of the project if there is one
+        handle = await sandbox_handle_cache.get(project_id, sandbox_id)
+        return handle.sandbox
     except Exception as e:
         logger.error(f"Error retrieving sandbox {sandbox_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to retrieve sandbox: {str(e)}")
@@ -321,6 +318,7 @@ async def delete_sandbox_route(
     
     try:
         # Delete the sandbox using the sandbox module function
+        sandbox_handle_cache.invalidate(sandbox_id=sandbox_id)
         await delete_sandbox(sandbox_id)
         
         return {"status": "success", "deleted": True, "sandbox_id": sandbox_id}
@@ -377,7 +375,7 @@ async def ensure_project_sandbox_active(
         
         # Get or start the sandbox
         logger.info(f"Ensuring sandbox is active for project {project_id}")
-        sandbox = await get_or_start_sandbox(sandbox_id)
+        await sandbox_handle_cache.get(project_id, sandbox_id, sandbox_info.get('pass'))
         
         logger.info(f"Successfully ensured sandbox {sandbox_id} is active for project {project_id}")
         
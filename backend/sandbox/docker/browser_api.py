@@ -1,4 +1,4 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Body
+from fastapi import FastAPI, APIRouter, HTTPException, Body, Depends, Query, Request, Response
 from playwright.async_api import async_playwright, Browser, BrowserContext, Page
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
@@ -6,16 +6,41 @@ import asyncio
 import json
 import logging
 import base64
+import hashlib
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
 from dataclasses import dataclass, field
 from datetime import datetime
 import os
 import random
 from functools import cached_property
 import traceback
+import uuid
 import pytesseract
 from PIL import Image
 import io
 
+#######################################################
+# OCR
+#######################################################
+
+# tesseract runs as a subprocess, so a thread pool keeps OCR off the event loop
+OCR_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ocr")
+OCR_CACHE_SIZE = 64
+
+# Whether the current request asked for OCR of its screenshot (`?ocr=true`)
+ocr_requested: ContextVar[bool] = ContextVar("ocr_requested", default=False)
+
+async def read_ocr_option(ocr: bool = Query(False, description="Run OCR on the screenshot of the action result")):
+    ocr_requested.set(ocr)
+
+def ocr_image(image_bytes: bytes) -> str:
+    """Extract the text of an encoded image; blocking, run it in OCR_EXECUTOR"""
+    image = Image.open(io.BytesIO(image_bytes))
+    return pytesseract.image_to_string(image).strip()
+
 #######################################################
 # Action model definitions
 #######################################################
@@ -264,6 +289,8 @@ class BrowserActionResult(BaseModel):
     pixels_below: int = 0
     content: Optional[str] = None
     ocr_text: Optional[str] = None  # Added field for OCR text
+    ocr_time_ms: Optional[int] = None  # Time spent on OCR, if it was requested
+    ocr_cached: Optional[bool] = None  # Whether the OCR text was reused from an identical screenshot
     
     # Additional metadata
     element_count: int = 0  # Number of interactive elements found
@@ -280,7 +307,7 @@ class BrowserActionResult(BaseModel):
 
 class BrowserAutomation:
     def __init__(self):
-        self.router = APIRouter()
+        self.router = APIRouter(dependencies=[Depends(read_ocr_option)])
         self.browser: Browser = None
         self.browser_context: BrowserContext = None
         self.pages: List[Page] = []
@@ -289,6 +316,8 @@ class BrowserAutomation:
         self.include_attributes = ["id", "href", "src", "alt", "aria-label", "placeholder", "name", "role", "title", "value"]
         self.screenshot_dir = os.path.join(os.getcwd(), "screenshots")
         os.makedirs(self.screenshot_dir, exist_ok=True)
+        # Screenshot hash -> OCR text
+        self.ocr_cache: OrderedDict[str, str] = OrderedDict()
         
         # Register routes
         self.router.on_startup.append(self.startup)
@@ -678,27 +707,35 @@ class BrowserAutomation:
             print(f"Error saving screenshot: {e}")
             return ""
     
-    async def extract_ocr_text_from_screenshot(self, screenshot_base64: str) -> str:
-        """Extract text from screenshot using OCR"""
+    async def extract_ocr_text_from_screenshot(self, screenshot_base64: str) -> tuple:
+        """Extract text from screenshot using OCR, off the event loop
+        Returns a tuple of (ocr_text, cached)
+        """
         if not screenshot_base64:
-            return ""
+            return "", False
             
         try:
-            # Decode base64 to image
+            # Decode base64 to image bytes
             image_bytes = base64.b64decode(screenshot_base64)
-            image = Image.open(io.BytesIO(image_bytes))
             
-            # Extract text using pytesseract
-            ocr_text = pytesseract.image_to_string(image)
+            # Screenshots that are byte for byte identical are not OCR'd again
+            screenshot_hash = hashlib.sha256(image_bytes).hexdigest()
+            if screenshot_hash in self.ocr_cache:
+                self.ocr_cache.move_to_end(screenshot_hash)
+                return self.ocr_cache[screenshot_hash], True
+            
+            # Extract text using pytesseract, off the event loop
+            ocr_text = await asyncio.get_running_loop().run_in_executor(OCR_EXECUTOR, ocr_image, image_bytes)
             
-            # Clean up the text
-            ocr_text = ocr_text.strip()
+            self.ocr_cache[screenshot_hash] = ocr_text
+            while len(self.ocr_cache) > OCR_CACHE_SIZE:
+                self.ocr_cache.popitem(last=False)
             
-            return ocr_text
+            return ocr_text, False
         except Exception as e:
             print(f"Error performing OCR: {e}")
             traceback.print_exc()
-            return ""
+            return "", False
     
     async def get_updated_browser_state(self, action_name: str) -> tuple:
         """Helper method to get updated browser state after any action
@@ -760,11 +797,13 @@ class BrowserAutomation:
                 metadata['viewport_width'] = 0
                 metadata['viewport_height'] = 0
             
-            # Extract OCR text from screenshot if available
-            ocr_text = ""
-            if screenshot:
-                ocr_text = await self.extract_ocr_text_from_screenshot(screenshot)
+            # Extract OCR text from screenshot if available and requested
+            if screenshot and ocr_requested.get():
+                ocr_start = time.perf_counter()
+                ocr_text, ocr_cached = await self.extract_ocr_text_from_screenshot(screenshot)
                 metadata['ocr_text'] = ocr_text
+                metadata['ocr_cached'] = ocr_cached
+                metadata['ocr_time_ms'] = round((time.perf_counter() - ocr_start) * 1000)
             
             print(f"Got updated state after {action_name}: {len(dom_state.selector_map)} elements")
             return dom_state, screenshot, elements, metadata
@@ -794,6 +833,8 @@ class BrowserAutomation:
             pixels_below=dom_state.pixels_below if dom_state else 0,
             content=content,
             ocr_text=metadata.get('ocr_text', ""),
+            ocr_time_ms=metadata.get('ocr_time_ms'),
+            ocr_cached=metadata.get('ocr_cached'),
             element_count=metadata.get('element_count', 0),
             interactive_elements=metadata.get('interactive_elements', []),
             viewport_width=metadata.get('viewport_width', 0),
@@ -1844,6 +1885,42 @@ automation_service = BrowserAutomation()
 # Create API app
 api_app = FastAPI()
 
+@api_app.middleware("http")
+async def binary_screenshot_transfer(request: Request, call_next):
+    """Send the screenshot of an action result as a binary part instead of base64 JSON.
+
+    Clients opt in with `Accept: multipart/mixed`. The response then holds the
+    result without `screenshot_base64` as an application/json part, followed by
+    the screenshot as an image/jpeg part if there is one.
+    """
+    response = await call_next(request)
+    if (
+        "multipart/mixed" not in request.headers.get("accept", "")
+        or response.status_code >= 400
+        or response.headers.get("content-type") != "application/json"
+    ):
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    try:
+        result = json.loads(body)
+    except json.JSONDecodeError:
+        return Response(content=body, status_code=response.status_code, media_type="application/json")
+    if not isinstance(result, dict):
+        return Response(content=body, status_code=response.status_code, media_type="application/json")
+
+    screenshot_base64 = result.pop("screenshot_base64", None)
+    parts = [("application/json", json.dumps(result).encode("utf-8"))]
+    if screenshot_base64:
+        parts.append(("image/jpeg", base64.b64decode(screenshot_base64)))
+
+    boundary = uuid.uuid4().hex
+    content = b"".join(
+        f"--{boundary}\r\nContent-Type: {content_type}\r\nContent-Length: {len(data)}\r\n\r\n".encode("ascii") + data + b"\r\n"
+        for content_type, data in parts
+    ) + f"--{boundary}--\r\n".encode("ascii")
+    return Response(content=content, status_code=response.status_code, media_type=f"multipart/mixed; boundary={boundary}")
+
 @api_app.get("/api")
 async def health_check():
     return {"status": "ok", "message": "API server is running"}
@@ -1856,6 +1933,7 @@ async def test_browser_api():
     try:
         # Initialize browser automation
         print("\n=== Starting Browser Automation Test ===")
+        ocr_requested.set(True)
         await automation_service.startup()
         print("✅ Browser started successfully")
 
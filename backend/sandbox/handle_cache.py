@@ -0,0 +1,131 @@
+"""
+Per-process cache of started sandbox handles, keyed by project_id.
+
+Every sandbox tool of a run used to read the project row and call
+`get_or_start_sandbox` (a Daytona round-trip) on its first use. Handles are now
+shared for `SANDBOX_HANDLE_TTL` seconds, and concurrent lookups of the same
+project wait for a single load instead of each starting their own.
+
+The TTL is kept well below the sandbox auto-stop interval, so a cached handle
+refers to a sandbox that was running when it was cached; failed loads are not
+cached.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional
+
+from daytona_sdk import AsyncSandbox
+from sandbox.sandbox import get_or_start_sandbox
+from utils.logger import logger
+
+SANDBOX_HANDLE_TTL = 120  # 2 minutes
+SANDBOX_HANDLE_CACHE_SIZE = 1000
+
+
+@dataclass
+class SandboxHandle:
+    sandbox: AsyncSandbox
+    sandbox_id: str
+    sandbox_pass: Optional[str]
+    expires_at: float
+
+
+class SandboxHandleCache:
+    """TTL-bounded LRU of sandbox handles with single-flight loading."""
+
+    def __init__(self, ttl: float = SANDBOX_HANDLE_TTL, max_size: int = SANDBOX_HANDLE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._handles: "OrderedDict[str, SandboxHandle]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Task] = {}
+
+    def _get_cached(self, project_id: str) -> Optional[SandboxHandle]:
+        handle = self._handles.get(project_id)
+        if handle is None:
+            return None
+        if handle.expires_at <= time.monotonic():
+            self._handles.pop(project_id, None)
+            return None
+        self._handles.move_to_end(project_id)
+        return handle
+
+    async def _load(self, project_id: str, loader: Callable[[], Awaitable[SandboxHandle]]) -> SandboxHandle:
+        task = self._loading.get(project_id)
+        if task is None or task.done():
+            task = asyncio.create_task(loader())
+            self._loading[project_id] = task
+            task.add_done_callback(lambda done: self._loading_finished(project_id, done))
+
+        # Shield the shared load so one cancelled caller does not fail the others
+        handle = await asyncio.shield(task)
+        self._handles[project_id] = handle
+        self._handles.move_to_end(project_id)
+        while len(self._handles) > self.max_size:
+            self._handles.popitem(last=False)
+        return handle
+
+    def _loading_finished(self, project_id: str, task: asyncio.Task) -> None:
+        if self._loading.get(project_id) is task:
+            del self._loading[project_id]
+
+    async def _start(self, sandbox_id: str, sandbox_pass: Optional[str]) -> SandboxHandle:
+        sandbox = await get_or_start_sandbox(sandbox_id)
+        return SandboxHandle(
+            sandbox=sandbox,
+            sandbox_id=sandbox_id,
+            sandbox_pass=sandbox_pass,
+            expires_at=time.monotonic() + self.ttl,
+        )
+
+    async def get_for_project(self, client, project_id: str) -> SandboxHandle:
+        """Get the started sandbox of a project, reading the project row on a cache miss.
+
+        Raises:
+            ValueError: If the project does not exist or has no sandbox
+        """
+        handle = self._get_cached(project_id)
+        if handle is not None:
+            return handle
+
+        async def load() -> SandboxHandle:
+            project = await client.table('projects').select('sandbox').eq('project_id', project_id).execute()
+            if not project.data:
+                raise ValueError(f"Project {project_id} not found")
+
+            sandbox_info = project.data[0].get('sandbox') or {}
+            if not sandbox_info.get('id'):
+                raise ValueError(f"No sandbox found for project {project_id}")
+
+            return await self._start(sandbox_info['id'], sandbox_info.get('pass'))
+
+        return await self._load(project_id, load)
+
+    async def get(self, project_id: str, sandbox_id: str, sandbox_pass: Optional[str] = None) -> SandboxHandle:
+        """Get the started sandbox of a project whose sandbox ID is already known."""
+        handle = self._get_cached(project_id)
+        if handle is not None and handle.sandbox_id == sandbox_id:
+            return handle
+
+        loading = self._loading.get(project_id)
+        if loading is not None and not loading.done():
+            handle = await asyncio.shield(loading)
+            if handle.sandbox_id == sandbox_id:
+                return handle
+
+        return await self._load(project_id, lambda: self._start(sandbox_id, sandbox_pass))
+
+    def invalidate(self, project_id: Optional[str] = None, sandbox_id: Optional[str] = None) -> None:
+        """Drop the cached handle of a project and/or of a sandbox."""
+        if project_id is not None:
+            self._handles.pop(project_id, None)
+        if sandbox_id is not None:
+            for cached_project_id, handle in list(self._handles.items()):
+                if handle.sandbox_id == sandbox_id:
+                    self._handles.pop(cached_project_id, None)
+                    logger.debug(f"Invalidated cached handle of sandbox {sandbox_id}")
+
+
+sandbox_handle_cache = SandboxHandleCache()
@@ -22,6 +22,12 @@ from fastapi import HTTPException
 from utils.logger import logger
 from services.supabase import DBConnection
 from services import redis
+from services.auth_cache import (
+    API_KEY_L1_TTL,
+    cache_api_key_validation,
+    get_cached_api_key_validation,
+    invalidate_api_key_validation,
+)
 from utils.config import config
 
 
@@ -96,6 +102,7 @@ class APIKeyService:
     Performance Features:
     - HMAC-SHA256 hashing (100x faster than bcrypt)
     - Redis caching for validation results (2min TTL)
+    - In-process L1 cache in front of Redis (30s TTL, invalidated via pub/sub on revoke/delete)
     - Throttled last_used_at updates (max once per 15min per key, configurable)
     - Cached user lookups (5min TTL)
     - Asynchronous operations where possible
@@ -146,6 +153,10 @@ class APIKeyService:
         secret = self._get_secret_key().encode("utf-8")
         return hmac.new(secret, secret_key.encode("utf-8"), hashlib.sha256).hexdigest()
 
+    def _validation_cache_key(self, public_key: str, secret_key_hash: str) -> str:
+        """Cache key of a validation result, derived from the key pair's HMAC hash"""
+        return f"api_key:{public_key}:{secret_key_hash[:8]}"
+
     def _verify_secret_key(self, secret_key: str, hashed_key: str) -> bool:
         """
         Verify a secret key against its hash using constant-time comparison
@@ -315,6 +326,8 @@ class APIKeyService:
             if not result.data:
                 raise HTTPException(status_code=404, detail="API key not found")
 
+            await self._invalidate_cached_validation(result.data[0])
+
             logger.info(
                 "API key revoked successfully",
                 account_id=str(account_id),
@@ -349,8 +362,12 @@ class APIKeyService:
                     is_valid=False, error_message="Invalid API key format"
                 )
 
-            # Check Redis cache first (cache key includes secret hash for security)
-            cache_key = f"api_key:{public_key}:{self._hash_secret_key(secret_key)[:8]}"
+            # Check the in-process cache, then Redis (cache key includes secret hash for security)
+            cache_key = self._validation_cache_key(public_key, self._hash_secret_key(secret_key))
+
+            local_result = get_cached_api_key_validation(cache_key)
+            if local_result is not None:
+                return local_result
 
             try:
                 redis_client = await redis.get_client()
@@ -360,7 +377,7 @@ class APIKeyService:
 
                     cached_data = json.loads(cached_result)
                     logger.debug(f"API key validation cache hit for {public_key}")
-                    return APIKeyValidationResult(
+                    validation_result = APIKeyValidationResult(
                         is_valid=cached_data["is_valid"],
                         account_id=(
                             UUID(cached_data["account_id"])
@@ -374,6 +391,8 @@ class APIKeyService:
                         ),
                         error_message=cached_data.get("error_message"),
                     )
+                    cache_api_key_validation(cache_key, validation_result, ttl=API_KEY_L1_TTL)
+                    return validation_result
             except Exception as e:
                 logger.warning(f"Redis cache lookup failed: {e}")
                 # Continue without cache
@@ -456,7 +475,8 @@ class APIKeyService:
     async def _cache_validation_result(
         self, cache_key: str, result: APIKeyValidationResult, ttl: int = 120
     ):
-        """Cache validation result in Redis"""
+        """Cache validation result in Redis and in the in-process cache"""
+        cache_api_key_validation(cache_key, result, ttl=ttl)
         try:
             redis_client = await redis.get_client()
             import json
@@ -471,6 +491,13 @@ class APIKeyService:
         except Exception as e:
             logger.warning(f"Failed to cache validation result: {e}")
 
+    async def _invalidate_cached_validation(self, key_data: Dict):
+        """Stop serving a cached successful validation of a key on every node"""
+        if key_data.get("public_key") and key_data.get("secret_key_hash"):
+            await invalidate_api_key_validation(
+                self._validation_cache_key(key_data["public_key"], key_data["secret_key_hash"])
+            )
+
     async def _update_last_used_throttled(self, key_id: str):
         """Update last used timestamp with throttling to reduce DB load"""
         throttle_interval = config.API_KEY_LAST_USED_THROTTLE_SECONDS
@@ -564,6 +591,8 @@ class APIKeyService:
             if not result.data:
                 raise HTTPException(status_code=404, detail="API key not found")
 
+            await self._invalidate_cached_validation(result.data[0])
+
             logger.info(
                 "API key deleted successfully",
                 account_id=str(account_id),
@@ -0,0 +1,161 @@
+"""
+In-process L1 caches for request authentication and authorization.
+
+API key validation results and account -> user lookups are cached in Redis,
+which still costs a round-trip on every request. These small LRU caches sit in
+front of Redis for a few seconds so clients polling the API at high frequency
+are authenticated without leaving the process.
+
+Revoking or deleting an API key publishes its cache key on
+`INVALIDATION_CHANNEL`, and every process listening drops its local entry.
+These entries are only served while the process is subscribed to that
+channel, so a process that could miss an invalidation falls back to Redis
+instead.
+
+Thread access decisions are cached the same way in front of the database.
+Project sharing and account membership are changed by the frontend directly
+in the database, so nothing here can invalidate them; they are only kept for
+a few seconds instead.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+from services import redis
+from utils.logger import logger
+
+INVALIDATION_CHANNEL = "auth_cache:invalidate"
+API_KEY_L1_TTL = 30
+ACCOUNT_USER_L1_TTL = 60
+# Grants through a public project are revoked from the share dialog, keep them shorter
+THREAD_ACCESS_MEMBER_TTL = 30
+THREAD_ACCESS_PUBLIC_TTL = 10
+L1_MAX_SIZE = 10000
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 30.0
+
+
+class LocalTTLCache:
+    """Bounded LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, ttl: float, max_size: int = L1_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class _InvalidationListener:
+    """Keeps one subscription to the invalidation channel per process."""
+
+    def __init__(self, handler: Callable[[str], None], caches: Tuple[LocalTTLCache, ...]):
+        self._handler = handler
+        self._caches = caches
+        self._task: Optional[asyncio.Task] = None
+        self.subscribed = False
+
+    def ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        delay = RECONNECT_DELAY
+        while True:
+            pubsub = None
+            try:
+                pubsub = await redis.create_pubsub()
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Entries cached while unsubscribed may have missed an invalidation
+                for cache in self._caches:
+                    cache.clear()
+                self.subscribed = True
+                delay = RECONNECT_DELAY
+
+                async for message in pubsub.listen():
+                    if not message or message.get("type") != "message":
+                        continue
+                    data = message.get("data")
+                    if isinstance(data, bytes): data = data.decode('utf-8')
+                    self._handler(data)
+
+                logger.warning("Auth cache invalidation listener ended, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Auth cache invalidation listener failed, reconnecting in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            finally:
+                self.subscribed = False
+                if pubsub:
+                    try:
+                        await pubsub.unsubscribe(INVALIDATION_CHANNEL)
+                        await pubsub.close()
+                    except Exception as e:
+                        logger.debug(f"Error closing auth cache pubsub: {e}")
+
+
+api_key_cache = LocalTTLCache(ttl=API_KEY_L1_TTL)
+account_user_cache = LocalTTLCache(ttl=ACCOUNT_USER_L1_TTL)
+# "user_id:thread_id" of threads the user may access
+thread_access_cache = LocalTTLCache(ttl=THREAD_ACCESS_MEMBER_TTL)
+
+_listener = _InvalidationListener(api_key_cache.invalidate, (api_key_cache,))
+
+
+def get_cached_api_key_validation(cache_key: str) -> Optional[Any]:
+    """Return a locally cached validation result, if it can be trusted."""
+    _listener.ensure_started()
+    if not _listener.subscribed:
+        return None
+    return api_key_cache.get(cache_key)
+
+
+def cache_api_key_validation(cache_key: str, result: Any, ttl: float) -> None:
+    if _listener.subscribed:
+        api_key_cache.set(cache_key, result, ttl)
+
+
+async def invalidate_api_key_validation(cache_key: str) -> None:
+    """Drop a validation result from Redis and from the L1 cache of every process."""
+    api_key_cache.invalidate(cache_key)
+    try:
+        await redis.delete(cache_key)
+        await redis.publish(INVALIDATION_CHANNEL, cache_key)
+    except Exception as e:
+        logger.error(f"Failed to invalidate cached API key validation {cache_key}: {e}")
+
+
+def has_cached_thread_access(user_id: str, thread_id: str) -> bool:
+    """Whether the user was granted access to the thread in the last few seconds."""
+    return thread_access_cache.get(f"{user_id}:{thread_id}") is not None
+
+
+def cache_thread_access(user_id: str, thread_id: str, via_public_project: bool) -> None:
+    ttl = THREAD_ACCESS_PUBLIC_TTL if via_public_project else THREAD_ACCESS_MEMBER_TTL
+    thread_access_cache.set(f"{user_id}:{thread_id}", True, ttl)
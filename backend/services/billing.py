@@ -5,12 +5,17 @@ stripe listen --forward-to localhost:8000/api/billing/webhook
 """
 
 from fastapi import APIRouter, HTTPException, Depends, Request
-from typing import Optional, Dict, Tuple
+from typing import Optional, Dict, Tuple, Any, List, NamedTuple
 import stripe
+import asyncio
+import json
+from collections import defaultdict
+from functools import lru_cache
 from datetime import datetime, timezone, timedelta
 from utils.logger import logger
 from utils.config import config, EnvMode
 from services.supabase import DBConnection
+from services import redis
 from utils.auth_utils import get_current_user_id_from_jwt
 from pydantic import BaseModel
 from utils.constants import MODEL_ACCESS_TIERS, MODEL_NAME_ALIASES, HARDCODED_MODEL_PRICES
@@ -23,6 +28,22 @@ stripe.api_key = config.STRIPE_SECRET_KEY
 # Token price multiplier
 TOKEN_PRICE_MULTIPLIER = 1.5
 
+# Usage ledger: reconcile against the messages table at least this often
+USAGE_LEDGER_RECONCILE_INTERVAL_SECONDS = 3600 * 6
+USAGE_LEDGER_RECONCILE_ATTEMPTS = 3
+USAGE_RECONCILE_SCHEDULED_KEY = "usage_reconcile_scheduled:{user_id}"
+# Keeps scheduled reconciliation tasks referenced until they finish
+_background_tasks: set = set()
+
+# Subscription cache: Redis entries are fresh for SUBSCRIPTION_CACHE_TTL and kept
+# for SUBSCRIPTION_CACHE_STALE_TTL as a fallback while Stripe is unreachable
+SUBSCRIPTION_CACHE_KEY = "billing_subscription:{user_id}"
+SUBSCRIPTION_CACHE_TTL = 600  # 10 minutes
+SUBSCRIPTION_CACHE_STALE_TTL = 3600 * 24
+SUBSCRIPTION_L1_CACHE_TTL = 30
+SUBSCRIPTION_L1_CACHE_SIZE = 10000
+_subscription_l1_cache: Dict[str, Tuple[float, Optional[Dict]]] = {}
+
 # Initialize router
 router = APIRouter(prefix="/billing", tags=["billing"])
 
@@ -192,82 +213,257 @@ async def create_stripe_customer(client, user_id: str, email: str) -> str:
     return customer.id
 
 async def get_user_subscription(user_id: str) -> Optional[Dict]:
-    """Get the current subscription for a user from Stripe."""
+    """Get the current subscription for a user, cached in process and in Redis.
+
+    Meant for billing checks; endpoints that change or display a subscription
+    use _fetch_user_subscription so they never act on a stale one.
+
+    Cached entries are refreshed from Stripe after SUBSCRIPTION_CACHE_TTL and
+    invalidated by the Stripe webhook on subscription events. If Stripe cannot
+    be reached, the last known subscription is used for up to
+    SUBSCRIPTION_CACHE_STALE_TTL.
+    """
+    now = time.time()
+    cached = _subscription_l1_cache.get(user_id)
+    if cached and now - cached[0] < SUBSCRIPTION_L1_CACHE_TTL:
+        return cached[1]
+
+    stale_entry = None
+    cache_key = SUBSCRIPTION_CACHE_KEY.format(user_id=user_id)
     try:
-        # Get customer ID
-        db = DBConnection()
-        client = await db.client
-        customer_id = await get_stripe_customer_id(client, user_id)
-        
-        if not customer_id:
-            return None
-            
-        # Get all active subscriptions for the customer
-        subscriptions = await stripe.Subscription.list_async(
-            customer=customer_id,
-            status='active'
-        )
-        # print("Found subscriptions:", subscriptions)
-        
-        # Check if we have any subscriptions
-        if not subscriptions or not subscriptions.get('data'):
-            return None
-            
-        # Filter subscriptions to only include our product's subscriptions
-        our_subscriptions = []
-        for sub in subscriptions['data']:
-            # Check if subscription items contain any of our price IDs
-            for item in sub.get('items', {}).get('data', []):
-                price_id = item.get('price', {}).get('id')
-                if price_id in [
-                    config.STRIPE_FREE_TIER_ID,
-                    config.STRIPE_TIER_2_20_ID, config.STRIPE_TIER_6_50_ID, config.STRIPE_TIER_12_100_ID,
-                    config.STRIPE_TIER_25_200_ID, config.STRIPE_TIER_50_400_ID, config.STRIPE_TIER_125_800_ID,
-                    config.STRIPE_TIER_200_1000_ID,
-                    # Yearly tiers
-                    config.STRIPE_TIER_2_20_YEARLY_ID, config.STRIPE_TIER_6_50_YEARLY_ID,
-                    config.STRIPE_TIER_12_100_YEARLY_ID, config.STRIPE_TIER_25_200_YEARLY_ID,
-                    config.STRIPE_TIER_50_400_YEARLY_ID, config.STRIPE_TIER_125_800_YEARLY_ID,
-                    config.STRIPE_TIER_200_1000_YEARLY_ID,
-                    # Yearly commitment tiers (monthly payments with 12-month commitment)
-                    config.STRIPE_TIER_2_17_YEARLY_COMMITMENT_ID,
-                    config.STRIPE_TIER_6_42_YEARLY_COMMITMENT_ID,
-                    config.STRIPE_TIER_25_170_YEARLY_COMMITMENT_ID
-                ]:
-                    our_subscriptions.append(sub)
-        
-        if not our_subscriptions:
-            return None
-            
-        # If there are multiple active subscriptions, we need to handle this
-        if len(our_subscriptions) > 1:
-            logger.warning(f"User {user_id} has multiple active subscriptions: {[sub['id'] for sub in our_subscriptions]}")
-            
-            # Get the most recent subscription
-            most_recent = max(our_subscriptions, key=lambda x: x['created'])
-            
-            # Cancel all other subscriptions
-            for sub in our_subscriptions:
-                if sub['id'] != most_recent['id']:
-                    try:
-                        await stripe.Subscription.modify_async(
-                            sub['id'],
-                            cancel_at_period_end=True
-                        )
-                        logger.info(f"Cancelled subscription {sub['id']} for user {user_id}")
-                    except Exception as e:
-                        logger.error(f"Error cancelling subscription {sub['id']}: {str(e)}")
-            
-            return most_recent
-            
-        return our_subscriptions[0]
-        
+        cached_json = await redis.get(cache_key)
+        if cached_json:
+            stale_entry = json.loads(cached_json)
+            if now - stale_entry['cached_at'] < SUBSCRIPTION_CACHE_TTL:
+                _subscription_l1_cache[user_id] = (now, stale_entry['subscription'])
+                return stale_entry['subscription']
+    except Exception as e:
+        logger.warning(f"Failed to read cached subscription for user {user_id}: {str(e)}")
+
+    try:
+        subscription = await _fetch_user_subscription(user_id)
     except Exception as e:
+        if stale_entry is not None:
+            logger.warning(f"Error getting subscription from Stripe, using cached subscription for user {user_id}: {str(e)}")
+            return stale_entry['subscription']
         logger.error(f"Error getting subscription from Stripe: {str(e)}")
         return None
 
+    # Round-trip through JSON so L1 and Redis hit return the same plain dicts
+    subscription_json = json.dumps({'subscription': subscription, 'cached_at': now}, default=str)
+    subscription = json.loads(subscription_json)['subscription']
+    _subscription_l1_cache[user_id] = (now, subscription)
+    if len(_subscription_l1_cache) > SUBSCRIPTION_L1_CACHE_SIZE:
+        _subscription_l1_cache.pop(next(iter(_subscription_l1_cache)))
+    try:
+        await redis.set(cache_key, subscription_json, ex=SUBSCRIPTION_CACHE_STALE_TTL)
+    except Exception as e:
+        logger.warning(f"Failed to cache subscription for user {user_id}: {str(e)}")
+
+    return subscription
+
+
+async def invalidate_subscription_cache(user_id: str) -> None:
+    """Drop the cached subscription of a user after it changed in Stripe."""
+    _subscription_l1_cache.pop(user_id, None)
+    try:
+        await redis.delete(SUBSCRIPTION_CACHE_KEY.format(user_id=user_id))
+    except Exception as e:
+        logger.warning(f"Failed to invalidate cached subscription for user {user_id}: {str(e)}")
+
+
+async def _fetch_user_subscription(user_id: str) -> Optional[Dict]:
+    """Get the current subscription for a user from Stripe. Raises if Stripe cannot be queried."""
+    # Get customer ID
+    db = DBConnection()
+    client = await db.client
+    customer_id = await get_stripe_customer_id(client, user_id)
+    
+    if not customer_id:
+        return None
+        
+    # Get all active subscriptions for the customer
+    subscriptions = await stripe.Subscription.list_async(
+        customer=customer_id,
+        status='active'
+    )
+    # print("Found subscriptions:", subscriptions)
+    
+    # Check if we have any subscriptions
+    if not subscriptions or not subscriptions.get('data'):
+        return None
+        
+    # Filter subscriptions to only include our product's subscriptions
+    our_subscriptions = []
+    for sub in subscriptions['data']:
+        # Check if subscription items contain any of our price IDs
+        for item in sub.get('items', {}).get('data', []):
+            price_id = item.get('price', {}).get('id')
+            if price_id in [
+                config.STRIPE_FREE_TIER_ID,
+                config.STRIPE_TIER_2_20_ID, config.STRIPE_TIER_6_50_ID, config.STRIPE_TIER_12_100_ID,
+                config.STRIPE_TIER_25_200_ID, config.STRIPE_TIER_50_400_ID, config.STRIPE_TIER_125_800_ID,
+                config.STRIPE_TIER_200_1000_ID,
+                # Yearly tiers
+                config.STRIPE_TIER_2_20_YEARLY_ID, config.STRIPE_TIER_6_50_YEARLY_ID,
+                config.STRIPE_TIER_12_100_YEARLY_ID, config.STRIPE_TIER_25_200_YEARLY_ID,
+                config.STRIPE_TIER_50_400_YEARLY_ID, config.STRIPE_TIER_125_800_YEARLY_ID,
+                config.STRIPE_TIER_200_1000_YEARLY_ID,
+                # Yearly commitment tiers (monthly payments with 12-month commitment)
+                config.STRIPE_TIER_2_17_YEARLY_COMMITMENT_ID,
+                config.STRIPE_TIER_6_42_YEARLY_COMMITMENT_ID,
+                config.STRIPE_TIER_25_170_YEARLY_COMMITMENT_ID
+            ]:
+                our_subscriptions.append(sub)
+    
+    if not our_subscriptions:
+        return None
+        
+    # If there are multiple active subscriptions, we need to handle this
+    if len(our_subscriptions) > 1:
+        logger.warning(f"User {user_id} has multiple active subscriptions: {[sub['id'] for sub in our_subscriptions]}")
+        
+        # Get the most recent subscription
+        most_recent = max(our_subscriptions, key=lambda x: x['created'])
+        
+        # Cancel all other subscriptions
+        for sub in our_subscriptions:
+            if sub['id'] != most_recent['id']:
+                try:
+                    await stripe.Subscription.modify_async(
+                        sub['id'],
+                        cancel_at_period_end=True
+                    )
+                    logger.info(f"Cancelled subscription {sub['id']} for user {user_id}")
+                except Exception as e:
+                    logger.error(f"Error cancelling subscription {sub['id']}: {str(e)}")
+        
+        return most_recent
+        
+    return our_subscriptions[0]
+
+
+def _current_usage_month() -> str:
+    """Key of the current month in the usage ledger (first day of the month, UTC)."""
+    now = datetime.now(timezone.utc)
+    return now.date().replace(day=1).isoformat()
+
+
+def _schedule_usage_reconciliation(user_id: str) -> None:
+    """Queue a background reconciliation of a user's usage ledger, at most once per interval."""
+    async def _schedule():
+        try:
+            if await redis.set(USAGE_RECONCILE_SCHEDULED_KEY.format(user_id=user_id), "1", nx=True, ex=USAGE_LEDGER_RECONCILE_INTERVAL_SECONDS):
+                from run_agent_background import reconcile_usage_ledger
+                reconcile_usage_ledger.send(user_id)
+        except Exception as e:
+            logger.warning(f"Failed to schedule usage ledger reconciliation for user {user_id}: {str(e)}")
+
+    task = asyncio.create_task(_schedule())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
 async def calculate_monthly_usage(client, user_id: str) -> float:
-    """Calculate total agent run minutes for the current month for a user."""
+    """Get the total cost of the current month for a user from the usage ledger.
+
+    Falls back to scanning usage messages (and seeding the ledger) when the
+    ledger has no reconciled row for this month yet.
+    """
+    start_time = time.time()
+    try:
+        ledger_result = await client.table('monthly_usage') \
+            .select('total_cost, reconciled_at') \
+            .eq('account_id', user_id) \
+            .eq('month', _current_usage_month()) \
+            .execute()
+
+        if ledger_result.data and ledger_result.data[0].get('reconciled_at'):
+            ledger = ledger_result.data[0]
+            reconciled_at = datetime.fromisoformat(ledger['reconciled_at'].replace('Z', '+00:00'))
+            if datetime.now(timezone.utc) - reconciled_at > timedelta(seconds=USAGE_LEDGER_RECONCILE_INTERVAL_SECONDS):
+                _schedule_usage_reconciliation(user_id)
+
+            total_cost = float(ledger['total_cost'])
+            logger.info(f"Read monthly usage from ledger in {time.time() - start_time:.3f} seconds, total cost: {total_cost}")
+            return total_cost
+    except Exception as e:
+        logger.warning(f"Failed to read usage ledger for user {user_id}, scanning usage messages instead: {str(e)}")
+
+    return await reconcile_monthly_usage(client, user_id)
+
+
+async def reconcile_monthly_usage(client, user_id: str) -> float:
+    """Recompute the current month's usage ledger of a user from its usage messages.
+
+    The stored total is only replaced if no cost was added to the ledger while
+    scanning; otherwise the scan is retried.
+
+    Returns:
+        The scanned total cost
+    """
+    month = _current_usage_month()
+    total_cost = 0.0
+
+    for attempt in range(USAGE_LEDGER_RECONCILE_ATTEMPTS):
+        try:
+            version_result = await client.table('monthly_usage').select('version').eq('account_id', user_id).eq('month', month).execute()
+            expected_version = version_result.data[0]['version'] if version_result.data else None
+        except Exception as e:
+            logger.warning(f"Failed to read usage ledger version for user {user_id}: {str(e)}")
+            return await _scan_monthly_usage(client, user_id)
+
+        total_cost = await _scan_monthly_usage(client, user_id)
+
+        try:
+            stored = await client.rpc('reconcile_monthly_usage', {
+                'p_account_id': user_id,
+                'p_month': month,
+                'p_total_cost': total_cost,
+                'p_expected_version': expected_version
+            }).execute()
+            if stored.data:
+                logger.debug(f"Reconciled usage ledger for user {user_id}: {total_cost}")
+                return total_cost
+        except Exception as e:
+            logger.warning(f"Failed to store reconciled usage for user {user_id}: {str(e)}")
+            return total_cost
+
+        logger.debug(f"Usage ledger of user {user_id} changed while reconciling (attempt {attempt + 1})")
+
+    logger.warning(f"Could not reconcile usage ledger for user {user_id} after {USAGE_LEDGER_RECONCILE_ATTEMPTS} attempts")
+    return total_cost
+
+
+async def record_monthly_usage(client, thread_id: str, response_end_content: Any) -> None:
+    """Add the cost of an assistant_response_end message to the usage ledger of the thread's account."""
+    try:
+        if isinstance(response_end_content, str):
+            response_end_content = json.loads(response_end_content)
+        if not isinstance(response_end_content, dict):
+            return
+
+        usage = response_end_content.get('usage') or {}
+        cost = calculate_token_cost(
+            usage.get('prompt_tokens', 0),
+            usage.get('completion_tokens', 0),
+            response_end_content.get('model', 'unknown')
+        )
+        if cost <= 0:
+            return
+
+        await client.rpc('increment_monthly_usage', {
+            'p_thread_id': thread_id,
+            'p_month': _current_usage_month(),
+            'p_cost': cost
+        }).execute()
+    except Exception as e:
+        # The ledger is reconciled against the messages table, so a missed increment is recovered later
+        logger.warning(f"Failed to record usage for thread {thread_id}: {str(e)}")
+
+
+async def _scan_monthly_usage(client, user_id: str) -> float:
+    """Calculate the total cost of the current month for a user from its usage messages."""
     start_time = time.time()
     
     # Use get_usage_logs to fetch all usage data (it already handles the date filtering and batching)
@@ -294,7 +490,7 @@ async def calculate_monthly_usage(client, user_id: str) -> float:
     
     end_time = time.time()
     execution_time = end_time - start_time
-    logger.info(f"Calculate monthly usage took {execution_time:.3f} seconds, total cost: {total_cost}")
+    logger.info(f"Scanning monthly usage took {execution_time:.3f} seconds, total cost: {total_cost}")
     
     return total_cost
 
@@ -362,6 +558,7 @@ async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: in
 
     # Process messages into usage log entries
     processed_logs = []
+    usages = []
     
     for message in messages_result.data:
         try:
@@ -377,18 +574,12 @@ async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: in
             # Safely calculate total tokens
             total_tokens = (prompt_tokens or 0) + (completion_tokens or 0)
             
-            # Calculate estimated cost using the same logic as calculate_monthly_usage
-            estimated_cost = calculate_token_cost(
-                prompt_tokens,
-                completion_tokens,
-                model
-            )
-            
             # Safely extract project_id from threads relationship
             project_id = 'unknown'
             if message.get('threads') and isinstance(message['threads'], list) and len(message['threads']) > 0:
                 project_id = message['threads'][0].get('project_id', 'unknown')
             
+            usages.append((prompt_tokens, completion_tokens, model))
             processed_logs.append({
                 'message_id': message.get('message_id', 'unknown'),
                 'thread_id': message.get('thread_id', 'unknown'),
@@ -401,12 +592,16 @@ async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: in
                     'model': model
                 },
                 'total_tokens': total_tokens,
-                'estimated_cost': estimated_cost,
+                'estimated_cost': 0.0,
                 'project_id': project_id
             })
         except Exception as e:
             logger.warning(f"Error processing usage log entry for message {message.get('message_id', 'unknown')}: {str(e)}")
             continue
+
+    # Calculate estimated costs for the whole page, resolving each model's pricing once
+    for log_entry, estimated_cost in zip(processed_logs, calculate_token_costs(usages)):
+        log_entry['estimated_cost'] = estimated_cost
     
     # Check if there are more results
     has_more = len(processed_logs) == items_per_page
@@ -417,71 +612,112 @@ async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: in
     }
 
 
+class _ModelPricing(NamedTuple):
+    """How a model is priced: hardcoded per-million prices, or a model name litellm knows."""
+    input_cost_per_million: Optional[float] = None
+    output_cost_per_million: Optional[float] = None
+    litellm_model: Optional[str] = None
+
+
+@lru_cache(maxsize=1024)
+def _resolve_model_pricing(model: str) -> Optional[_ModelPricing]:
+    """Resolve the pricing of a model string once: aliases, hardcoded prices, then litellm name variants."""
+    # Try to resolve the model name using MODEL_NAME_ALIASES first
+    resolved_model = MODEL_NAME_ALIASES.get(model, model)
+
+    # Check if we have hardcoded pricing for this model (try both original and resolved)
+    hardcoded_pricing = get_model_pricing(model) or get_model_pricing(resolved_model)
+    if hardcoded_pricing:
+        input_cost_per_million, output_cost_per_million = hardcoded_pricing
+        return _ModelPricing(input_cost_per_million, output_cost_per_million)
+
+    # Use litellm pricing as fallback - try multiple variations
+    models_to_try = [model]
+
+    # Add resolved model if different
+    if resolved_model != model:
+        models_to_try.append(resolved_model)
+
+    # Try without provider prefix if it has one
+    if '/' in model:
+        models_to_try.append(model.split('/', 1)[1])
+    if '/' in resolved_model and resolved_model != model:
+        models_to_try.append(resolved_model.split('/', 1)[1])
+
+    # Special handling for Google models accessed via OpenRouter
+    if model.startswith('openrouter/google/'):
+        models_to_try.append(model.replace('openrouter/', ''))
+    if resolved_model.startswith('openrouter/google/'):
+        models_to_try.append(resolved_model.replace('openrouter/', ''))
+
+    # Keep the first model name variation litellm has pricing for
+    for model_name in models_to_try:
+        try:
+            prompt_token_cost, completion_token_cost = cost_per_token(model_name, 1, 1)
+            if prompt_token_cost is not None and completion_token_cost is not None:
+                return _ModelPricing(litellm_model=model_name)
+        except Exception as e:
+            logger.debug(f"Failed to get pricing for model variation {model_name}: {str(e)}")
+            continue
+
+    logger.warning(f"Could not get pricing for model {model} (resolved: {resolved_model}), costs will be 0")
+    return None
+
+
+def _price_tokens(pricing: _ModelPricing, prompt_tokens: int, completion_tokens: int) -> float:
+    """Cost of a response for resolved pricing, including the TOKEN_PRICE_MULTIPLIER."""
+    if pricing.litellm_model is None:
+        input_cost = (prompt_tokens / 1_000_000) * pricing.input_cost_per_million
+        output_cost = (completion_tokens / 1_000_000) * pricing.output_cost_per_million
+        message_cost = input_cost + output_cost
+    else:
+        prompt_token_cost, completion_token_cost = cost_per_token(pricing.litellm_model, prompt_tokens, completion_tokens)
+        message_cost = prompt_token_cost + completion_token_cost
+
+    # Apply the TOKEN_PRICE_MULTIPLIER
+    return message_cost * TOKEN_PRICE_MULTIPLIER
+
+
 def calculate_token_cost(prompt_tokens: int, completion_tokens: int, model: str) -> float:
     """Calculate the cost for tokens using the same logic as the monthly usage calculation."""
-    try:
-        # Ensure tokens are valid integers
-        prompt_tokens = int(prompt_tokens) if prompt_tokens is not None else 0
-        completion_tokens = int(completion_tokens) if completion_tokens is not None else 0
-        
-        # Try to resolve the model name using MODEL_NAME_ALIASES first
-        resolved_model = MODEL_NAME_ALIASES.get(model, model)
-
-        # Check if we have hardcoded pricing for this model (try both original and resolved)
-        hardcoded_pricing = get_model_pricing(model) or get_model_pricing(resolved_model)
-        if hardcoded_pricing:
-            input_cost_per_million, output_cost_per_million = hardcoded_pricing
-            input_cost = (prompt_tokens / 1_000_000) * input_cost_per_million
-            output_cost = (completion_tokens / 1_000_000) * output_cost_per_million
-            message_cost = input_cost + output_cost
-        else:
-            # Use litellm pricing as fallback - try multiple variations
+    return calculate_token_costs([(prompt_tokens, completion_tokens, model)])[0]
+
+
+def calculate_token_costs(usages: List[Tuple[int, int, str]]) -> List[float]:
+    """Calculate the costs of many responses, resolving the pricing of each model only once.
+
+    Args:
+        usages: (prompt_tokens, completion_tokens, model) per response
+
+    Returns:
+        The cost of each response, in the same order (0.0 where it cannot be priced)
+    """
+    costs = [0.0] * len(usages)
+
+    indices_by_model: Dict[str, List[int]] = defaultdict(list)
+    for index, (_, _, model) in enumerate(usages):
+        indices_by_model[model].append(index)
+
+    for model, indices in indices_by_model.items():
+        try:
+            pricing = _resolve_model_pricing(model)
+        except Exception as e:
+            logger.error(f"Error resolving pricing for model {model}: {str(e)}")
+            continue
+        if pricing is None:
+            continue
+
+        for index in indices:
+            prompt_tokens, completion_tokens, _ = usages[index]
             try:
-                models_to_try = [model]
-                
-                # Add resolved model if different
-                if resolved_model != model:
-                    models_to_try.append(resolved_model)
-                
-                # Try without provider prefix if it has one
-                if '/' in model:
-                    models_to_try.append(model.split('/', 1)[1])
-                if '/' in resolved_model and resolved_model != model:
-                    models_to_try.append(resolved_model.split('/', 1)[1])
-                    
-                # Special handling for Google models accessed via OpenRouter
-                if model.startswith('openrouter/google/'):
-                    google_model_name = model.replace('openrouter/', '')
-                    models_to_try.append(google_model_name)
-                if resolved_model.startswith('openrouter/google/'):
-                    google_model_name = resolved_model.replace('openrouter/', '')
-                    models_to_try.append(google_model_name)
-                
-                # Try each model name variation until we find one that works
-                message_cost = None
-                for model_name in models_to_try:
-                    try:
-                        prompt_token_cost, completion_token_cost = cost_per_token(model_name, prompt_tokens, completion_tokens)
-                        if prompt_token_cost is not None and completion_token_cost is not None:
-                            message_cost = prompt_token_cost + completion_token_cost
-                            break
-                    except Exception as e:
-                        logger.debug(f"Failed to get pricing for model variation {model_name}: {str(e)}")
-                        continue
-                
-                if message_cost is None:
-                    logger.warning(f"Could not get pricing for model {model} (resolved: {resolved_model}), returning 0 cost")
-                    return 0.0
-                    
+                # Ensure tokens are valid integers
+                prompt_tokens = int(prompt_tokens) if prompt_tokens is not None else 0
+                completion_tokens = int(completion_tokens) if completion_tokens is not None else 0
+                costs[index] = _price_tokens(pricing, prompt_tokens, completion_tokens)
             except Exception as e:
-                logger.warning(f"Could not get pricing for model {model} (resolved: {resolved_model}): {str(e)}, returning 0 cost")
-                return 0.0
-        
-        # Apply the TOKEN_PRICE_MULTIPLIER
-        return message_cost * TOKEN_PRICE_MULTIPLIER
-    except Exception as e:
-        logger.error(f"Error calculating token cost for model {model}: {str(e)}")
-        return 0.0
+                logger.error(f"Error calculating token cost for model {model}: {str(e)}")
+
+    return costs
 
 async def get_allowed_models_for_user(client, user_id: str):
     """
@@ -533,17 +769,30 @@ async def check_billing_status(client, user_id: str) -> Tuple[bool, str, Optiona
     Returns:
         Tuple[bool, str, Optional[Dict]]: (can_run, message, subscription_info)
     """
+    can_run, message, subscription, _ = await check_billing_budget(client, user_id)
+    return can_run, message, subscription
+
+async def check_billing_budget(client, user_id: str) -> Tuple[bool, str, Optional[Dict], Optional[float]]:
+    """
+    Check if a user can run agents, also returning how much of the monthly budget is left.
+    
+    Returns:
+        Tuple[bool, str, Optional[Dict], Optional[float]]: (can_run, message, subscription_info, remaining_budget),
+        where remaining_budget is in dollars, or None when billing is disabled
+    """
     if config.ENV_MODE == EnvMode.LOCAL:
         logger.info("Running in local development mode - billing checks are disabled")
         return True, "Local development mode - billing disabled", {
             "price_id": "local_dev",
             "plan_name": "Local Development",
             "minutes_limit": "no limit"
-        }
+        }, None
 
-    # Get current subscription
-    subscription = await get_user_subscription(user_id)
-    # print("Current subscription:", subscription)
+    # Get current subscription and current month's usage concurrently
+    subscription, current_usage = await asyncio.gather(
+        get_user_subscription(user_id),
+        calculate_monthly_usage(client, user_id)
+    )
     
     # If no subscription, they can use free tier
     if not subscription:
@@ -565,15 +814,13 @@ async def check_billing_status(client, user_id: str) -> Tuple[bool, str, Optiona
         logger.warning(f"Unknown subscription tier: {price_id}, defaulting to free tier")
         tier_info = SUBSCRIPTION_TIERS[config.STRIPE_FREE_TIER_ID]
     
-    # Calculate current month's usage
-    current_usage = await calculate_monthly_usage(client, user_id)
-    
     # TODO: also do user's AAL check
     # Check if within limits
-    if current_usage >= tier_info['cost']:
-        return False, f"Monthly limit of {tier_info['cost']} dollars reached. Please upgrade your plan or wait until next month.", subscription
+    remaining_budget = tier_info['cost'] - current_usage
+    if remaining_budget <= 0:
+        return False, f"Monthly limit of {tier_info['cost']} dollars reached. Please upgrade your plan or wait until next month.", subscription, 0.0
     
-    return True, "OK", subscription
+    return True, "OK", subscription, remaining_budget
 
 async def check_subscription_commitment(subscription_id: str) -> dict:
     """
@@ -688,8 +935,8 @@ async def create_checkout_session(
         if product_id != config.STRIPE_PRODUCT_ID:
             raise HTTPException(status_code=400, detail="Price ID does not belong to the correct product.")
             
-        # Check for existing subscription for our product
-        existing_subscription = await get_user_subscription(current_user_id)
+        # Check for existing subscription for our product, uncached since it decides what to change
+        existing_subscription = await _fetch_user_subscription(current_user_id)
         # print("Existing subscription for product:", existing_subscription)
         
         if existing_subscription:
@@ -761,6 +1008,7 @@ async def create_checkout_session(
                                 'commitment_type': request.commitment_type or 'monthly'
                             }
                         )
+                        await invalidate_subscription_cache(current_user_id)
                         
                         # Update active status in database
                         await client.schema('basejump').from_('billing_customers').update(
@@ -849,6 +1097,7 @@ async def create_checkout_session(
                         proration_behavior='always_invoice', # Prorate and charge immediately
                         billing_cycle_anchor='now' # Reset billing cycle
                     )
+                    await invalidate_subscription_cache(current_user_id)
                     
                     # Update active status in database to true (customer has active subscription)
                     await client.schema('basejump').from_('billing_customers').update(
@@ -916,6 +1165,7 @@ async def create_checkout_session(
                         proration_behavior='none',  # No proration for downgrades
                         billing_cycle_anchor='unchanged'  # Keep current billing cycle
                     )
+                    await invalidate_subscription_cache(current_user_id)
                     
                     # Update active status in database
                     await client.schema('basejump').from_('billing_customers').update(
@@ -1086,7 +1336,7 @@ async def get_subscription(
     """Get the current subscription status for the current user, including scheduled changes."""
     try:
         # Get subscription from Stripe (this helper already handles filtering/cleanup)
-        subscription = await get_user_subscription(current_user_id)
+        subscription = await _fetch_user_subscription(current_user_id)
         # print("Subscription data for status:", subscription)
         
         # Calculate current usage
@@ -1232,6 +1482,11 @@ async def stripe_webhook(request: Request):
             # Get database connection
             db = DBConnection()
             client = await db.client
+
+            # Drop the cached subscription so billing checks see the change right away
+            customer_result = await client.schema('basejump').from_('billing_customers').select('account_id').eq('id', customer_id).execute()
+            for customer in customer_result.data or []:
+                await invalidate_subscription_cache(customer['account_id'])
             
             if event.type == 'customer.subscription.created':
                 # Update customer active status for new subscriptions
@@ -1576,7 +1831,7 @@ async def cancel_subscription(
     """Cancel subscription with yearly commitment handling."""
     try:
         # Get user's current subscription
-        subscription = await get_user_subscription(current_user_id)
+        subscription = await _fetch_user_subscription(current_user_id)
         if not subscription:
             raise HTTPException(status_code=404, detail="No active subscription found")
         
@@ -1602,6 +1857,7 @@ async def cancel_subscription(
                     'scheduled_cancel_at_commitment_end': 'true'
                 }
             )
+            await invalidate_subscription_cache(current_user_id)
             
             logger.info(f"Subscription {subscription_id} scheduled for cancellation at commitment end: {commitment_end_date}")
             
@@ -1628,6 +1884,7 @@ async def cancel_subscription(
                 'cancellation_date': str(int(datetime.now(timezone.utc).timestamp()))
             }
         )
+        await invalidate_subscription_cache(current_user_id)
 
         logger.info(f"Subscription {subscription_id} marked for cancellation at period end")
         
@@ -1674,7 +1931,7 @@ async def reactivate_subscription(
     """Reactivate a subscription that was marked for cancellation."""
     try:
         # Get user's current subscription
-        subscription = await get_user_subscription(current_user_id)
+        subscription = await _fetch_user_subscription(current_user_id)
         if not subscription:
             raise HTTPException(status_code=404, detail="No subscription found")
         
@@ -1708,6 +1965,7 @@ async def reactivate_subscription(
             subscription_id,
             **modify_params
         )
+        await invalidate_subscription_cache(current_user_id)
         
         logger.info(f"Subscription {subscription_id} reactivated by user")
         
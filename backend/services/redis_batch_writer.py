@@ -0,0 +1,138 @@
+"""
+Coalescing writer for streamed agent responses.
+
+Instead of one RPUSH and one PUBLISH per streamed chunk, responses are queued
+and written by a single background task as one pipelined RPUSH of many values
+followed by one PUBLISH. Batches are flushed every `flush_interval` seconds or
+as soon as `max_batch_size` responses are pending, whichever comes first.
+
+- Ordering: a single task drains the queue, so responses land in the list in
+  the order they were written
+- Back-pressure: the queue is bounded, so `write` waits when Redis falls behind
+  instead of growing memory without limit
+"""
+
+import asyncio
+from typing import List, Optional
+
+from services import redis
+from utils.logger import logger
+
+DEFAULT_FLUSH_INTERVAL = 0.02  # 20ms
+DEFAULT_MAX_BATCH_SIZE = 100
+DEFAULT_MAX_PENDING = 1000
+MAX_WRITE_ATTEMPTS = 3
+
+
+class RedisResponseWriter:
+    """Batches values appended to a Redis list and notifies subscribers once per batch."""
+
+    def __init__(
+        self,
+        list_key: str,
+        channel: str,
+        notification: str = "new",
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ):
+        """Initialize the writer.
+
+        Args:
+            list_key: Redis list the values are appended to
+            channel: Channel notified after each batch
+            notification: Message published on the channel
+            flush_interval: Maximum time in seconds a value waits before being written
+            max_batch_size: Maximum number of values written in one RPUSH
+            max_pending: Maximum number of queued values before `write` blocks
+        """
+        self.list_key = list_key
+        self.channel = channel
+        self.notification = notification
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self._queue: asyncio.Queue[str] = asyncio.Queue(maxsize=max_pending)
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def start(self) -> None:
+        """Start the background flush task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def write(self, value: str) -> None:
+        """Queue a value, waiting if too many values are pending."""
+        if self._closed:
+            raise RuntimeError(f"Writer for {self.list_key} is closed")
+        self.start()
+        await self._queue.put(value)
+
+    async def flush(self) -> None:
+        """Wait until every value queued so far has been written (or dropped after retries)."""
+        if self._task is None:
+            return
+        await self._queue.join()
+
+    async def close(self, timeout: float = 30.0) -> None:
+        """Flush pending values and stop the background task."""
+        self._closed = True
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self.flush(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout flushing pending Redis writes for {self.list_key} ({self._queue.qsize()} pending)")
+        finally:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _collect_batch(self) -> List[str]:
+        """Wait for the next value, then gather more until the batch is full or the interval elapses."""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _write_batch(self, batch: List[str]) -> None:
+        for attempt in range(MAX_WRITE_ATTEMPTS):
+            try:
+                redis_client = await redis.get_client()
+                async with redis_client.pipeline(transaction=False) as pipe:
+                    pipe.rpush(self.list_key, *batch)
+                    pipe.publish(self.channel, self.notification)
+                    await pipe.execute()
+                return
+            except Exception as e:
+                if attempt < MAX_WRITE_ATTEMPTS - 1:
+                    logger.warning(f"Failed to write {len(batch)} responses to {self.list_key} (attempt {attempt + 1}): {e}")
+                    await asyncio.sleep(0.1 * (2 ** attempt))
+                else:
+                    logger.error(f"Dropping {len(batch)} responses for {self.list_key} after {MAX_WRITE_ATTEMPTS} attempts: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect_batch()
+            try:
+                await self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
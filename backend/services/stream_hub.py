@@ -0,0 +1,228 @@
+"""
+Per-process fan-out hub for agent run streams.
+
+Every SSE client used to open two Redis pubsub connections (responses and
+control) and issue its own LRANGE on every notification. The hub instead keeps
+a single pattern subscription on `agent_run:*` for the whole process and wakes
+up local subscribers of the matching run. Clients watching the same run share
+one buffer of stored responses, so each notification costs one LRANGE per run
+rather than one per client.
+
+Subscribers never queue notifications: a wake-up flag is set and the subscriber
+reads everything new from the shared buffer, so a slow client cannot make the
+hub buffer grow beyond the run's own response list.
+"""
+
+import asyncio
+from typing import Dict, List, Optional, Set
+
+from services import redis
+from utils.logger import logger
+
+CHANNEL_PATTERN = "agent_run:*"
+RESPONSE_LIST_KEY = "agent_run:{agent_run_id}:responses"
+CONTROL_SIGNALS = ("STOP", "END_STREAM", "ERROR")
+TERMINAL_STATUSES = ("completed", "failed", "stopped")
+# Status updates are stored as json.dumps({"type": "status", "status": ..., ...})
+STATUS_PREFIX = '{"type": "status", "status": "'
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 30.0
+
+
+def get_terminal_status(stored_response: str) -> Optional[str]:
+    """Return the status of a stored response that ends the run, without parsing the JSON.
+
+    Only the fixed prefix written by the producers of status updates is checked,
+    so regular responses are rejected after comparing a few characters.
+    """
+    if not stored_response.startswith(STATUS_PREFIX):
+        return None
+    start = len(STATUS_PREFIX)
+    end = stored_response.find('"', start)
+    status = stored_response[start:end] if end != -1 else None
+    return status if status in TERMINAL_STATUSES else None
+
+
+class _RunStream:
+    """Shared state of one agent run watched by local subscribers."""
+
+    def __init__(self, agent_run_id: str):
+        self.agent_run_id = agent_run_id
+        self.response_list_key = RESPONSE_LIST_KEY.format(agent_run_id=agent_run_id)
+        self.subscribers: Set["RunSubscription"] = set()
+        self.responses: List[str] = []
+        # Number of "new" notifications received vs. the number already covered by `responses`
+        self.notify_seq = 0
+        self.fetched_seq = -1
+        self._fetch_lock = asyncio.Lock()
+
+    async def refresh(self) -> None:
+        """Read responses appended since the last read, once for all subscribers."""
+        target_seq = self.notify_seq
+        if self.fetched_seq >= target_seq:
+            return
+        async with self._fetch_lock:
+            if self.fetched_seq >= target_seq:
+                return
+            # Take the notification count before reading, so a notification that
+            # arrives during LRANGE triggers another read
+            target_seq = self.notify_seq
+            new_responses = await redis.lrange(self.response_list_key, len(self.responses), -1)
+            if new_responses:
+                self.responses.extend(new_responses)
+            self.fetched_seq = target_seq
+
+    def notify(self, control_signal: Optional[str] = None) -> None:
+        if control_signal is None:
+            self.notify_seq += 1
+        for subscription in self.subscribers:
+            subscription._wake(control_signal)
+
+
+class RunSubscription:
+    """A local subscriber to one agent run."""
+
+    def __init__(self, hub: "StreamHub", run: _RunStream):
+        self._hub = hub
+        self._run = run
+        self._next_index = 0
+        self._event = asyncio.Event()
+        self._control_signal: Optional[str] = None
+
+    @property
+    def agent_run_id(self) -> str:
+        return self._run.agent_run_id
+
+    def _wake(self, control_signal: Optional[str] = None) -> None:
+        if control_signal is not None and self._control_signal is None:
+            self._control_signal = control_signal
+        self._event.set()
+
+    async def wait(self) -> Optional[str]:
+        """Wait for the next notification.
+
+        Returns:
+            The control signal (STOP, END_STREAM, ERROR) if one was received, otherwise None
+        """
+        await self._event.wait()
+        self._event.clear()
+        return self._control_signal
+
+    async def get_new_responses(self) -> List[str]:
+        """Return stored responses (as JSON strings) this subscriber has not seen yet."""
+        await self._run.refresh()
+        new_responses = self._run.responses[self._next_index:]
+        self._next_index += len(new_responses)
+        return new_responses
+
+    def close(self) -> None:
+        self._hub.unsubscribe(self)
+
+
+class StreamHub:
+    """Shares one Redis pattern subscription among all agent run streams of the process."""
+
+    def __init__(self):
+        self._runs: Dict[str, _RunStream] = {}
+        self._listener_task: Optional[asyncio.Task] = None
+        self._start_lock = asyncio.Lock()
+        self._subscribed = asyncio.Event()
+
+    async def subscribe(self, agent_run_id: str) -> RunSubscription:
+        """Subscribe to an agent run. The caller must close the subscription when done."""
+        await self._ensure_started()
+        run = self._runs.get(agent_run_id)
+        if run is None:
+            run = _RunStream(agent_run_id)
+            self._runs[agent_run_id] = run
+        subscription = RunSubscription(self, run)
+        run.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: RunSubscription) -> None:
+        run = self._runs.get(subscription.agent_run_id)
+        if run is None:
+            return
+        run.subscribers.discard(subscription)
+        if not run.subscribers:
+            self._runs.pop(subscription.agent_run_id, None)
+
+    async def close(self) -> None:
+        """Stop the listener. Open subscriptions are told to end with an ERROR signal."""
+        if self._listener_task:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+        self._subscribed.clear()
+        for run in list(self._runs.values()):
+            run.notify("ERROR")
+
+    async def _ensure_started(self) -> None:
+        if self._listener_task is None or self._listener_task.done():
+            async with self._start_lock:
+                if self._listener_task is None or self._listener_task.done():
+                    self._subscribed.clear()
+                    self._listener_task = asyncio.create_task(self._listen())
+        await self._subscribed.wait()
+
+    def _dispatch(self, channel: str, data: str) -> None:
+        # Channels: agent_run:{id}:new_response and agent_run:{id}:control
+        # (instance-specific control channels have a fourth part and are ignored)
+        parts = channel.split(":")
+        if len(parts) != 3:
+            return
+        run = self._runs.get(parts[1])
+        if run is None:
+            return
+        if parts[2] == "new_response" and data == "new":
+            run.notify()
+        elif parts[2] == "control" and data in CONTROL_SIGNALS:
+            logger.info(f"Received control signal '{data}' for {run.agent_run_id}")
+            run.notify(data)
+
+    async def _listen(self) -> None:
+        delay = RECONNECT_DELAY
+        while True:
+            pubsub = None
+            try:
+                pubsub = await redis.create_pubsub()
+                await pubsub.psubscribe(CHANNEL_PATTERN)
+                logger.debug(f"Stream hub subscribed to {CHANNEL_PATTERN}")
+                if self._subscribed.is_set():
+                    # Reconnected: notifications may have been missed, let every run catch up
+                    for run in list(self._runs.values()):
+                        run.notify()
+                self._subscribed.set()
+                delay = RECONNECT_DELAY
+
+                async for message in pubsub.listen():
+                    if not message or message.get("type") != "pmessage":
+                        continue
+                    channel = message.get("channel")
+                    data = message.get("data")
+                    if isinstance(channel, bytes): channel = channel.decode('utf-8')
+                    if isinstance(data, bytes): data = data.decode('utf-8')
+                    self._dispatch(channel, data)
+
+                logger.warning("Stream hub listener ended, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Stream hub listener failed, reconnecting in {delay:.0f}s: {e}")
+                # Let streams waiting on the first subscription proceed; they will catch up on reconnect
+                self._subscribed.set()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            finally:
+                if pubsub:
+                    try:
+                        await pubsub.punsubscribe(CHANNEL_PATTERN)
+                        await pubsub.close()
+                    except Exception as e:
+                        logger.debug(f"Error closing stream hub pubsub: {e}")
+
+
+stream_hub = StreamHub()
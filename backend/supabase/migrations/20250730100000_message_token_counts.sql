@@ -0,0 +1,10 @@
+BEGIN;
+
+-- Token counts computed once when a message is written, keyed by tokenizer
+-- family (see agentpress.context_manager.get_token_model_family), so context
+-- budgeting does not need to re-tokenize the thread on every turn.
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS token_counts JSONB NOT NULL DEFAULT '{}'::jsonb;
+
+COMMENT ON COLUMN messages.token_counts IS 'Token count of the LLM message per tokenizer family, e.g. {"tiktoken": 1234}';
+
+COMMIT;
@@ -0,0 +1,101 @@
+BEGIN;
+
+-- =====================================================
+-- MONTHLY USAGE LEDGER
+-- =====================================================
+-- Running per-account, per-month LLM cost, incremented whenever an
+-- assistant_response_end message is written, so billing checks no longer
+-- need to scan every usage message of the month.
+--
+-- Rows created by an increment have reconciled_at = NULL and are
+-- reconciled against the messages table (see services.billing) before
+-- being trusted. Every increment bumps `version`, which reconciliation
+-- uses as a compare-and-set guard so concurrent increments are not lost.
+
+CREATE TABLE IF NOT EXISTS monthly_usage (
+    account_id UUID NOT NULL REFERENCES basejump.accounts(id) ON DELETE CASCADE,
+    month DATE NOT NULL,
+    total_cost NUMERIC(14, 6) NOT NULL DEFAULT 0,
+    version BIGINT NOT NULL DEFAULT 0,
+    reconciled_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (account_id, month)
+);
+
+CREATE INDEX IF NOT EXISTS idx_monthly_usage_month_reconciled_at ON monthly_usage(month, reconciled_at);
+
+ALTER TABLE monthly_usage ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their own monthly usage" ON monthly_usage
+    FOR SELECT USING (
+        account_id IN (
+            SELECT wu.account_id
+            FROM basejump.account_user wu
+            WHERE wu.user_id = auth.uid()
+        )
+    );
+
+GRANT SELECT ON monthly_usage TO authenticated;
+GRANT SELECT, INSERT, UPDATE, DELETE ON monthly_usage TO service_role;
+
+-- Add the cost of one response to the ledger of the thread's account
+CREATE OR REPLACE FUNCTION increment_monthly_usage(
+    p_thread_id UUID,
+    p_month DATE,
+    p_cost NUMERIC
+)
+RETURNS VOID
+SECURITY DEFINER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO monthly_usage (account_id, month, total_cost, version, updated_at)
+    SELECT t.account_id, p_month, p_cost, 1, NOW()
+    FROM threads t
+    WHERE t.thread_id = p_thread_id
+    ON CONFLICT (account_id, month) DO UPDATE
+    SET total_cost = monthly_usage.total_cost + EXCLUDED.total_cost,
+        version = monthly_usage.version + 1,
+        updated_at = NOW();
+END;
+$$;
+
+-- Replace the ledger total with a total recomputed from the messages table,
+-- unless an increment happened since `p_expected_version` was read
+-- (NULL = the row did not exist yet). Returns whether the total was stored.
+CREATE OR REPLACE FUNCTION reconcile_monthly_usage(
+    p_account_id UUID,
+    p_month DATE,
+    p_total_cost NUMERIC,
+    p_expected_version BIGINT DEFAULT NULL
+)
+RETURNS BOOLEAN
+SECURITY DEFINER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    rows_affected INTEGER;
+BEGIN
+    IF p_expected_version IS NULL THEN
+        INSERT INTO monthly_usage (account_id, month, total_cost, version, reconciled_at, updated_at)
+        VALUES (p_account_id, p_month, p_total_cost, 0, NOW(), NOW())
+        ON CONFLICT (account_id, month) DO NOTHING;
+    ELSE
+        UPDATE monthly_usage
+        SET total_cost = p_total_cost,
+            reconciled_at = NOW(),
+            updated_at = NOW()
+        WHERE account_id = p_account_id
+          AND month = p_month
+          AND version = p_expected_version;
+    END IF;
+
+    GET DIAGNOSTICS rows_affected = ROW_COUNT;
+    RETURN rows_affected > 0;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION increment_monthly_usage(UUID, DATE, NUMERIC) TO service_role;
+GRANT EXECUTE ON FUNCTION reconcile_monthly_usage(UUID, DATE, NUMERIC, BIGINT) TO service_role;
+
+COMMIT;
@@ -0,0 +1,18 @@
+BEGIN;
+
+-- =====================================================
+-- PERSISTENT TRIGGER WORKSPACES
+-- =====================================================
+-- Triggers configured with `workspace_mode: "persistent"` run every fire in
+-- one long-lived project (and its sandbox) instead of provisioning a new
+-- project and sandbox per fire. The project is created on the first fire and
+-- remembered here; deleting the project makes the next fire create a new one.
+
+ALTER TABLE agent_triggers
+    ADD COLUMN IF NOT EXISTS workspace_project_id UUID REFERENCES projects(project_id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS idx_agent_triggers_workspace_project_id
+    ON agent_triggers(workspace_project_id)
+    WHERE workspace_project_id IS NOT NULL;
+
+COMMIT;
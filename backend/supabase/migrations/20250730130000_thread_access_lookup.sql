@@ -0,0 +1,42 @@
+BEGIN;
+
+-- =====================================================
+-- THREAD ACCESS LOOKUP
+-- =====================================================
+-- Everything verify_thread_access needs in one round-trip: the thread's
+-- project and account, whether the project is public, and whether the user
+-- is a member of the thread's account. Returns no row if the thread does
+-- not exist.
+
+CREATE OR REPLACE FUNCTION get_thread_access(
+    p_thread_id UUID,
+    p_user_id UUID
+)
+RETURNS TABLE (
+    project_id UUID,
+    account_id UUID,
+    is_public BOOLEAN,
+    is_member BOOLEAN
+)
+SECURITY DEFINER
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        t.project_id,
+        t.account_id,
+        COALESCE(p.is_public, FALSE) AS is_public,
+        EXISTS (
+            SELECT 1
+            FROM basejump.account_user au
+            WHERE au.account_id = t.account_id
+              AND au.user_id = p_user_id
+        ) AS is_member
+    FROM threads t
+    LEFT JOIN projects p ON p.project_id = t.project_id
+    WHERE t.thread_id = p_thread_id;
+$$;
+
+GRANT EXECUTE ON FUNCTION get_thread_access(UUID, UUID) TO service_role;
+
+COMMIT;
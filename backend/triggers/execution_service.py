@@ -1,16 +1,29 @@
+import asyncio
 import json
 import uuid
-from datetime import datetime, timezone
-from typing import Dict, Any, Tuple
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, Tuple
 
 from services.supabase import DBConnection
 from services import redis
 from utils.logger import logger, structlog
 from utils.config import config
 from run_agent_background import run_agent_background
-from .trigger_service import TriggerEvent, TriggerResult
+from .trigger_service import (
+    TriggerEvent, TriggerResult, TriggerWorkspace,
+    WORKSPACE_MODE_PERSISTENT, DEFAULT_WORKSPACE_OVERLAP
+)
 from .utils import format_workflow_for_llm
 
+# Held while a fire of a persistent-workspace trigger provisions or reads its workspace, so
+# overlapping fires never provision two workspaces. With the "skip" overlap policy it is held
+# through the whole session setup, so overlapping fires cannot both pass the overlap check
+WORKSPACE_LOCK_KEY = "trigger_workspace_lock:{trigger_id}"
+WORKSPACE_LOCK_TTL = 300
+WORKSPACE_LOCK_WAIT = 30
+# Runs still marked as running after this long are assumed to be stuck and do not block new fires
+WORKSPACE_ACTIVE_RUN_MAX_AGE = timedelta(hours=6)
+
 
 class ExecutionService:
 
@@ -29,20 +42,26 @@ class ExecutionService:
         try:
             logger.info(f"Executing trigger for agent {agent_id}: workflow={trigger_result.should_execute_workflow}, agent={trigger_result.should_execute_agent}")
             
-            if trigger_result.should_execute_workflow:
-                return await self._workflow_executor.execute_workflow(
-                    agent_id=agent_id,
-                    workflow_id=trigger_result.workflow_id,
-                    workflow_input=trigger_result.workflow_input or {},
-                    trigger_result=trigger_result,
-                    trigger_event=trigger_event
-                )
-            else:
-                return await self._agent_executor.execute_agent(
-                    agent_id=agent_id,
-                    trigger_result=trigger_result,
-                    trigger_event=trigger_event
-                )
+            workspace = await self._session_manager.get_trigger_workspace(trigger_event.trigger_id)
+            if not workspace:
+                return await self._execute(agent_id, trigger_result, trigger_event)
+            
+            if workspace.overlap_policy == "allow":
+                # Only the workspace provisioning is serialized, see SessionManager._get_or_create_workspace_project
+                return await self._execute(agent_id, trigger_result, trigger_event, workspace)
+            
+            lock_token = await self._session_manager.acquire_workspace_lock(workspace.trigger_id, wait=False)
+            if not lock_token:
+                return self._skipped_result(workspace, "Another execution of this trigger is starting")
+            
+            try:
+                if workspace.project_id:
+                    if await self._session_manager.has_active_run(workspace.project_id):
+                        return self._skipped_result(workspace, "A previous execution is still running in the trigger workspace")
+                
+                return await self._execute(agent_id, trigger_result, trigger_event, workspace)
+            finally:
+                await self._session_manager.release_workspace_lock(workspace.trigger_id, lock_token)
                 
         except Exception as e:
             logger.error(f"Failed to execute trigger result: {e}")
@@ -51,34 +70,116 @@ class ExecutionService:
                 "error": str(e),
                 "message": "Failed to execute trigger"
             }
+    
+    async def _execute(
+        self,
+        agent_id: str,
+        trigger_result: TriggerResult,
+        trigger_event: TriggerEvent,
+        workspace: Optional[TriggerWorkspace] = None
+    ) -> Dict[str, Any]:
+        if trigger_result.should_execute_workflow:
+            return await self._workflow_executor.execute_workflow(
+                agent_id=agent_id,
+                workflow_id=trigger_result.workflow_id,
+                workflow_input=trigger_result.workflow_input or {},
+                trigger_result=trigger_result,
+                trigger_event=trigger_event,
+                workspace=workspace
+            )
+        else:
+            return await self._agent_executor.execute_agent(
+                agent_id=agent_id,
+                trigger_result=trigger_result,
+                trigger_event=trigger_event,
+                workspace=workspace
+            )
+    
+    def _skipped_result(self, workspace: TriggerWorkspace, reason: str) -> Dict[str, Any]:
+        logger.info(f"Skipping execution of trigger {workspace.trigger_id}: {reason}")
+        return {
+            "success": True,
+            "skipped": True,
+            "project_id": workspace.project_id,
+            "message": f"Execution skipped: {reason}"
+        }
 
 
 class SessionManager:
     def __init__(self, db_connection: DBConnection):
         self._db = db_connection
     
+    async def get_trigger_workspace(self, trigger_id: str) -> Optional[TriggerWorkspace]:
+        """Return the persistent workspace settings of a trigger, or None if it runs in a fresh project per fire."""
+        if trigger_id.startswith("manual_"):
+            return None
+        
+        client = await self._db.client
+        result = await client.table('agent_triggers').select('config, workspace_project_id').eq('trigger_id', trigger_id).execute()
+        if not result.data:
+            return None
+        
+        trigger_config = result.data[0].get('config') or {}
+        if trigger_config.get('workspace_mode') != WORKSPACE_MODE_PERSISTENT:
+            return None
+        
+        return TriggerWorkspace(
+            trigger_id=trigger_id,
+            overlap_policy=trigger_config.get('workspace_overlap', DEFAULT_WORKSPACE_OVERLAP),
+            project_id=result.data[0].get('workspace_project_id')
+        )
+    
+    async def acquire_workspace_lock(self, trigger_id: str, wait: bool) -> Optional[str]:
+        lock_key = WORKSPACE_LOCK_KEY.format(trigger_id=trigger_id)
+        lock_token = str(uuid.uuid4())
+        deadline = asyncio.get_running_loop().time() + (WORKSPACE_LOCK_WAIT if wait else 0)
+        
+        while True:
+            if await redis.set(lock_key, lock_token, nx=True, ex=WORKSPACE_LOCK_TTL):
+                return lock_token
+            if asyncio.get_running_loop().time() >= deadline:
+                return None
+            await asyncio.sleep(0.5)
+    
+    async def release_workspace_lock(self, trigger_id: str, lock_token: str) -> None:
+        lock_key = WORKSPACE_LOCK_KEY.format(trigger_id=trigger_id)
+        try:
+            if await redis.get(lock_key) == lock_token:
+                await redis.delete(lock_key)
+        except Exception as e:
+            logger.warning(f"Failed to release workspace lock for trigger {trigger_id}: {e}")
+    
+    async def has_active_run(self, project_id: str) -> bool:
+        client = await self._db.client
+        result = await client.table('agent_runs') \
+            .select('id, threads!inner(project_id)') \
+            .eq('threads.project_id', project_id) \
+            .eq('status', 'running') \
+            .gte('started_at', (datetime.now(timezone.utc) - WORKSPACE_ACTIVE_RUN_MAX_AGE).isoformat()) \
+            .limit(1) \
+            .execute()
+        return bool(result.data)
+    
     async def create_agent_session(
         self,
         agent_id: str,
         agent_config: Dict[str, Any],
-        trigger_event: TriggerEvent
+        trigger_event: TriggerEvent,
+        workspace: Optional[TriggerWorkspace] = None
     ) -> Tuple[str, str]:
         client = await self._db.client
         
-        project_id = str(uuid.uuid4())
         thread_id = str(uuid.uuid4())
         account_id = agent_config.get('account_id')
         
-        placeholder_name = f"Trigger: {agent_config.get('name', 'Agent')} - {trigger_event.trigger_id[:8]}"
-        
-        await client.table('projects').insert({
-            "project_id": project_id,
-            "account_id": account_id,
-            "name": placeholder_name,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }).execute()
-        
-        await self._create_sandbox_for_project(project_id)
+        if workspace:
+            project_id = await self._get_or_create_workspace_project(
+                workspace, account_id, f"Trigger workspace: {agent_config.get('name', 'Agent')} - {trigger_event.trigger_id[:8]}"
+            )
+        else:
+            project_id = await self._create_project(
+                account_id, f"Trigger: {agent_config.get('name', 'Agent')} - {trigger_event.trigger_id[:8]}"
+            )
         
         await client.table('threads').insert({
             "thread_id": thread_id,
@@ -94,21 +195,19 @@ class SessionManager:
         self,
         account_id: str,
         workflow_id: str,
-        workflow_name: str
+        workflow_name: str,
+        workspace: Optional[TriggerWorkspace] = None
     ) -> Tuple[str, str]:
         client = await self._db.client
         
-        project_id = str(uuid.uuid4())
         thread_id = str(uuid.uuid4())
         
-        await client.table('projects').insert({
-            "project_id": project_id,
-            "account_id": account_id,
-            "name": f"Workflow: {workflow_name}",
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }).execute()
-        
-        await self._create_sandbox_for_project(project_id)
+        if workspace:
+            project_id = await self._get_or_create_workspace_project(
+                workspace, account_id, f"Workflow workspace: {workflow_name}"
+            )
+        else:
+            project_id = await self._create_project(account_id, f"Workflow: {workflow_name}")
         
         await client.table('threads').insert({
             "thread_id": thread_id,
@@ -125,6 +224,75 @@ class SessionManager:
         logger.info(f"Created workflow session: project={project_id}, thread={thread_id}")
         return thread_id, project_id
     
+    async def _create_project(self, account_id: str, name: str) -> str:
+        client = await self._db.client
+        
+        project_id = str(uuid.uuid4())
+        
+        await client.table('projects').insert({
+            "project_id": project_id,
+            "account_id": account_id,
+            "name": name,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }).execute()
+        
+        await self._create_sandbox_for_project(project_id)
+        return project_id
+    
+    async def _get_or_create_workspace_project(
+        self,
+        workspace: TriggerWorkspace,
+        account_id: str,
+        name: str
+    ) -> str:
+        """Reuse the trigger's workspace project if it still has a sandbox, otherwise provision a new one.
+
+        The sandbox is not started here: the agent worker wakes it up before the run.
+        """
+        if workspace.overlap_policy != "allow":
+            # The caller already holds the workspace lock for the whole session setup
+            return await self._provision_workspace_project(workspace, account_id, name)
+        
+        lock_token = await self.acquire_workspace_lock(workspace.trigger_id, wait=True)
+        while not lock_token:
+            # Overlapping fires are allowed, so wait for the fire that is provisioning the workspace
+            logger.info(f"Still waiting for the workspace lock of trigger {workspace.trigger_id}")
+            lock_token = await self.acquire_workspace_lock(workspace.trigger_id, wait=True)
+        
+        try:
+            # A fire that held the lock before may have provisioned the workspace meanwhile
+            current = await self.get_trigger_workspace(workspace.trigger_id)
+            if current and current.project_id:
+                workspace.project_id = current.project_id
+            return await self._provision_workspace_project(workspace, account_id, name)
+        finally:
+            await self.release_workspace_lock(workspace.trigger_id, lock_token)
+    
+    async def _provision_workspace_project(
+        self,
+        workspace: TriggerWorkspace,
+        account_id: str,
+        name: str
+    ) -> str:
+        client = await self._db.client
+        
+        if workspace.project_id:
+            project_result = await client.table('projects').select('project_id, sandbox').eq('project_id', workspace.project_id).execute()
+            if project_result.data and (project_result.data[0].get('sandbox') or {}).get('id'):
+                logger.info(f"Reusing workspace project {workspace.project_id} for trigger {workspace.trigger_id}")
+                return workspace.project_id
+            logger.warning(f"Workspace project {workspace.project_id} of trigger {workspace.trigger_id} is gone or has no sandbox, creating a new one")
+        
+        project_id = await self._create_project(account_id, name)
+        
+        await client.table('agent_triggers').update({
+            'workspace_project_id': project_id
+        }).eq('trigger_id', workspace.trigger_id).execute()
+        
+        workspace.project_id = project_id
+        logger.info(f"Created workspace project {project_id} for trigger {workspace.trigger_id}")
+        return project_id
+    
     async def _create_sandbox_for_project(self, project_id: str) -> None:
         client = await self._db.client
         
@@ -181,7 +349,8 @@ class AgentExecutor:
         self,
         agent_id: str,
         trigger_result: TriggerResult,
-        trigger_event: TriggerEvent
+        trigger_event: TriggerEvent,
+        workspace: Optional[TriggerWorkspace] = None
     ) -> Dict[str, Any]:
         try:
             agent_config = await self._get_agent_config(agent_id)
@@ -189,7 +358,7 @@ class AgentExecutor:
                 raise ValueError(f"Agent {agent_id} not found")
             
             thread_id, project_id = await self._session_manager.create_agent_session(
-                agent_id, agent_config, trigger_event
+                agent_id, agent_config, trigger_event, workspace
             )
             
             await self._create_initial_message(
@@ -344,7 +513,8 @@ class WorkflowExecutor:
         workflow_id: str,
         workflow_input: Dict[str, Any],
         trigger_result: TriggerResult,
-        trigger_event: TriggerEvent
+        trigger_event: TriggerEvent,
+        workspace: Optional[TriggerWorkspace] = None
     ) -> Dict[str, Any]:
         try:
             workflow_config, steps_json = await self._get_workflow_data(workflow_id, agent_id)
@@ -355,7 +525,7 @@ class WorkflowExecutor:
             )
             
             thread_id, project_id = await self._session_manager.create_workflow_session(
-                account_id, workflow_id, workflow_config['name']
+                account_id, workflow_id, workflow_config['name'], workspace
             )
             
             await self._validate_workflow_execution(account_id)
@@ -12,7 +12,10 @@ from qstash.client import QStash
 from services.supabase import DBConnection
 from utils.logger import logger
 from utils.config import config, EnvMode
-from .trigger_service import Trigger, TriggerEvent, TriggerResult, TriggerType
+from .trigger_service import (
+    Trigger, TriggerEvent, TriggerResult, TriggerType,
+    WORKSPACE_MODE_PERSISTENT, WORKSPACE_OVERLAP_POLICIES, DEFAULT_WORKSPACE_OVERLAP
+)
 
 
 class TriggerProvider(ABC):
@@ -353,7 +356,18 @@ class ProviderService:
         if not provider:
             raise ValueError(f"Unknown provider: {provider_id}")
         
-        return await provider.validate_config(config)
+        config = await provider.validate_config(config)
+        self._validate_workspace_config(config)
+        return config
+    
+    def _validate_workspace_config(self, config: Dict[str, Any]) -> None:
+        workspace_mode = config.get('workspace_mode')
+        if workspace_mode is not None and workspace_mode != WORKSPACE_MODE_PERSISTENT:
+            raise ValueError(f"workspace_mode must be '{WORKSPACE_MODE_PERSISTENT}' when set")
+        
+        workspace_overlap = config.get('workspace_overlap', DEFAULT_WORKSPACE_OVERLAP)
+        if workspace_overlap not in WORKSPACE_OVERLAP_POLICIES:
+            raise ValueError(f"workspace_overlap must be one of: {', '.join(WORKSPACE_OVERLAP_POLICIES)}")
     
     async def get_provider_trigger_type(self, provider_id: str) -> TriggerType:
         provider = self._providers.get(provider_id)
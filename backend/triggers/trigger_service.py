@@ -35,6 +35,22 @@ class TriggerResult:
     error_message: Optional[str] = None
 
 
+# Opt-in trigger config keys: with `workspace_mode: "persistent"` every fire of
+# the trigger starts a new thread in one long-lived project and sandbox instead
+# of provisioning a new one. `workspace_overlap` decides what happens when the
+# trigger fires while a previous run is still active in the workspace.
+WORKSPACE_MODE_PERSISTENT = "persistent"
+WORKSPACE_OVERLAP_POLICIES = ("skip", "allow")
+DEFAULT_WORKSPACE_OVERLAP = "skip"
+
+
+@dataclass
+class TriggerWorkspace:
+    trigger_id: str
+    overlap_policy: str = DEFAULT_WORKSPACE_OVERLAP
+    project_id: Optional[str] = None
+
+
 @dataclass
 class Trigger:
     trigger_id: str
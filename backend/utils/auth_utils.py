@@ -8,6 +8,7 @@ from utils.config import config
 import os
 from services.supabase import DBConnection
 from services import redis
+from services.auth_cache import account_user_cache, cache_thread_access, has_cached_thread_access
 
 async def _get_user_id_from_account_cached(account_id: str) -> Optional[str]:
     """
@@ -21,12 +22,18 @@ async def _get_user_id_from_account_cached(account_id: str) -> Optional[str]:
     """
     cache_key = f"account_user:{account_id}"
     
+    local_user_id = account_user_cache.get(cache_key)
+    if local_user_id:
+        return local_user_id
+    
     try:
         # Check Redis cache first
         redis_client = await redis.get_client()
         cached_user_id = await redis_client.get(cache_key)
         if cached_user_id:
-            return cached_user_id.decode('utf-8') if isinstance(cached_user_id, bytes) else cached_user_id
+            user_id = cached_user_id.decode('utf-8') if isinstance(cached_user_id, bytes) else cached_user_id
+            account_user_cache.set(cache_key, user_id)
+            return user_id
     except Exception as e:
         structlog.get_logger().warning(f"Redis cache lookup failed for account {account_id}: {e}")
     
@@ -42,6 +49,7 @@ async def _get_user_id_from_account_cached(account_id: str) -> Optional[str]:
         
         if user_result.data:
             user_id = user_result.data[0]['primary_owner_user_id']
+            account_user_cache.set(cache_key, user_id)
             
             # Cache the result for 5 minutes
             try:
@@ -293,6 +301,10 @@ async def verify_thread_access(client, thread_id: str, user_id: str):
     """
     Verify that a user has access to a specific thread based on account membership.
     
+    Access granted recently is served from an in-process cache; otherwise the
+    thread, its project's visibility and the user's membership are read in one
+    lookup.
+    
     Args:
         client: The Supabase client
         thread_id: The thread ID to check access for
@@ -305,28 +317,23 @@ async def verify_thread_access(client, thread_id: str, user_id: str):
         HTTPException: If the user doesn't have access to the thread
     """
     try:
-        # Query the thread to get account information
-        thread_result = await client.table('threads').select('*,project_id').eq('thread_id', thread_id).execute()
-
-        if not thread_result.data or len(thread_result.data) == 0:
-            raise HTTPException(status_code=404, detail="Thread not found")
+        if has_cached_thread_access(user_id, thread_id):
+            return True
         
-        thread_data = thread_result.data[0]
-        
-        # Check if project is public
-        project_id = thread_data.get('project_id')
-        if project_id:
-            project_result = await client.table('projects').select('is_public').eq('project_id', project_id).execute()
-            if project_result.data and len(project_result.data) > 0:
-                if project_result.data[0].get('is_public'):
-                    return True
-            
-        account_id = thread_data.get('account_id')
         # When using service role, we need to manually check account membership instead of using current_user_account_role
-        if account_id:
-            account_user_result = await client.schema('basejump').from_('account_user').select('account_role').eq('user_id', user_id).eq('account_id', account_id).execute()
-            if account_user_result.data and len(account_user_result.data) > 0:
-                return True
+        access_result = await client.rpc('get_thread_access', {
+            'p_thread_id': thread_id,
+            'p_user_id': user_id
+        }).execute()
+        
+        if not access_result.data:
+            raise HTTPException(status_code=404, detail="Thread not found")
+        
+        access = access_result.data[0]
+        is_member = bool(access.get('account_id') and access.get('is_member'))
+        if is_member or access.get('is_public'):
+            cache_thread_access(user_id, thread_id, via_public_project=not is_member)
+            return True
         raise HTTPException(status_code=403, detail="Not authorized to access this thread")
     except HTTPException:
         # Re-raise HTTP exceptions as they are
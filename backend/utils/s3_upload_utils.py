@@ -25,7 +25,23 @@ async def upload_base64_image(base64_data: str, bucket_name: str = "browser-scre
         
         # Decode base64 data
         image_data = base64.b64decode(base64_data)
+    except Exception as e:
+        logger.error(f"Error uploading base64 image: {e}")
+        raise RuntimeError(f"Failed to upload image: {str(e)}")
+    
+    return await upload_image_bytes(image_data, bucket_name)
+
+async def upload_image_bytes(image_data: bytes, bucket_name: str = "browser-screenshots") -> str:
+    """Upload raw image data to Supabase storage and return the URL.
+    
+    Args:
+        image_data (bytes): The image data
+        bucket_name (str): Name of the storage bucket to upload to
         
+    Returns:
+        str: Public URL of the uploaded image
+    """
+    try:
         # Generate unique filename
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         unique_id = str(uuid.uuid4())[:8]
@@ -47,5 +63,5 @@ async def upload_base64_image(base64_data: str, bucket_name: str = "browser-scre
         return public_url
         
     except Exception as e:
-        logger.error(f"Error uploading base64 image: {e}")
+        logger.error(f"Error uploading image: {e}")
         raise RuntimeError(f"Failed to upload image: {str(e)}") 
\ No newline at end of file